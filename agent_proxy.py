@@ -0,0 +1,140 @@
+"""
+Reverse proxy for the /agent route of Max Electric Payment Demo
+
+Requests are forwarded to the SignalWire agent service over a persistent
+keep-alive connection pool. Request and response bodies are streamed through
+without being buffered, and every hop's upstream latency is recorded.
+
+urllib3 is only imported when the first /agent request creates the pool, so
+processes that never proxy (and every worker's startup) skip loading it.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from config.production import Config
+from metrics import registry
+
+# Headers that only make sense for a single connection
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade', 'host',
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class AgentUnavailable(Exception):
+    """Raised when the agent service cannot be reached or does not answer"""
+
+
+class LatencyRecorder:
+    """Keeps the most recent upstream latencies for percentile reporting"""
+
+    def __init__(self, size=4096):
+        self._samples = deque(maxlen=size)
+        self.count = 0
+        self.errors = 0
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, pct):
+        samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def stats(self):
+        return {
+            'requests': self.count,
+            'errors': self.errors,
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+        }
+
+
+class AgentProxy:
+    """Streaming reverse proxy with a keep-alive upstream pool"""
+
+    def __init__(self, upstream=None, connect_timeout=None, read_timeout=None, pool_size=None):
+        self.upstream = (upstream or Config.AGENT_UPSTREAM_URL).rstrip('/')
+        self.connect_timeout = connect_timeout or Config.AGENT_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or Config.AGENT_READ_TIMEOUT
+        self.pool_size = pool_size or Config.AGENT_POOL_SIZE
+        self.latency = LatencyRecorder()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+
+    def _connection_pool(self):
+        """Return this process's upstream pool, creating it after startup or fork"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    import urllib3
+
+                    self._pool = urllib3.connection_from_url(
+                        self.upstream,
+                        maxsize=self.pool_size,
+                        block=False,
+                        timeout=urllib3.Timeout(connect=self.connect_timeout, read=self.read_timeout),
+                        retries=False,
+                    )
+                    self._pid = os.getpid()
+        return self._pool
+
+    def forward(self, method, path, headers, body=None, query_string=b'', chunked=False):
+        """Send a request upstream and return (status, headers, body iterator)
+
+        Raises AgentUnavailable when the upstream request fails.
+        """
+        from urllib3.exceptions import HTTPError
+
+        url = f"{self.upstream}{path}"
+        if query_string:
+            url = f"{url}?{query_string.decode('latin-1')}"
+
+        forward_headers = {name: value for name, value in headers if name.lower() not in HOP_BY_HOP_HEADERS}
+
+        start = time.perf_counter()
+        try:
+            resp = self._connection_pool().urlopen(
+                method,
+                url,
+                body=body,
+                headers=forward_headers,
+                chunked=chunked,
+                redirect=False,
+                preload_content=False,
+                decode_content=False,
+            )
+        except HTTPError as e:
+            self.latency.errors += 1
+            registry.inc('portal_agent_upstream_errors_total')
+            raise AgentUnavailable(str(e)) from e
+        elapsed = time.perf_counter() - start
+        self.latency.record(elapsed)
+        registry.observe('portal_agent_upstream_duration_seconds', elapsed)
+
+        response_headers = [(name, value) for name, value in resp.headers.items()
+                            if name.lower() not in HOP_BY_HOP_HEADERS]
+
+        def stream():
+            complete = False
+            try:
+                for chunk in resp.stream(STREAM_CHUNK_SIZE, decode_content=False):
+                    yield chunk
+                complete = True
+            finally:
+                if not complete:
+                    # Client went away mid-body; the connection cannot be reused
+                    resp.close()
+                resp.release_conn()
+
+        return resp.status, response_headers, stream()
+
+
+proxy = AgentProxy()
@@ -4,133 +4,160 @@ Max Electric Customer Portal
 A web application for customers to view their account balance and information
 """
 
+from startup_profile import StartupProfiler
+
+startup = StartupProfiler('portal')
+
 import sqlite3
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, send_from_directory
-from werkzeug.security import generate_password_hash, check_password_hash
+import json
+import queue
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, g
+from werkzeug.security import generate_password_hash
 from functools import wraps
 import secrets
-import ssl
-import requests
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+from config.production import Config
+import balance_events
+import balance_stream
+import customers
+import metrics
+import payment_intake
+import static_assets
+import template_cache
+from compression import compress_response
+from agent_proxy import AgentUnavailable, proxy as agent_proxy
+from async_logging import configure_logging
+from db import init_schema, shards
+from passwords import PasswordPoolBusy, hasher as password_hasher
+from video import VideoIndex, send_video
+from payments import NOT_FOUND, DUPLICATE, apply_payment, parse_amount
+
+startup.mark('imports')
 
 app = Flask(__name__)
+# Compiled templates persist on disk for new workers; {% cache %} renders static page regions once
+app.jinja_options = {
+    **app.jinja_options,
+    'extensions': [template_cache.FragmentCacheExtension],
+    'bytecode_cache': template_cache.bytecode_cache(),
+}
+# {{ asset_url('css/style.css') }} links the fingerprinted, precompressed build
+app.add_template_global(static_assets.asset_url, 'asset_url')
 app.secret_key = secrets.token_hex(16)  # Generate a random secret key
+app.config['USE_X_SENDFILE'] = Config.USE_X_SENDFILE  # let a fronting web server send files
 
 # Configure logging
 import logging
-from logging.handlers import RotatingFileHandler
-import os
 
 if not app.debug:
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    
-    # Set up file handler with rotation
-    file_handler = RotatingFileHandler('logs/max_electric.log', maxBytes=10240000, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    
-    app.logger.setLevel(logging.INFO)
+    # Requests only enqueue records; a background writer batches, rotates and writes them
+    log_handler = configure_logging(
+        app.logger,
+        Config.PORTAL_LOG_FILE,
+        level=logging.getLevelName(Config.LOG_LEVEL),
+        json_lines=Config.LOG_JSON,
+        max_bytes=Config.LOG_MAX_BYTES,
+        backup_count=Config.LOG_BACKUP_COUNT,
+        queue_size=Config.LOG_QUEUE_SIZE,
+        level_rates=Config.LOG_SAMPLE_RATES,
+        message_rates=Config.LOG_SAMPLED_MESSAGES,
+        echo_stderr=Config.LOG_TO_STDERR,
+    )
+    
     app.logger.info('Max Electric Payment Demo startup')
 
 # Database configuration
-DATABASE = 'customer.db'
+DATABASE = Config.DATABASE_PATH
+
+# Hand-written demo accounts, loaded into an empty store (password "signalwire_rocks")
+SAMPLE_CUSTOMERS = [
+    ('12345', 'johnsmith', 'John', 'Smith', '5551234567', '123 Main Street', 100.0),
+    ('12557', 'jimsmith', 'Jim', 'Smith', '5551234567', '120 Grove Circle', 0.0),
+    ('20000', 'alicej', 'Alice', 'Johnson', '5559876543', '456 Elm Street', 250.0),
+    ('20001', 'bobwilliams', 'Bob', 'Williams', '5558765432', '789 Oak Avenue', 300.0),
+    ('20002', 'charlieb', 'Charlie', 'Brown', '5557654321', '101 Pine Lane', 150.0),
+    ('20003', 'davidw', 'David', 'Wilson', '5556543210', '202 Maple Drive', 400.0),
+    ('20004', 'evedavis', 'Eve', 'Davis', '5555432109', '303 Birch Boulevard', 500.0),
+    ('20005', 'frankmiller', 'Frank', 'Miller', '5554321098', '404 Cedar Court', 350.0),
+    ('20006', 'gracem', 'Grace', 'Moore', '5553210987', '505 Spruce Circle', 275.0),
+    ('20007', 'hanktaylor', 'Hank', 'Taylor', '5552109876', '606 Willow Way', 425.0),
+    ('20008', 'ivyanderson', 'Ivy', 'Anderson', '5551098765', '707 Aspen Road', 600.0),
+    ('20009', 'jackthomas', 'Jack', 'Thomas', '5550987654', '808 Cherry Street', 700.0),
+]
 
 # SignalWire configuration
 SIGNALWIRE_CALL_TOKEN = os.environ.get('SIGNALWIRE_CALL_TOKEN')
 SIGNALWIRE_CALL_DESTINATION = os.environ.get('SIGNALWIRE_CALL_DESTINATION')
 
-def get_db_connection():
-    """Get database connection with row factory"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    """Initialize database with customer table if it doesn't exist"""
-    conn = get_db_connection()
-    
-    # Create customer table if it doesn't exist
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS customer (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            account_number TEXT UNIQUE NOT NULL,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            pin TEXT NOT NULL,
-            first_name TEXT NOT NULL,
-            last_name TEXT NOT NULL,
-            phone TEXT,
-            address TEXT,
-            balance REAL DEFAULT 0.0
-        )
-    ''')
-    
-    # Check if we need to add new columns to existing table
-    cursor = conn.execute("PRAGMA table_info(customer)")
-    columns = [column[1] for column in cursor.fetchall()]
+startup.mark('app setup')
+
+@app.before_request
+def start_request_metrics():
+    """Count the request as in flight and start its timer"""
+    metrics.exporter.ensure_started()
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    metrics.registry.inc('portal_requests_in_flight', (('route', g.metrics_route),))
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the request's status and time to response headers"""
+    if 'metrics_start' in g:
+        route = (('route', g.metrics_route), ('method', request.method))
+        metrics.registry.inc('portal_requests_total', route + (('status', str(response.status_code)),))
+        metrics.registry.observe('portal_request_duration_seconds', time.perf_counter() - g.metrics_start, route)
+    return response
+
+@app.after_request
+def compress_dynamic_response(response):
+    """Gzip large HTML/JSON responses for clients that accept it"""
+    return compress_response(request, response)
+
+@app.teardown_request
+def finish_request_metrics(exception=None):
+    route = g.pop('metrics_route', None)
+    if route is not None:
+        metrics.registry.dec('portal_requests_in_flight', (('route', route),))
+
+def init_db(storage=None, sample_data=True):
+    """Create or migrate every shard's schema and seed an empty store with sample customers"""
+    storage = storage or shards
+    empty = True
+    for shard in storage:
+        with shard.transaction() as conn:
+            init_schema(conn)
+            empty = empty and conn.execute('SELECT 1 FROM customer LIMIT 1').fetchone() is None
     
-    # Check if we have any data, if not, populate with sample data
-    cursor = conn.execute('SELECT COUNT(*) FROM customer')
-    count = cursor.fetchone()[0]
+    if empty and sample_data:
+        _seed_sample_customers(storage)
+    customers.clear_cache()
+
+def _seed_sample_customers(storage):
+    """Insert SAMPLE_CUSTOMERS, each on its own shard"""
+    # Hash the default password "signalwire_rocks" for all users
+    default_password_hash = generate_password_hash("signalwire_rocks", method=Config.PASSWORD_HASH_METHOD)
+    default_pin = "0803"
     
-    if count == 0:
-        # Hash the default password "signalwire_rocks" for all users
-        default_password_hash = generate_password_hash("signalwire_rocks")
-        default_pin = "0803"
-        
-        # Insert sample data with usernames, hashed passwords, and PINs
-        sample_customers = [
-            ('12345', 'johnsmith', default_password_hash, default_pin, 'John', 'Smith', '5551234567', '123 Main Street', 100.0),
-            ('12557', 'jimsmith', default_password_hash, default_pin, 'Jim', 'Smith', '5551234567', '120 Grove Circle', 0.0),
-            ('20000', 'alicej', default_password_hash, default_pin, 'Alice', 'Johnson', '5559876543', '456 Elm Street', 250.0),
-            ('20001', 'bobwilliams', default_password_hash, default_pin, 'Bob', 'Williams', '5558765432', '789 Oak Avenue', 300.0),
-            ('20002', 'charlieb', default_password_hash, default_pin, 'Charlie', 'Brown', '5557654321', '101 Pine Lane', 150.0),
-            ('20003', 'davidw', default_password_hash, default_pin, 'David', 'Wilson', '5556543210', '202 Maple Drive', 400.0),
-            ('20004', 'evedavis', default_password_hash, default_pin, 'Eve', 'Davis', '5555432109', '303 Birch Boulevard', 500.0),
-            ('20005', 'frankmiller', default_password_hash, default_pin, 'Frank', 'Miller', '5554321098', '404 Cedar Court', 350.0),
-            ('20006', 'gracem', default_password_hash, default_pin, 'Grace', 'Moore', '5553210987', '505 Spruce Circle', 275.0),
-            ('20007', 'hanktaylor', default_password_hash, default_pin, 'Hank', 'Taylor', '5552109876', '606 Willow Way', 425.0),
-            ('20008', 'ivyanderson', default_password_hash, default_pin, 'Ivy', 'Anderson', '5551098765', '707 Aspen Road', 600.0),
-            ('20009', 'jackthomas', default_password_hash, default_pin, 'Jack', 'Thomas', '5550987654', '808 Cherry Street', 700.0),
-        ]
-        
-        for customer in sample_customers:
-            conn.execute('''
-                INSERT INTO customer (account_number, username, password_hash, pin, first_name, last_name, phone, address, balance)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', customer)
-    else:
-        # If data exists but new columns are missing, update existing records
-        cursor = conn.execute("SELECT id, first_name, last_name FROM customer WHERE username IS NULL")
-        customers_to_update = cursor.fetchall()
-        
-        if customers_to_update:
-            default_password_hash = generate_password_hash("signalwire_rocks")
-            default_pin = "1234"
-            
-            for customer in customers_to_update:
-                username = f"{customer['first_name'].lower()}{customer['last_name'].lower()}"
-                # Handle potential duplicates by adding ID
-                username = f"{username}{customer['id']}"
-                
-                conn.execute('''
-                    UPDATE customer 
-                    SET username = ?, password_hash = ?, pin = ?
-                    WHERE id = ?
-                ''', (username, default_password_hash, default_pin, customer['id']))
-    
-    conn.commit()
-    conn.close()
+    by_shard = {}
+    for account_number, username, first_name, last_name, phone, address, balance in SAMPLE_CUSTOMERS:
+        by_shard.setdefault(storage.index(account_number), []).append((
+            account_number, username, default_password_hash, default_pin,
+            first_name, last_name, phone, address, balance, balance,
+        ))
+    for index, rows in by_shard.items():
+        with storage.pools[index].transaction() as conn:
+            conn.executemany('''
+                INSERT INTO customer (account_number, username, password_hash, pin, first_name, last_name,
+                                      phone, address, balance, opening_balance)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
 
 def login_required(f):
     """Decorator to require login for certain routes"""
@@ -141,6 +168,28 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def client_has_current(etag, last_modified=None):
+    """True when If-None-Match / If-Modified-Since show the client's copy is current"""
+    if request.if_none_match:
+        # Weak comparison: compressed responses carry a weak form of the ETag
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+def not_modified(etag, last_modified=None, cache_control='no-cache'):
+    """Empty 304 response carrying the validators"""
+    response = Response(status=304)
+    return with_validators(response, etag, last_modified, cache_control)
+
+def with_validators(response, etag, last_modified=None, cache_control='no-cache'):
+    """Attach ETag / Last-Modified and a revalidate-every-time cache policy"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = int(last_modified)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
 @app.route('/')
 def index():
     """Home page"""
@@ -154,27 +203,41 @@ def login():
         password = request.form['password']
         
         # Log the login attempt
-        app.logger.info(f"Login attempt for username: {username}")
+        app.logger.info("Login attempt for username: %s", username)
         
-        conn = get_db_connection()
-        customer = conn.execute('''
-            SELECT * FROM customer 
-            WHERE username = ?
-        ''', (username,)).fetchone()
-        conn.close()
+        customer = customers.get_customer_by_username(username)
         
-        if customer and check_password_hash(customer['password_hash'], password):
+        try:
+            valid, new_hash = password_hasher.verify(customer['password_hash'], password) if customer else (False, None)
+        except PasswordPoolBusy as e:
+            app.logger.warning("Password check unavailable for username %s: %s", username, e)
+            flash('We are experiencing high demand. Please try again in a moment.', 'error')
+            response = app.make_response((render_template('login.html'), 503))
+            response.headers['Retry-After'] = '1'
+            return response
+        
+        if valid:
+            if new_hash:
+                # Stored hash used older parameters: upgrade it now that we know the password
+                with shards.transaction(customer['account_number'], immediate=True) as write_conn:
+                    write_conn.execute('''
+                        UPDATE customer SET password_hash = ?, version = version + 1
+                        WHERE id = ? AND password_hash = ?
+                    ''', (new_hash, customer['id'], customer['password_hash']))
+                customers.invalidate(customer['account_number'])
+                app.logger.info("Rehashed password for user: %s", username)
+            
             session['customer_id'] = customer['id']
             session['customer_name'] = f"{customer['first_name']} {customer['last_name']}"
             session['account_number'] = customer['account_number']
             session['username'] = customer['username']
             session['pin'] = customer['pin']  # Store PIN for DTMF authentication if needed
             
-            app.logger.info(f"Successful login for user: {username}")
+            app.logger.info("Successful login for user: %s", username)
             flash('Login successful!', 'success')
             return redirect(url_for('dashboard'))
         else:
-            app.logger.warning(f"Failed login attempt for username: {username}")
+            app.logger.warning("Failed login attempt for username: %s", username)
             flash('Invalid username or password. Please try again.', 'error')
     
     return render_template('login.html')
@@ -183,19 +246,12 @@ def login():
 @login_required
 def dashboard():
     """Customer dashboard"""
-    conn = get_db_connection()
-    customer = conn.execute('''
-        SELECT * FROM customer WHERE id = ?
-    ''', (session['customer_id'],)).fetchone()
-    conn.close()
+    customer = customers.get_customer_by_account(session['account_number'])
     
     if customer:
-        # Convert to dict and ensure balance is a float
-        customer_dict = dict(customer)
-        customer_dict['balance'] = float(customer_dict['balance']) if customer_dict['balance'] else 0.0
-        print(f"SIGNALWIRE_CALL_TOKEN: {SIGNALWIRE_CALL_TOKEN}")
-        print(f"SIGNALWIRE_CALL_DESTINATION: {SIGNALWIRE_CALL_DESTINATION}")
-        return render_template('dashboard.html', customer=customer_dict, signalwire_call_token=SIGNALWIRE_CALL_TOKEN, signalwire_call_destination=SIGNALWIRE_CALL_DESTINATION)
+        # Ensure balance is a float (the cache hands out a private copy)
+        customer['balance'] = float(customer['balance']) if customer['balance'] else 0.0
+        return render_template('dashboard.html', customer=customer, signalwire_call_token=SIGNALWIRE_CALL_TOKEN, signalwire_call_destination=SIGNALWIRE_CALL_DESTINATION)
     else:
         flash('Customer not found.', 'error')
         return redirect(url_for('login'))
@@ -204,43 +260,128 @@ def dashboard():
 @login_required
 def api_balance():
     """API endpoint to get current balance"""
-    conn = get_db_connection()
-    customer = conn.execute('''
-        SELECT balance FROM customer WHERE id = ?
-    ''', (session['customer_id'],)).fetchone()
-    conn.close()
+    customer = customers.get_customer_by_account(session['account_number'])
     
     if customer:
+        # Pollers with the current version get a 304 straight from the cache
+        etag = f"balance-{customer['account_number']}-{customer['version']}"
+        if client_has_current(etag):
+            return not_modified(etag, cache_control='private, no-cache')
+        
         balance = float(customer['balance']) if customer['balance'] else 0.0
-        return jsonify({'balance': balance})
+        return with_validators(jsonify({'balance': balance}), etag, cache_control='private, no-cache')
     else:
         return jsonify({'error': 'Customer not found'}), 404
 
+@app.route('/api/balance/stream')
+@login_required
+def api_balance_stream():
+    """Server-Sent Events stream pushing the balance whenever a payment lands"""
+    if Config.BALANCE_STREAM_URL:
+        # Served by the stream process, where an open dashboard holds no request thread
+        token = balance_stream.stream_token(session['account_number'])
+        return redirect(f"{Config.BALANCE_STREAM_URL}?token={token}", code=307)
+
+    if not balance_stream.threaded.admit():
+        # The dashboard falls back to polling /api/balance
+        return jsonify({'error': 'Too many open balance streams'}), 503, {'Retry-After': '30'}
+    
+    # Subscribe before reading so a payment in between is not lost
+    subscription = balance_events.broker.subscribe(session['account_number'])
+    customer = customers.get_customer_by_account(session['account_number'])
+    if not customer:
+        balance_events.broker.unsubscribe(subscription)
+        balance_stream.threaded.release()
+        return jsonify({'error': 'Customer not found'}), 404
+    
+    balance = float(customer['balance']) if customer['balance'] else 0.0
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # don't let a fronting proxy buffer events
+    }
+    
+    def stream(balance):
+        try:
+            yield balance_stream.first_event(balance)
+            while True:
+                try:
+                    balance = subscription.get(timeout=Config.BALANCE_STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield balance_stream.balance_event(balance)
+        finally:
+            balance_events.broker.unsubscribe(subscription)
+            balance_stream.threaded.release()
+    
+    return Response(stream(balance), mimetype='text/event-stream', headers=headers)
+
 @app.route('/logout')
 def logout():
     """Logout user"""
-    app.logger.info(f"User logged out: {session.get('username', 'unknown')}")
+    app.logger.info("User logged out: %s", session.get('username', 'unknown'))
     session.clear()
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
+# Columns /admin/users may return (password hashes are never exposed)
+ADMIN_USER_FIELDS = ('account_number', 'username', 'first_name', 'last_name', 'pin', 'balance', 'phone', 'address')
+ADMIN_USER_DEFAULT_FIELDS = ('account_number', 'username', 'first_name', 'last_name', 'pin', 'balance')
+
 @app.route('/admin/users')
 def admin_users():
-    """Admin endpoint to view all users (Demo purposes only)"""
-    conn = get_db_connection()
-    customers = conn.execute('''
-        SELECT account_number, username, first_name, last_name, pin, balance 
-        FROM customer 
-        ORDER BY account_number
-    ''').fetchall()
-    conn.close()
+    """Admin endpoint to view users a page at a time (Demo purposes only)
+    
+    GET /admin/users?limit=100&after=20005          next page after an account number
+    GET /admin/users?fields=account_number,balance  only the listed columns
+    GET /admin/users?stream=1                       every user as newline-delimited JSON
+    """
+    after = request.args.get('after', '')
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    
+    fields = ADMIN_USER_DEFAULT_FIELDS
+    if request.args.get('fields'):
+        fields = tuple(field for field in request.args['fields'].split(',') if field)
+        unknown = [field for field in fields if field not in ADMIN_USER_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}",
+                            'allowed_fields': list(ADMIN_USER_FIELDS)}), 400
+    
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    
+    if stream:
+        # Rows go from keyset pages to the client a chunk at a time, never collected
+        def lines():
+            chunk = []
+            for row in customers.iter_customers_after(after, fields, limit):
+                chunk.append(json.dumps(row))
+                if len(chunk) == 500:
+                    yield '\n'.join(chunk) + '\n'
+                    chunk = []
+            if chunk:
+                yield '\n'.join(chunk) + '\n'
+        return Response(lines(), mimetype='application/x-ndjson')
+    
+    limit = min(limit or Config.ADMIN_USERS_PAGE_SIZE, Config.ADMIN_USERS_PAGE_MAX)
+    users = list(customers.iter_customers_after(after, fields, limit))
     
     return jsonify({
-        'users': [dict(customer) for customer in customers],
+        'users': users,
+        'next_after': users[-1]['account_number'] if len(users) == limit else None,
         'password_hint': 'All users have password: signalwire_rocks',
         'pin_hint': 'All users have PIN: 1234'
     })
 
+@app.route('/admin/cache')
+def admin_cache():
+    """Admin endpoint exposing customer cache hit/miss counters (Demo purposes only)"""
+    return jsonify(customers.cache.stats())
+
 @app.route('/api/customer', methods=['GET'])
 def get_customer_data():
     """API endpoint for DataMap tool to retrieve customer data"""
@@ -252,111 +393,195 @@ def get_customer_data():
             'error': 'Missing account_number parameter'
         }), 400
     
-    app.logger.info(f"Customer data request for account: {account_number}")
+    app.logger.info("Customer data request for account: %s", account_number)
     
     try:
-        conn = get_db_connection()
-        customer = conn.execute('''
-            SELECT account_number, first_name, last_name, phone, address, balance, pin 
-            FROM customer 
-            WHERE account_number = ?
-        ''', (account_number,)).fetchone()
-        conn.close()
+        customer = customers.get_customer_by_account(account_number)
         
         if customer:
-            customer_data = dict(customer)
-            app.logger.info(f"Found customer data for account {account_number}: {customer_data['first_name']} {customer_data['last_name']}")
-            return jsonify(customer_data)
+            etag = f"customer-{customer['account_number']}-{customer['version']}"
+            if client_has_current(etag):
+                return not_modified(etag, cache_control='private, no-cache')
+            
+            customer_data = {key: customer[key] for key in customers.API_FIELDS}
+            app.logger.debug("Found customer data for account %s", account_number)
+            return with_validators(jsonify(customer_data), etag, cache_control='private, no-cache')
         else:
-            app.logger.warning(f"No customer found for account number: {account_number}")
+            app.logger.warning("No customer found for account number: %s", account_number)
             return jsonify({
                 'error': f'No customer found with account number {account_number}'
             }), 404
             
     except sqlite3.Error as e:
-        app.logger.error(f"Database error retrieving customer data: {e}")
+        app.logger.error("Database error retrieving customer data: %s", e)
         return jsonify({
             'error': 'Database error occurred'
         }), 500
     except Exception as e:
-        app.logger.error(f"Unexpected error retrieving customer data: {e}")
+        app.logger.error("Unexpected error retrieving customer data: %s", e)
         return jsonify({
             'error': 'Internal server error'
         }), 500
 
 
+@app.route('/api/customers', methods=['GET', 'POST'])
+def get_customers_batch():
+    """Batch variant of /api/customer for a list or range of account numbers
+    
+    GET  /api/customers?account_numbers=12345,20000
+    GET  /api/customers?start=20000&end=20005
+    POST /api/customers  {"account_numbers": ["12345", "20000"]} or {"start": ..., "end": ...}
+    
+    Add stream=1 (or "stream": true) for newline-delimited JSON output.
+    A range returns at most CUSTOMER_BATCH_MAX customers; if more match,
+    "next" is the start of the rest (a final {"next": ...} line when streaming).
+    """
+    if request.method == 'POST':
+        params = request.get_json(silent=True) or {}
+        account_numbers = params.get('account_numbers')
+    else:
+        params = request.args
+        account_numbers = [number for value in request.args.getlist('account_numbers')
+                           for number in value.split(',') if number]
+    
+    start, end = params.get('start'), params.get('end')
+    stream = str(params.get('stream', '')).lower() in ('1', 'true', 'yes')
+    
+    if account_numbers:
+        if not isinstance(account_numbers, list) or not all(isinstance(n, str) for n in account_numbers):
+            return jsonify({'error': 'account_numbers must be a list of strings'}), 400
+        if len(account_numbers) > Config.CUSTOMER_BATCH_MAX:
+            return jsonify({'error': f'At most {Config.CUSTOMER_BATCH_MAX} account numbers per request'}), 400
+    elif not (start and end):
+        app.logger.error("Missing account_numbers or start/end parameters in batch customer request")
+        return jsonify({'error': 'Provide account_numbers or start and end'}), 400
+    
+    if account_numbers:
+        app.logger.info("Batch customer data request for %d accounts", len(account_numbers))
+    else:
+        app.logger.info("Batch customer data request for range %s-%s", start, end)
+    
+    def project(customer):
+        return {key: customer[key] for key in customers.API_FIELDS}
+    
+    try:
+        if account_numbers:
+            found = customers.get_customers_by_account(account_numbers)
+            if stream:
+                def lines():
+                    for account_number, customer in found.items():
+                        record = project(customer) if customer else {'account_number': account_number, 'error': 'not_found'}
+                        yield json.dumps(record) + '\n'
+                return Response(lines(), mimetype='application/x-ndjson')
+            return jsonify({
+                'customers': {number: project(customer) if customer else None for number, customer in found.items()},
+                'not_found': [number for number, customer in found.items() if customer is None],
+            })
+        
+        # One row past the limit tells a complete range from a truncated one
+        limit = Config.CUSTOMER_BATCH_MAX
+        rows = customers.iter_customers_in_range(str(start), str(end), limit + 1)
+        if stream:
+            def range_lines():
+                for index, customer in enumerate(rows):
+                    if index == limit:
+                        yield json.dumps({'next': customer['account_number']}) + '\n'
+                        break
+                    yield json.dumps(project(customer)) + '\n'
+            return Response(range_lines(), mimetype='application/x-ndjson')
+        found = list(rows)
+        return jsonify({
+            'customers': {customer['account_number']: project(customer) for customer in found[:limit]},
+            'next': found[limit]['account_number'] if len(found) > limit else None,
+        })
+    
+    except sqlite3.Error as e:
+        app.logger.error("Database error retrieving batch customer data: %s", e)
+        return jsonify({
+            'error': 'Database error occurred'
+        }), 500
+
 @app.route('/call-support')
 def call_support():
     """Click-to-call support page"""
     return render_template('call_support.html', signalwire_call_token=SIGNALWIRE_CALL_TOKEN, signalwire_call_destination=SIGNALWIRE_CALL_DESTINATION)
 
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve a fingerprinted static asset with an immutable, year-long cache lifetime"""
+    return static_assets.send_asset(filename)
+
+# In-memory index of static/video, rescanned only when the directory changes
+video_index = VideoIndex(os.path.join(app.root_path, 'static', 'video'))
+
 @app.route('/video/<filename>')
 def serve_video(filename):
     """Serve MP4 video files from static/video directory"""
     try:
         # Security check: only allow MP4 files
         if not filename.lower().endswith('.mp4'):
-            app.logger.warning(f"Attempted access to non-MP4 file: {filename}")
+            app.logger.warning("Attempted access to non-MP4 file: %s", filename)
             return jsonify({'error': 'Only MP4 files are allowed'}), 400
         
         # Security check: prevent directory traversal
         if '..' in filename or '/' in filename or '\\' in filename:
-            app.logger.warning(f"Attempted directory traversal with filename: {filename}")
+            app.logger.warning("Attempted directory traversal with filename: %s", filename)
             return jsonify({'error': 'Invalid filename'}), 400
         
         # Log the video request
-        app.logger.info(f"Video request for: {filename}")
+        app.logger.info("Video request for: %s", filename)
         
-        # Serve the file from static/video directory
-        return send_from_directory(
-            directory=os.path.join(app.root_path, 'static', 'video'),
-            path=filename,
-            as_attachment=False,  # Stream the video instead of downloading
-            mimetype='video/mp4'
-        )
+        # Only files present in the index can be served
+        video = video_index.get(filename)
+        if video is None:
+            raise FileNotFoundError(filename)
+        
+        return send_video(video)
         
     except FileNotFoundError:
-        app.logger.warning(f"Video file not found: {filename}")
+        app.logger.warning("Video file not found: %s", filename)
         return jsonify({'error': 'Video file not found'}), 404
     except Exception as e:
-        app.logger.error(f"Error serving video {filename}: {e}")
+        app.logger.error("Error serving video %s: %s", filename, e)
         return jsonify({'error': 'Error serving video file'}), 500
 
 @app.route('/video')
 def list_videos():
     """List available MP4 video files"""
     try:
-        video_dir = os.path.join(app.root_path, 'static', 'video')
+        videos, version = video_index.listing()
         
         # Check if video directory exists
-        if not os.path.exists(video_dir):
+        if videos is None:
             return jsonify({'videos': [], 'message': 'Video directory not found'})
         
-        # Get all MP4 files in the video directory
-        video_files = []
-        for filename in os.listdir(video_dir):
-            if filename.lower().endswith('.mp4'):
-                file_path = os.path.join(video_dir, filename)
-                file_size = os.path.getsize(file_path)
-                video_files.append({
-                    'filename': filename,
-                    'url': url_for('serve_video', filename=filename),
-                    'size_bytes': file_size,
-                    'size_mb': round(file_size / (1024 * 1024), 2)
-                })
+        etag = f"videos-{version}"
+        if client_has_current(etag):
+            return not_modified(etag)
         
-        app.logger.info(f"Listed {len(video_files)} video files")
+        video_files = [{
+            'filename': video.filename,
+            'url': url_for('serve_video', filename=video.filename),
+            'size_bytes': video.size,
+            'size_mb': round(video.size / (1024 * 1024), 2),
+            'etag': video.etag
+        } for video in videos]
         
-        return jsonify({
+        app.logger.info("Listed %s video files", len(video_files))
+        
+        return with_validators(jsonify({
             'videos': video_files,
             'count': len(video_files)
-        })
+        }), etag)
         
     except Exception as e:
-        app.logger.error(f"Error listing videos: {e}")
+        app.logger.error("Error listing videos: %s", e)
         return jsonify({'error': 'Error listing video files'}), 500
 
 ## Mock Payment Processor ##
+def count_payment(outcome):
+    metrics.registry.inc('portal_payments_total', (('outcome', outcome),))
+
 @app.route('/payment-processor', methods=['POST'])
 def payment_processor():
     """
@@ -379,73 +604,108 @@ def payment_processor():
     try:
         account_number = request.args.get('account_number')
         payment_amount = request.json['chargeAmount']
+        transaction_id = request.json.get('transaction_id')
+        method = request.json.get('method')
         
         # Add validation
         if not account_number:
             app.logger.error("Missing account_number parameter")
+            count_payment('invalid')
             return Response("Missing account_number parameter", status=400)
         if not payment_amount:
             app.logger.error("Missing payment amount")
+            count_payment('invalid')
             return Response("Missing payment amount", status=400)
+        
+        amount = parse_amount(payment_amount)
+        if amount is None:
+            app.logger.error("Invalid payment amount: %s", payment_amount)
+            count_payment('invalid')
+            return Response("Invalid payment amount", status=400)
             
     except Exception as e:
-        app.logger.error(f"Parameter parsing error: {e}")
+        app.logger.error("Parameter parsing error: %s", e)
+        count_payment('invalid')
         return Response("Required parameters are missing, transaction failed", status=400)
 
-    try:        
-        db = sqlite3.connect("customer.db")
-        db.row_factory = sqlite3.Row
-        cursor = db.cursor()
+    if Config.PAYMENT_INTAKE_MODE == 'async':
+        return spool_payment(account_number, amount, transaction_id, method)
 
-        app.logger.info(f"Updating balance for account {account_number} by ${payment_amount}")
+    try:
+        app.logger.info("Updating balance for account %s by $%s (transaction %s)", account_number, amount, transaction_id)
         
-        # Check if account exists first
-        cursor.execute("SELECT balance FROM customer WHERE account_number = ?", (account_number,))
-        customer = cursor.fetchone()
+        result = apply_payment(account_number, amount, transaction_id, method)
         
-        if not customer:
-            app.logger.error(f"Account {account_number} not found")
-            db.close()
+        if result.status == NOT_FOUND:
+            app.logger.error("Account %s not found", account_number)
+            count_payment('not_found')
             return Response("Account not found", status=404)
         
-        old_balance = customer['balance']
-        
-        # Update the balance
-        cursor.execute(
-            "UPDATE customer SET balance = balance - ? WHERE account_number = ?",
-            (payment_amount, account_number)
-        )
-        
-        # Check if the update actually affected any rows
-        if cursor.rowcount == 0:
-            app.logger.error(f"No rows updated for account {account_number}")
-            db.rollback()
-            db.close()
-            return Response("Failed to update account balance", status=400)
-        
-        # Get the new balance for logging
-        cursor.execute("SELECT balance FROM customer WHERE account_number = ?", (account_number,))
-        new_balance = cursor.fetchone()['balance']
-        
-        db.commit()
-        db.close()
-        
-        app.logger.info(f"Payment successful - Account {account_number}: ${old_balance} -> ${new_balance}")
+        count_payment(result.status)
+        if result.status == DUPLICATE:
+            app.logger.info("Duplicate transaction %s - already applied to account %s", transaction_id, result.account_number)
+        else:
+            app.logger.info("Payment successful - Account %s: $%s -> $%s", account_number, result.old_balance, result.new_balance)
 
     except sqlite3.Error as e:
-        app.logger.error(f"Database error during payment processing: {e}")
-        if 'db' in locals():
-            db.rollback()
-            db.close()
+        app.logger.error("Database error during payment processing: %s", e)
+        count_payment('error')
         return Response("Database error occurred", status=500)
     except Exception as e:
-        app.logger.error(f"Unexpected error during payment processing: {e}")
-        if 'db' in locals():
-            db.close()
+        app.logger.error("Unexpected error during payment processing: %s", e)
+        count_payment('error')
         return Response("The Transaction failed", status=500)
 
     return Response("The Transaction was successful", status=200)
 
+def spool_payment(account_number, amount, transaction_id, method):
+    """Async intake: durably spool a validated payment and answer without waiting for the ledger"""
+    if customers.get_customer_by_account(account_number) is None:
+        app.logger.error("Account %s not found", account_number)
+        count_payment('not_found')
+        return Response("Account not found", status=404)
+
+    try:
+        record = payment_intake.intake.accept(account_number, amount, transaction_id, method)
+    except sqlite3.Error as e:
+        app.logger.error("Payment spool error: %s", e)
+        count_payment('error')
+        return Response("Database error occurred", status=500)
+    except FutureTimeout:
+        # Not acknowledged; a retried callback with the same transaction_id is spooled once
+        app.logger.error("Payment spool timed out for account %s", account_number)
+        count_payment('error')
+        return Response("The Transaction failed", status=500)
+
+    # A retried callback gets the outcome its first delivery has reached so far
+    status = record['status']
+    if status == 'not_found':
+        return Response("Account not found", status=404)
+    if status == payment_intake.FAILED:
+        return Response("The Transaction failed", status=500)
+    if status in ('queued', 'applying'):
+        count_payment('queued')
+        app.logger.info("Spooled payment for account %s of $%s (transaction %s)",
+                        account_number, amount, record['transaction_id'])
+        message = "The Transaction was accepted"
+    else:
+        message = "The Transaction was successful"
+    response = Response(message, status=200)
+    response.headers['Location'] = url_for('payment_status', transaction_id=record['transaction_id'])
+    return response
+
+@app.route('/payment-processor/<transaction_id>')
+def payment_status(transaction_id):
+    """Outcome of a spooled payment: queued, applying, applied, duplicate, not_found or failed"""
+    record = payment_intake.intake.status(transaction_id)
+    if record is None:
+        response = jsonify({'error': 'Unknown transaction'})
+        response.status_code = 404
+    else:
+        response = jsonify(record)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 ## Error Handlers ##
 @app.errorhandler(404)
 def not_found(error):
@@ -460,34 +720,78 @@ def internal_error(error):
 @app.route('/agent', methods=['GET', 'POST', 'PUT', 'DELETE'])
 @app.route('/agent/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def agent(path=""):
-    # Target service URL - include the path if provided
+    """Stream SWML/SWAIG requests through to the agent service"""
+    # Target path on the agent service - include the path if provided
     if path:
-        target_url = f'http://localhost:3000/agent/{path}'
+        target_path = f'/agent/{path}'
     else:
-        target_url = f'http://localhost:3000/agent'
-    
-    # Forward the request
-    resp = requests.request(
-        method=request.method,
-        url=target_url,
-        headers={key: value for (key, value) in request.headers if key != 'Host'},
-        data=request.get_data(),
-        params=request.args,
-        allow_redirects=False
-    )
+        target_path = '/agent'
     
-    # Return response
-    excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
-    headers = [(name, value) for (name, value) in resp.raw.headers.items()
-               if name.lower() not in excluded_headers]
+    # Stream the body through rather than buffering it
+    chunked = 'chunked' in request.headers.get('Transfer-Encoding', '').lower()
+    body = request.stream if (request.content_length or chunked) else None
     
-    response = Response(resp.content, resp.status_code, headers)
+    try:
+        status, headers, body_iter = agent_proxy.forward(
+            request.method,
+            target_path,
+            request.headers.items(),
+            body=body,
+            query_string=request.query_string,
+            chunked=chunked,
+        )
+    except AgentUnavailable as e:
+        app.logger.error("Agent service unavailable: %s", e)
+        return jsonify({'error': 'Agent service unavailable'}), 502
+    
+    return Response(body_iter, status, headers, direct_passthrough=True)
+
+@app.route('/admin/agent-proxy')
+def admin_agent_proxy():
+    """Admin endpoint exposing upstream latency for the agent proxy (Demo purposes only)"""
+    return jsonify(agent_proxy.latency.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint covering every worker"""
+    return Response(metrics.collect_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def healthz():
+    """Liveness probe: the worker is up and answering requests"""
+    response = jsonify({'status': 'ok', 'pid': os.getpid()})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/readyz')
+def readyz():
+    """Readiness probe: every shard is reachable and initialized"""
+    try:
+        for shard in shards:
+            with shard.connection() as conn:
+                conn.execute('SELECT 1 FROM customer LIMIT 1').fetchone()
+                conn.execute('SELECT 1 FROM payments LIMIT 1').fetchone()
+    except (sqlite3.Error, queue.Empty) as e:
+        app.logger.warning("Readiness check failed: %s", e)
+        response = jsonify({'status': 'unavailable', 'error': str(e)})
+        response.status_code = 503
+    else:
+        response = jsonify({'status': 'ready', 'pid': os.getpid()})
+    response.headers['Cache-Control'] = 'no-store'
     return response
 
+startup.mark('routes')
+
 if __name__ == '__main__':
-    # Initialize database
-    #TODO: Remove this and have a set up script that does this.
+    # Development server; production runs `gunicorn -c gunicorn.conf.py app:app`,
+    # which initializes the database once before forking its workers
     init_db()
+    balance_events.broker.ensure_started()
+    # No recover(): another portal may share the spool, so only expired leases are retaken (by the workers)
+    if Config.PAYMENT_INTAKE_MODE == 'async' or payment_intake.intake.pending():
+        payment_intake.intake.ensure_started()
+    startup.mark('init_db')
+    startup.report()
     
     app.logger.info("Starting server with HTTPS on port 8080...")
     app.logger.info("Access your app at: https://localhost:8080")
@@ -0,0 +1,260 @@
+"""
+Non-blocking logging pipeline for Max Electric Payment Demo
+
+Request threads only put LogRecords on an in-memory queue (dropping, never
+blocking, when it is full). A background writer drains the queue in batches,
+formats them off the request path, and appends each batch with one write.
+Rotation is coordinated across worker processes with a lock file, and a
+writer notices when another process has rotated the file underneath it.
+
+High-volume lines can be sampled per level or per message template before
+they are ever queued.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms rotate without a lock
+    fcntl = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'pid': record.process,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records per level or per message template
+
+    Warnings and errors are never sampled away.
+    """
+
+    def __init__(self, level_rates=None, message_rates=None):
+        super().__init__()
+        self.level_rates = {logging.getLevelName(level) if isinstance(level, str) else level: rate
+                            for level, rate in (level_rates or {}).items()}
+        self.message_rates = dict(message_rates or {})
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.level_rates.get(record.levelno, 1.0)
+        if isinstance(record.msg, str):
+            for prefix, message_rate in self.message_rates.items():
+                if record.msg.startswith(prefix):
+                    rate = min(rate, message_rate)
+                    break
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.Handler):
+    """Hands records to the writer thread without formatting or blocking"""
+
+    def __init__(self, writer, queue_size):
+        super().__init__()
+        self.writer = writer
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._start_writer()
+
+    def _start_writer(self):
+        self._pid = os.getpid()
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.writer.start(self.queue)
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            # Threads do not survive fork: give this process its own writer
+            self.acquire()
+            try:
+                if self._pid != os.getpid():
+                    self._start_writer()
+            finally:
+                self.release()
+        # Same-process queue: the record travels as-is and is formatted by the
+        # writer. Only exception text is rendered now, while exc_info is live.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter:
+    """Background thread that batches, writes and rotates the log file"""
+
+    def __init__(self, path, formatter, max_bytes=0, backup_count=0, batch_size=512, echo=None):
+        self.path = path
+        self.formatter = formatter
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.echo = echo  # optional second stream, e.g. stderr
+        self.queue = None
+        self._stream = None
+        self._thread = None
+        self._stop = object()
+
+    def start(self, log_queue):
+        self.queue = log_queue
+        self._open()
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Flush what is queued and stop the thread"""
+        if self._thread:
+            self.queue.put(self._stop)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._stream = open(self.path, 'a', encoding='utf-8')
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = any(record is self._stop for record in batch)
+            lines = []
+            for record in batch:
+                if record is self._stop:
+                    continue
+                try:
+                    lines.append(self.formatter.format(record) + '\n')
+                except Exception:
+                    lines.append(f"log formatting error: {record.msg!r}\n")
+            if lines:
+                self._write(''.join(lines))
+            if stopping:
+                self._stream.close()
+                return
+
+    def _write(self, data):
+        try:
+            with self._file_lock():
+                self._reopen_if_rotated()
+                if self.max_bytes and os.fstat(self._stream.fileno()).st_size + len(data) > self.max_bytes:
+                    self._rotate()
+                self._stream.write(data)
+                self._stream.flush()
+            if self.echo:
+                self.echo.write(data)
+                self.echo.flush()
+        except OSError:
+            # Never let logging take the writer thread down
+            pass
+
+    def _file_lock(self):
+        return _FileLock(self.path + '.lock') if fcntl else _NullLock()
+
+    def _reopen_if_rotated(self):
+        """Reopen if another process rotated or removed the file"""
+        try:
+            if os.stat(self.path).st_ino == os.fstat(self._stream.fileno()).st_ino:
+                return
+        except FileNotFoundError:
+            pass
+        self._stream.close()
+        self._open()
+
+    def _rotate(self):
+        """Shift path -> path.1 -> path.2 ... like RotatingFileHandler"""
+        self._stream.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{i}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{i + 1}")
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.1")
+        else:
+            open(self.path, 'w').close()
+        self._open()
+
+
+class _FileLock:
+    """Exclusive advisory lock shared by every process writing the same log"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+
+class _NullLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def configure_logging(logger, path, level=logging.INFO, json_lines=False, max_bytes=10240000,
+                      backup_count=10, queue_size=10000, level_rates=None, message_rates=None,
+                      echo_stderr=False):
+    """Route `logger` through the queue and background writer; returns the queue handler"""
+    if json_lines:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+
+    writer = LogWriter(path, formatter, max_bytes, backup_count, echo=sys.stderr if echo_stderr else None)
+    handler = NonBlockingQueueHandler(writer, queue_size)
+    handler.setLevel(level)
+    handler.addFilter(SamplingFilter(level_rates, message_rates))
+
+    # Everything goes through the queue, including what used to go to stderr
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return handler
+
+
+def wait_for_drain(handler, timeout=5):
+    """Block until the writer has consumed everything queued so far"""
+    deadline = time.monotonic() + timeout
+    while not handler.queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.001)
@@ -1,20 +1,58 @@
 #! /usr/bin/env python3
 # Author: Shane Harrell
 
-import sqlite3
+from startup_profile import StartupProfiler
+
+startup = StartupProfiler('agent')
+
 from signalwire_agents import AgentBase, SwaigFunctionResult
 import os
-import requests
 import logging
+import threading
+import uuid
 from dotenv import load_dotenv
-from flask import request
 
 load_dotenv()
 
+# Imported after load_dotenv(): its Config reads the environment
+from call_cache import cache as call_cache
+from customer_backend import ACCEPTED, NOT_FOUND, make_backend
+from swml_cache import SwmlCacheMixin
+from tool_calls import BudgetExceeded, CircuitOpen, ToolCallFailed
+startup.mark('imports')
+
 NGROK_URL = os.getenv("NGROK_URL")
 POST_PROMPT_URL = os.getenv("POST_PROMPT_URL")
 
-class MyAgent(AgentBase):
+# Customer data for the tools: the portal's store directly, or its API (AGENT_DATA_BACKEND)
+customer_backend = make_backend()
+
+# Spoken at once, instead of more silence, while the account system is known to be down
+ACCOUNTS_DOWN_MESSAGE = ("Our account system is not responding right now. Apologize to the caller, explain that "
+                         "their account cannot be looked up at the moment, and offer to help again in a few minutes.")
+PAYMENTS_DOWN_MESSAGE = ("Our payment system is not responding right now and no payment was taken. Apologize to the "
+                         "caller and ask them to try again in a few minutes.")
+
+def forward_summary(raw_data):
+    """POST a call's summary on to POST_PROMPT_URL"""
+    import requests
+
+    try:
+        requests.post(POST_PROMPT_URL, json=raw_data, timeout=10)
+    except requests.RequestException as e:
+        logging.warning("Could not forward the post-prompt summary to POST_PROMPT_URL: %s", e)
+
+def payment_transaction_id(call_id, account_number, amount):
+    """The same id for a retried process_payment in one call, so the ledger records it once"""
+    if not call_id:
+        return None
+    try:
+        amount = f"{float(amount):.2f}"
+    except (TypeError, ValueError):
+        amount = str(amount)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"max-electric:{call_id}:{account_number}:{amount}"))
+
+class MyAgent(SwmlCacheMixin, AgentBase):
     def __init__(self, config_file=None, **kwargs):
         super().__init__(
             name="max-electric-agent",
@@ -81,7 +119,15 @@ class MyAgent(AgentBase):
 
         self.set_post_prompt("Summarize the key points of this conversation including customer name, account number, payment amount, and confirmation status.")
 
-        self.set_post_prompt_url(POST_PROMPT_URL)
+        # The summary comes to this agent (on_summary), which passes it on to POST_PROMPT_URL
+
+    def on_summary(self, summary, raw_data=None):
+        """The post-prompt summary marks the end of a call: drop its cached tool results"""
+        if raw_data:
+            call_cache.end_call(raw_data.get('call_id'))
+            if POST_PROMPT_URL:
+                threading.Thread(target=forward_summary, args=(raw_data,), daemon=True).start()
+        super().on_summary(summary, raw_data)
         
     # SWAIG functions
     @AgentBase.tool(
@@ -95,31 +141,33 @@ class MyAgent(AgentBase):
         }
     )
     def get_customer_data(self, args, raw_data):
-        """Retrieve customer data from API and store in global_data"""
+        """Retrieve customer data from the customer backend and store in global_data"""
         account_number = args.get('account_number')
 
         if not account_number:
             return SwaigFunctionResult("Missing account number for customer data lookup")
         
-        try:
-            # Make API call to get customer data
-            response = requests.get(f"{NGROK_URL}/api/customer", params={'account_number': account_number})
-            
-            if response.status_code == 200:
-                customer_data = response.json()
-                
-                # Create result and set metadata
-                result = SwaigFunctionResult(f"Customer data retrieved and stored. Account holder: {customer_data.get('first_name', '')} {customer_data.get('last_name', '')}, Balance: ${customer_data.get('balance', 0)}")
-                
-                return result
-                
-            elif response.status_code == 404:
-                return SwaigFunctionResult("Account not found. Please verify the account number and try again.")
-            else:
+        # Repeat lookups within a call are answered from the per-call cache
+        call_id = raw_data.get('call_id')
+        customer_data = call_cache.get(call_id, 'get_customer_data', args)
+        if customer_data is None:
+            try:
+                customer_data = customer_backend.get_customer(account_number)
+            except CircuitOpen:
+                return SwaigFunctionResult(ACCOUNTS_DOWN_MESSAGE)
+            except ToolCallFailed:
                 return SwaigFunctionResult("Unable to retrieve customer data at this time. Please try again.")
-                
-        except Exception as e:
-            return SwaigFunctionResult("Error retrieving customer data. Please try again.")
+            except Exception:
+                return SwaigFunctionResult("Error retrieving customer data. Please try again.")
+
+            if customer_data is None:
+                return SwaigFunctionResult("Account not found. Please verify the account number and try again.")
+            call_cache.put(call_id, 'get_customer_data', args, customer_data, account_number=account_number)
+        
+        # Create result and set metadata
+        result = SwaigFunctionResult(f"Customer data retrieved and stored. Account holder: {customer_data.get('first_name', '')} {customer_data.get('last_name', '')}, Balance: ${customer_data.get('balance', 0)}")
+        
+        return result
 
     @AgentBase.tool(
         name="process_payment",
@@ -144,20 +192,34 @@ class MyAgent(AgentBase):
         if not account_number:
             return SwaigFunctionResult("Missing account number for payment processing")
 
+        # Lookups during the payment may read the old balance: none are cached until it is done
+        call_cache.begin_payment(account_number)
         try:
-            # Make API call to process payment
-            response = requests.post(f"{NGROK_URL}/payment-processor?account_number={account_number}", json={'chargeAmount': payment_amount})
-            
-            if response.status_code == 200:
-                return SwaigFunctionResult("Payment processed successfully")
-            else:
-                return SwaigFunctionResult("Payment processing failed. Please try again.")
-            
-        except Exception as e:
+            transaction_id = payment_transaction_id(raw_data.get('call_id'), account_number, payment_amount)
+            status = customer_backend.process_payment(account_number, payment_amount, transaction_id)
+        except CircuitOpen:
+            call_cache.end_payment(account_number)
+            return SwaigFunctionResult(PAYMENTS_DOWN_MESSAGE)
+        except BudgetExceeded:
+            # The portal may still record it (the account stays uncached for now): taking it again could charge twice
+            return SwaigFunctionResult("The payment is taking longer than usual to confirm. Tell the caller it may "
+                                       "still go through and will show on their account shortly; do not take it again.")
+        except (ToolCallFailed, ValueError):
+            return SwaigFunctionResult("Payment processing failed. Please try again.")
+        except Exception:
             return SwaigFunctionResult("Error processing payment. Please try again.")
+
+        if status != ACCEPTED:
+            # Committed (or refused): later lookups in any call see the new balance; a spooled one stays uncached
+            call_cache.end_payment(account_number)
+        if status == NOT_FOUND:
+            return SwaigFunctionResult("Payment processing failed. Please try again.")
+        return SwaigFunctionResult("Payment processed successfully")
             
 
 agent = MyAgent(config_file="config.json")
+startup.mark('agent init')
+startup.report()
 agent.run()
 
 
@@ -0,0 +1,146 @@
+"""
+Balance change notifications for Max Electric Payment Demo
+
+A single watcher thread per process follows every shard's payments ledger
+and pushes each account's new balance to the dashboards subscribed to it.
+It also drops the account from this process's customer cache first, so
+payments written by other workers, other processes' intake threads or the
+agent's local backend reach this worker's balance, ETag and dashboard.
+The payment writers wake the watcher right after they commit; payments
+committed by other processes are picked up by a cheap PRAGMA data_version
+check per shard, so idle dashboards cost no queries at all.
+"""
+import os
+import queue
+import sqlite3
+import threading
+
+import customers
+from config.production import Config
+from db import shards
+
+
+class Subscription:
+    """Mailbox for one connected dashboard; only the latest balance matters"""
+
+    def __init__(self, account_number, on_put=None):
+        self.account_number = account_number
+        self.on_put = on_put  # called (on the watcher thread) after each new balance
+        self._queue = queue.Queue(maxsize=1)
+
+    def put(self, balance):
+        try:
+            self._queue.put_nowait(balance)
+        except queue.Full:
+            # Replace the unread balance with the newer one
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(balance)
+        if self.on_put is not None:
+            self.on_put(self)
+
+    def get(self, timeout=None):
+        """Block until a new balance arrives; raises queue.Empty on timeout"""
+        return self._queue.get(timeout=timeout)
+
+
+class BalanceBroker:
+    """Fans ledger changes out to per-account subscriptions"""
+
+    def __init__(self, poll_interval=None):
+        self.poll_interval = poll_interval or Config.BALANCE_STREAM_POLL_INTERVAL
+        self._lock = threading.Lock()
+        self._subscribers = {}  # account_number -> set of Subscription
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def _start(self):
+        """Start the ledger watcher for this process"""
+        self._pid = os.getpid()
+        self._subscribers = {}
+        self._wakeup = threading.Event()
+
+        # Snapshot each shard's ledger position now so nothing committed
+        # after the first subscription is missed
+        positions = []
+        for pool in shards:
+            conn = pool.connect()
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM payments').fetchone()[0]
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            positions.append([conn, last_id, data_version])
+
+        thread = threading.Thread(target=self._watch, args=(positions,),
+                                  name='balance-watcher', daemon=True)
+        thread.start()
+
+    def ensure_started(self):
+        """Start following the ledger in this process, if not already"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+
+    def subscribe(self, account_number, on_put=None):
+        """Register a dashboard for balance updates on one account"""
+        self.ensure_started()
+        subscription = Subscription(account_number, on_put)
+        with self._lock:
+            self._subscribers.setdefault(account_number, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.account_number)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.account_number]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def notify(self):
+        """Wake the watcher after a local payment commit"""
+        self._wakeup.set()
+
+    def publish(self, account_number, balance):
+        with self._lock:
+            subscribers = list(self._subscribers.get(account_number, ()))
+        for subscription in subscribers:
+            subscription.put(balance)
+
+    def _watch(self, positions):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            for position in positions:
+                self._follow(position)
+
+    def _follow(self, position):
+        """Publish one shard's ledger entries past its last seen id"""
+        conn, last_id, data_version = position
+        try:
+            # data_version only moves when another connection commits
+            current_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if current_version == data_version:
+                return
+
+            rows = conn.execute('''
+                SELECT id, account_number, new_balance FROM payments
+                WHERE id > ? ORDER BY id
+            ''', (last_id,)).fetchall()
+        except sqlite3.Error:
+            # Try again on the next tick
+            return
+
+        position[2] = current_version
+        for row in rows:
+            position[1] = row['id']
+            customers.invalidate(row['account_number'])
+            self.publish(row['account_number'], row['new_balance'])
+
+
+broker = BalanceBroker()
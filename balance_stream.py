@@ -0,0 +1,192 @@
+"""
+Balance event streams for Max Electric Payment Demo
+
+An open dashboard keeps its balance stream for as long as the tab is open.
+Under gunicorn's gthread workers each of those would hold a request thread,
+so a few dozen dashboards would leave /payment-processor and the health
+checks queueing behind them. Streams are therefore served by a separate
+asyncio process, where each one is a coroutine:
+
+    uvicorn balance_stream:app --port 8081
+
+With BALANCE_STREAM_URL pointing at it, /api/balance/stream redirects the
+dashboard there with a signed token for its account (the session cookie is
+the portal's, not this process's). This process follows the ledger itself
+(balance_events), so it sees payments from every portal worker, the intake
+threads and the agent.
+
+Each process holds at most BALANCE_STREAM_MAX streams. Without a stream
+process (e.g. the development server) the portal streams from its own
+request threads, at most half of SERVER_THREADS at a time. Beyond either
+cap the answer is 503 and the dashboard falls back to polling /api/balance.
+"""
+import asyncio
+import json
+import queue
+import threading
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+import balance_events
+import customers
+from config.production import Config
+
+RETRY_MS = 5000  # EventSource reconnect delay
+TOKEN_SALT = 'balance-stream'
+
+
+def balance_event(balance):
+    return f"event: balance\ndata: {json.dumps({'balance': float(balance or 0.0)})}\n\n".encode()
+
+
+def first_event(balance):
+    return f"retry: {RETRY_MS}\n".encode() + balance_event(balance)
+
+
+def stream_token(account_number):
+    """Signed, expiring proof that the bearer is logged in to this account"""
+    return URLSafeTimedSerializer(Config.SECRET_KEY, salt=TOKEN_SALT).dumps(account_number)
+
+
+def account_for(token):
+    """The account a stream token was issued for, or None if it is forged or expired"""
+    try:
+        return URLSafeTimedSerializer(Config.SECRET_KEY, salt=TOKEN_SALT).loads(
+            token, max_age=Config.PERMANENT_SESSION_LIFETIME)
+    except BadSignature:
+        return None
+
+
+class ThreadedStreams:
+    """Caps the streams the portal serves from its own request threads"""
+
+    def __init__(self, limit=None):
+        self.limit = limit or max(Config.SERVER_THREADS // 2, 1)
+        self._lock = threading.Lock()
+        self.open = 0
+        self.rejected = 0
+
+    def admit(self):
+        """Whether one more stream may hold a request thread; release() when it ends"""
+        with self._lock:
+            if self.open >= self.limit:
+                self.rejected += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+class StreamServer:
+    """ASGI app serving GET /balance/stream?token=... and GET /healthz"""
+
+    def __init__(self, max_streams=None, keepalive=None):
+        self.max_streams = max_streams or Config.BALANCE_STREAM_MAX
+        self.keepalive = keepalive or Config.BALANCE_STREAM_KEEPALIVE
+        self.open = 0
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if scope['path'] == '/healthz':
+            await self._respond(send, 200, json.dumps(self.stats()), 'application/json')
+            return
+        if scope['path'] != '/balance/stream' or scope['method'] != 'GET':
+            await self._respond(send, 404, 'Not found')
+            return
+
+        token = parse_qs(scope['query_string'].decode('latin-1')).get('token', [''])[0]
+        account_number = account_for(token)
+        if account_number is None:
+            await self._respond(send, 403, 'Invalid or expired stream token')
+            return
+        if self.open >= self.max_streams:
+            self.rejected += 1
+            await self._respond(send, 503, 'Too many open balance streams', headers=[(b'retry-after', b'30')])
+            return
+
+        self.open += 1
+        try:
+            await self._stream(account_number, receive, send)
+        finally:
+            self.open -= 1
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                balance_events.broker.ensure_started()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _respond(self, send, status, body, content_type='text/plain', headers=()):
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', content_type.encode()), (b'access-control-allow-origin', b'*'), *headers]})
+        await send({'type': 'http.response.body', 'body': body.encode()})
+
+    async def _stream(self, account_number, receive, send):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        # Subscribe before reading so a payment in between is not lost
+        subscription = balance_events.broker.subscribe(
+            account_number, on_put=lambda subscription: loop.call_soon_threadsafe(ready.set))
+        hung_up = asyncio.ensure_future(self._hung_up(receive))
+        try:
+            customer = await asyncio.to_thread(customers.get_customer_by_account, account_number)
+            if not customer:
+                await self._respond(send, 404, 'Customer not found')
+                return
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # don't let a fronting proxy buffer events
+                # The token authenticates, not cookies, so any origin may read the stream
+                (b'access-control-allow-origin', b'*'),
+            ]})
+            await self._send(send, first_event(customer['balance']))
+
+            while True:
+                woken = asyncio.ensure_future(ready.wait())
+                done, _ = await asyncio.wait({woken, hung_up}, timeout=self.keepalive,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if hung_up in done:
+                    woken.cancel()
+                    return
+                if woken not in done:
+                    woken.cancel()
+                    await self._send(send, b": keep-alive\n\n")
+                    continue
+                ready.clear()
+                try:
+                    balance = subscription.get(timeout=0)
+                except queue.Empty:
+                    continue
+                await self._send(send, balance_event(balance))
+        finally:
+            hung_up.cancel()
+            balance_events.broker.unsubscribe(subscription)
+
+    async def _send(self, send, data):
+        await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+    async def _hung_up(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    def stats(self):
+        return {'streams': self.open, 'max_streams': self.max_streams, 'rejected': self.rejected,
+                'subscribers': balance_events.broker.subscriber_count()}
+
+
+threaded = ThreadedStreams()
+app = StreamServer()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+SWAIG tool data latency: local vs HTTP customer backend
+
+Starts the portal under gunicorn on a fresh database, then times the calls
+the agent's tools make (get_customer for get_customer_data, process_payment
+for the simple agent's process_payment) through customer_backend's
+LocalBackend (direct SQLite) and HttpBackend (the portal's API on
+localhost). Add --url to also time the HTTP backend through a public URL
+such as the ngrok tunnel, which is what split deployments pay per call.
+
+Usage: python3 benchmarks/bench_agent_backend.py [--calls 500] [--workers 2] [--url https://....ngrok.app]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ACCOUNTS = ['12345', '20000', '20001', '20002', '20003', '20004', '20005', '20006']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_portal(workdir, workers):
+    """Run gunicorn on the benchmark database; returns (process, base_url) once /readyz answers"""
+    port = free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), LOG_TO_STDERR='false',
+               PORTAL_LOG_FILE=os.path.join(workdir, 'portal.log'), METRICS_DIR=os.path.join(workdir, 'metrics'))
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', 'app:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/readyz', timeout=1) as response:
+                if response.status == 200:
+                    return server, base_url
+        except OSError:
+            time.sleep(0.05)
+    server.terminate()
+    sys.exit("portal did not become ready")
+
+
+def timed(call, calls):
+    """p50/p99/mean in ms over `calls` sequential calls (a tool call is one at a time)"""
+    samples = []
+    for index in range(calls):
+        start = time.perf_counter()
+        call(index)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    pick = lambda pct: samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000
+    return pick(50), pick(99), sum(samples) / len(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=500, help='calls per backend and tool')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--url', help='also time the http backend against this portal URL')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='max-electric-agent-backend-')
+    # Set before anything reads Config, so both backends share the benchmark database
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'customer.db')
+
+    server, base_url = start_portal(workdir, args.workers)
+    try:
+        from customer_backend import HttpBackend, LocalBackend
+
+        backends = [('local', LocalBackend()), ('http localhost', HttpBackend(base_url))]
+        if args.url:
+            backends.append(('http ' + args.url, HttpBackend(args.url)))
+
+        print(f"{args.calls} sequential calls per tool; portal: gunicorn x{args.workers}, {os.cpu_count()} CPU(s)")
+        print(f"{'backend':<28}{'tool':<20}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}")
+        for label, backend in backends:
+            # One untimed call each opens connections and warms caches
+            backend.get_customer(ACCOUNTS[0])
+            tools = (
+                ('get_customer_data', lambda index: backend.get_customer(ACCOUNTS[index % len(ACCOUNTS)])),
+                ('process_payment', lambda index: backend.process_payment(
+                    ACCOUNTS[index % len(ACCOUNTS)], 0.01, str(uuid.uuid4()), 'credit-card')),
+            )
+            for tool, call in tools:
+                p50, p99, mean = timed(call, args.calls)
+                print(f"{label:<28}{tool:<20}{p50:>9.2f}{p99:>9.2f}{mean:>9.2f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
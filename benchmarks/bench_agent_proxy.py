@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Latency added by the /agent reverse proxy
+
+Starts a stub agent service and the portal on local ports, then compares
+p50/p99 latency of requests sent straight to the stub with the same requests
+sent through the portal's /agent route.
+
+Usage: python3 benchmarks/bench_agent_proxy.py [--requests 2000] [--body-kb 16]
+"""
+import argparse
+import http.client
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class StubAgent(BaseHTTPRequestHandler):
+    """Answers every request with a fixed SWML-sized JSON document"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    payload = b'{}'
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server.server_address[1]
+
+
+def measure(port, total, body):
+    """Send `total` POSTs over one keep-alive connection and return sorted latencies"""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    latencies = []
+    for _ in range(total):
+        start = time.perf_counter()
+        conn.request('POST', '/agent', body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        assert response.status == 200, response.status
+    conn.close()
+    return sorted(latencies)
+
+
+def pct(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--body-kb', type=int, default=16, help='size of the stub SWML response')
+    args = parser.parse_args()
+
+    StubAgent.payload = b'{"swml": "' + b'x' * (args.body_kb * 1024) + b'"}'
+    stub_port = serve(ThreadingHTTPServer(('127.0.0.1', 0), StubAgent))
+
+    os.environ['AGENT_UPSTREAM_URL'] = f'http://127.0.0.1:{stub_port}'
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='max-electric-bench-'), 'customer.db')
+    from werkzeug.serving import make_server
+    import app as portal
+
+    portal.app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    portal_port = serve(make_server('127.0.0.1', 0, portal.app, threaded=True))
+
+    request_body = b'{"call_id": "bench"}'
+    measure(stub_port, 50, request_body)
+    measure(portal_port, 50, request_body)
+    direct = measure(stub_port, args.requests, request_body)
+    proxied = measure(portal_port, args.requests, request_body)
+
+    print(f"POST /agent x {args.requests}, {args.body_kb} KB response")
+    print(f"  {'':12} {'p50 ms':>10} {'p99 ms':>10}")
+    print(f"  {'direct':12} {pct(direct, 50):10.3f} {pct(direct, 99):10.3f}")
+    print(f"  {'via portal':12} {pct(proxied, 50):10.3f} {pct(proxied, 99):10.3f}")
+    print(f"  {'added':12} {pct(proxied, 50) - pct(direct, 50):10.3f} {pct(proxied, 99) - pct(direct, 99):10.3f}")
+    print(f"  upstream latency recorded by proxy: {portal.agent_proxy.latency.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for /api/customer: per-request connections vs the shared pool
+
+Usage: python3 benchmarks/bench_api_customer.py [--requests 5000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Point the app at a throwaway database before it is imported
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='max-electric-bench-'), 'customer.db')
+
+import app as portal  # noqa: E402
+from db import shards  # noqa: E402
+
+
+class PerRequestConnections:
+    """The pre-pool behaviour: open and close a connection for every request"""
+
+    def __init__(self, database):
+        self.database = database
+
+    def acquire(self):
+        conn = sqlite3.connect(self.database)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def release(self, conn):
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+
+def run(client, total):
+    """Issue `total` lookups and return requests/sec"""
+    accounts = ['12345', '20000', '20005', '20009']
+    start = time.perf_counter()
+    for i in range(total):
+        response = client.get('/api/customer', query_string={'account_number': accounts[i % len(accounts)]})
+        assert response.status_code == 200, response.status_code
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    portal.app.logger.disabled = True
+    portal.init_db()
+    client = portal.app.test_client()
+    # Measure the database, not the customer cache
+    portal.customers.cache.maxsize = 0
+    pooled = shards.pools
+
+    shards.pools = [PerRequestConnections(pool.database) for pool in pooled]
+    run(client, 100)
+    before = run(client, args.requests)
+
+    shards.pools = pooled
+    run(client, 100)
+    after = run(client, args.requests)
+
+    print(f"/api/customer x {args.requests}")
+    print(f"  per-request connection: {before:10.1f} req/s")
+    print(f"  pooled connection:      {after:10.1f} req/s")
+    print(f"  speedup:                {after / before:10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Repeated get_customer_data lookups within one call: per-call cache vs backend
+
+Replays the lookup pattern of one conversation (first lookup, a PIN retry,
+the check before get_payment, ...) for many simulated calls, timing the
+data step of get_customer_data with call_cache in front of each
+customer_backend, as the agent does, and without it.
+
+Usage: python3 benchmarks/bench_call_cache.py [--calls 200] [--lookups 4] [--workers 2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_agent_backend import ACCOUNTS, start_portal
+
+
+def lookup(cache, backend, call_id, args):
+    """The data step of the agent's get_customer_data"""
+    customer = cache.get(call_id, 'get_customer_data', args) if cache else None
+    if customer is None:
+        customer = backend.get_customer(args['account_number'])
+        if cache:
+            cache.put(call_id, 'get_customer_data', args, customer, account_number=args['account_number'])
+    return customer
+
+
+def replay(cache, backend, calls, lookups):
+    """Per-lookup times in µs: (first lookup of each call, repeats)"""
+    first, repeats = [], []
+    for index in range(calls):
+        call_id = str(uuid.uuid4())
+        args = {'account_number': ACCOUNTS[index % len(ACCOUNTS)]}
+        for attempt in range(lookups):
+            start = time.perf_counter()
+            lookup(cache, backend, call_id, args)
+            (repeats if attempt else first).append((time.perf_counter() - start) * 1e6)
+        if cache:
+            cache.end_call(call_id)
+    return first, repeats
+
+
+def median(samples):
+    return sorted(samples)[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200, help='simulated calls')
+    parser.add_argument('--lookups', type=int, default=4, help='get_customer_data calls per call')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='max-electric-call-cache-')
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'customer.db')
+
+    server, base_url = start_portal(workdir, args.workers)
+    try:
+        from call_cache import CallCache
+        from customer_backend import HttpBackend, LocalBackend
+
+        print(f"{args.calls} calls x {args.lookups} get_customer_data lookups each")
+        print(f"{'backend':<16}{'cache':<8}{'first µs':>10}{'repeat µs':>11}")
+        for label, backend in (('local', LocalBackend()), ('http localhost', HttpBackend(base_url))):
+            backend.get_customer(ACCOUNTS[0])
+            for cache in (None, CallCache(ttl=300)):
+                first, repeats = replay(cache, backend, args.calls, args.lookups)
+                print(f"{label:<16}{'on' if cache else 'off':<8}{median(first):>10.1f}{median(repeats):>11.1f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Pay callback acknowledgement latency: synchronous vs spooled intake
+
+Drives /payment-processor from several threads while a background
+connection periodically holds the customer database's write lock (a
+checkpoint, backup or slow writer), and reports how long the Pay verb waits
+for its answer in each PAYMENT_INTAKE_MODE, plus how long spooled payments
+took to reach the ledger.
+
+Usage: python3 benchmarks/bench_intake.py [--payments 2000] [--threads 16] [--stall-ms 200] [--stall-every 1.0]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ACCOUNTS = ['12345', '20000', '20001', '20002', '20003', '20004', '20005', '20006']
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda pct: samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000
+    return {'p50_ms': round(pick(50), 2), 'p99_ms': round(pick(99), 2), 'max_ms': round(samples[-1] * 1000, 2)}
+
+
+def run_child(mode, payments, threads, stall_ms, stall_every):
+    workdir = tempfile.mkdtemp(prefix='max-electric-intake-')
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'customer.db')
+    os.environ['PAYMENT_INTAKE_MODE'] = mode
+
+    import logging
+
+    import app as portal
+    import payment_intake
+    from db import shards
+
+    portal.app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    portal.init_db()
+    payment_intake.intake.recover()
+    if mode == 'async':
+        payment_intake.intake.ensure_started()
+
+    done = threading.Event()
+
+    def stall():
+        conn = shards.pools[0].connect()
+        while not done.wait(stall_every):
+            conn.execute('BEGIN IMMEDIATE')
+            time.sleep(stall_ms / 1000)
+            conn.rollback()
+
+    staller = threading.Thread(target=stall, daemon=True)
+    staller.start()
+
+    local = threading.local()
+
+    def send(index):
+        if not hasattr(local, 'client'):
+            local.client = portal.app.test_client()
+        start = time.perf_counter()
+        response = local.client.post(
+            '/payment-processor',
+            query_string={'account_number': ACCOUNTS[index % len(ACCOUNTS)]},
+            json={'chargeAmount': '0.01', 'transaction_id': str(uuid.uuid4()), 'method': 'credit-card'},
+        )
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(send, range(payments)))
+    acknowledged = time.perf_counter() - start
+
+    if mode == 'async':
+        while payment_intake.intake.pending():
+            time.sleep(0.05)
+    applied = time.perf_counter() - start
+    done.set()
+
+    result = {'mode': mode, 'acknowledged_s': round(acknowledged, 2), 'applied_s': round(applied, 2)}
+    result.update(percentiles(latencies))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--payments', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stall-ms', type=float, default=200, help='how long each stall holds the write lock')
+    parser.add_argument('--stall-every', type=float, default=1.0, help='seconds between stalls')
+    parser.add_argument('--child', choices=('sync', 'async'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.payments, args.threads, args.stall_ms, args.stall_every)))
+        return
+
+    print(f"{args.payments} callbacks on {args.threads} threads; {args.stall_ms:g} ms write stall "
+          f"every {args.stall_every:g}s")
+    print(f"{'mode':<8}{'ack p50 ms':>12}{'ack p99 ms':>12}{'ack max ms':>12}{'all acked s':>13}{'all applied s':>15}")
+    for mode in ('sync', 'async'):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', mode, '--payments', str(args.payments),
+             '--threads', str(args.threads), '--stall-ms', str(args.stall_ms), '--stall-every', str(args.stall_every)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{r['mode']:<8}{r['p50_ms']:>12}{r['p99_ms']:>12}{r['max_ms']:>12}{r['acknowledged_s']:>13}"
+              f"{r['applied_s']:>15}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Request-thread overhead of logging: synchronous RotatingFileHandler vs the
+queue-based pipeline in async_logging.py
+
+Usage: python3 benchmarks/bench_logging.py [--records 100000] [--threads 8]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from async_logging import configure_logging, wait_for_drain  # noqa: E402
+
+FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+
+def hammer(logger, records, threads):
+    """Log `records` lines from `threads` threads; return mean microseconds per call"""
+    per_thread = records // threads
+
+    def work():
+        for i in range(per_thread):
+            logger.info("Customer data request for account: %s", 20000 + i % 10)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e6
+
+
+def fresh_logger(name):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.handlers.clear()
+    return logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix='max-electric-bench-')
+
+    logger = fresh_logger('bench.sync')
+    handler = RotatingFileHandler(os.path.join(directory, 'sync.log'), maxBytes=10240000, backupCount=10)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    sync_us = hammer(logger, args.records, args.threads)
+
+    results = [('RotatingFileHandler (sync)', sync_us, None)]
+    for label, options in [
+        ('queue pipeline', {}),
+        ('queue pipeline, JSON lines', {'json_lines': True}),
+        ('queue pipeline, 10% sampled', {'message_rates': {'Customer data request': 0.1}}),
+    ]:
+        logger = fresh_logger(f'bench.{label}')
+        queue_handler = configure_logging(logger, os.path.join(directory, f'{len(results)}.log'),
+                                          queue_size=args.records, **options)
+        caller_us = hammer(logger, args.records, args.threads)
+        start = time.perf_counter()
+        wait_for_drain(queue_handler, timeout=60)
+        drain_s = time.perf_counter() - start
+        results.append((label, caller_us, (queue_handler.dropped, drain_s)))
+
+    print(f"{args.records} records from {args.threads} threads")
+    print(f"  {'':32} {'us/call':>9}")
+    for label, us, extra in results:
+        suffix = f"  (dropped {extra[0]}, drained {extra[1]:.2f}s after)" if extra else ''
+        print(f"  {label:32} {us:9.2f}{suffix}")
+
+
+if __name__ == '__main__':
+    main()
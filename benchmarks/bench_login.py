@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Mixed login / payment benchmark: inline password hashing vs the hashing pool
+
+A set of threads logs in continuously while another set sends Pay callbacks
+to /payment-processor. Payment latency and login throughput are reported
+with password checks run on the request thread and in the process pool.
+
+Usage: python3 benchmarks/bench_login.py [--seconds 10] [--login-threads 8] [--payment-threads 4]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='max-electric-bench-'), 'customer.db')
+
+import app as portal  # noqa: E402
+from passwords import PasswordHasher  # noqa: E402
+
+USERNAMES = ['johnsmith', 'alicej', 'bobwilliams', 'charlieb']
+ACCOUNTS = ['12345', '20000', '20001', '20002']
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000 if samples else 0.0
+
+
+def run(seconds, login_threads, payment_threads):
+    stop = threading.Event()
+    logins = {'ok': 0, 'busy': 0}
+    payment_latency = []
+    lock = threading.Lock()
+
+    def log_in():
+        client = portal.app.test_client()
+        rng = random.Random()
+        while not stop.is_set():
+            response = client.post('/login', data={'username': rng.choice(USERNAMES), 'password': 'signalwire_rocks'})
+            with lock:
+                assert response.status_code in (302, 503), response.status_code
+                logins['ok' if response.status_code == 302 else 'busy'] += 1
+
+    def pay():
+        client = portal.app.test_client()
+        rng = random.Random()
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.post('/payment-processor', query_string={'account_number': rng.choice(ACCOUNTS)},
+                                   json={'chargeAmount': '0.01', 'transaction_id': str(uuid.uuid4())})
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.status_code
+            with lock:
+                payment_latency.append(elapsed)
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=log_in) for _ in range(login_threads)]
+    threads += [threading.Thread(target=pay) for _ in range(payment_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'logins_per_sec': logins['ok'] / seconds,
+        'logins_rejected': logins['busy'],
+        'payments': len(payment_latency),
+        'payment_p50_ms': percentile(payment_latency, 50),
+        'payment_p99_ms': percentile(payment_latency, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--login-threads', type=int, default=8)
+    parser.add_argument('--payment-threads', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='hashing processes for the pooled run')
+    args = parser.parse_args()
+
+    portal.app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    portal.init_db()
+
+    print(f"{'mode':<14}{'logins/s':>10}{'rejected':>10}{'payments':>10}{'pay p50 ms':>12}{'pay p99 ms':>12}")
+    for mode, workers in (('inline', 0), (f'pool x{args.workers}', args.workers)):
+        portal.password_hasher = PasswordHasher(workers=workers)
+        if workers:
+            portal.password_hasher.verify(portal.generate_password_hash('warm-up'), 'warm-up')
+        result = run(args.seconds, args.login_threads, args.payment_threads)
+        print(f"{mode:<14}{result['logins_per_sec']:>10.1f}{result['logins_rejected']:>10}{result['payments']:>10}"
+              f"{result['payment_p50_ms']:>12.2f}{result['payment_p99_ms']:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Concurrent stress benchmark for /payment-processor
+
+Fires thousands of parallel Pay callbacks (including retried transaction_ids)
+at the payment endpoint, then checks that no update was lost or applied twice.
+
+Usage: python3 benchmarks/bench_payments.py [--payments 5000] [--threads 32]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='max-electric-bench-'), 'customer.db')
+
+import app as portal  # noqa: E402
+from db import shards  # noqa: E402
+
+ACCOUNTS = ['12345', '20000', '20001', '20002']
+
+
+def balances():
+    found = {}
+    for account_number in ACCOUNTS:
+        with shards.connection(account_number) as conn:
+            found[account_number] = conn.execute(
+                'SELECT balance FROM customer WHERE account_number = ?', (account_number,)).fetchone()[0]
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--payments', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--retry-rate', type=float, default=0.2, help='fraction of callbacks sent twice')
+    args = parser.parse_args()
+
+    portal.app.logger.disabled = True
+    portal.init_db()
+    before = balances()
+
+    rng = random.Random(42)
+    payments = [(rng.choice(ACCOUNTS), rng.randint(1, 500) / 100, str(uuid.uuid4())) for _ in range(args.payments)]
+    callbacks = payments + [p for p in payments if rng.random() < args.retry_rate]
+    rng.shuffle(callbacks)
+
+    local = threading.local()
+
+    def send(payment):
+        if not hasattr(local, 'client'):
+            local.client = portal.app.test_client()
+        account_number, amount, transaction_id = payment
+        response = local.client.post(
+            '/payment-processor',
+            query_string={'account_number': account_number},
+            json={'chargeAmount': str(amount), 'transaction_id': transaction_id},
+        )
+        return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        statuses = list(executor.map(send, callbacks))
+    elapsed = time.perf_counter() - start
+
+    after = balances()
+    expected = dict(before)
+    for account_number, amount, _ in payments:
+        expected[account_number] -= amount
+
+    errors = len([s for s in statuses if s != 200])
+    drift = {a: round(after[a] - expected[a], 6) for a in ACCOUNTS if abs(after[a] - expected[a]) > 1e-6}
+    recorded = 0
+    for pool in shards:
+        with pool.connection() as conn:
+            recorded += conn.execute('SELECT COUNT(*) FROM payments').fetchone()[0]
+
+    print(f"{len(callbacks)} callbacks ({len(payments)} unique) on {args.threads} threads")
+    print(f"  throughput:       {len(callbacks) / elapsed:10.1f} callbacks/s")
+    print(f"  errors:           {errors:10d}")
+    print(f"  payments stored:  {recorded:10d}")
+    print(f"  balance drift:    {drift or 'none':>10}")
+
+    if errors or drift or recorded != len(payments):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
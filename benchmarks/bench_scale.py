@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Scale benchmark: key portal routes at growing customer counts
+
+For each dataset size a fresh database is bulk-loaded with seed.py in a child
+process, and login, dashboard, /api/customer, /admin/users (one page, and the
+full NDJSON stream) and /payment-processor are driven through Flask's test
+client. Each route reports p50/p95/p99 latency and the peak Python allocation
+while it ran; each size reports the process's peak RSS.
+
+Usage: python3 benchmarks/bench_scale.py [--sizes 1000,100000,1000000] [--requests 500] [--json out.json]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda pct: samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000
+    return {'p50_ms': round(pick(50), 3), 'p95_ms': round(pick(95), 3), 'p99_ms': round(pick(99), 3)}
+
+
+def peak_rss_kb():
+    """VmHWM from /proc, or None where it is unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def drain(response):
+    """Consume a streamed body without keeping it"""
+    for _ in response.response:
+        pass
+    response.close()
+    return response
+
+
+def measure(name, iterations, request):
+    """Time `iterations` calls of request(i), tracking the peak allocation"""
+    tracemalloc.start()
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        response = request(i)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code < 500, f"{name} returned {response.status_code}"
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {'route': name, 'requests': iterations, 'peak_alloc_kb': peak // 1024}
+    result.update(percentiles(samples))
+    return result
+
+
+def run_child(size, requests):
+    """Load `size` customers into a throwaway database and benchmark the routes"""
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='max-electric-scale-'), 'customer.db')
+
+    import logging
+    from werkzeug.security import generate_password_hash
+
+    import app as portal
+    import seed
+    from db import shards
+
+    portal.app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    portal.init_db()
+
+    load_start = time.perf_counter()
+    seed.bulk_load(shards, size, generate_password_hash("signalwire_rocks"))
+    load_seconds = time.perf_counter() - load_start
+
+    sample = []
+    for pool in shards:
+        with pool.connection() as conn:
+            sample += [tuple(row) for row in conn.execute(
+                'SELECT account_number, username FROM customer ORDER BY random() LIMIT ?', (1000 // len(shards),))]
+
+    rng = random.Random(size)
+    client = portal.app.test_client()
+    client.post('/login', data={'username': sample[0][1], 'password': 'signalwire_rocks'})
+
+    routes = [
+        # Password hashing dominates login, so it gets fewer iterations
+        measure('POST /login', max(10, requests // 20), lambda i: portal.app.test_client().post(
+            '/login', data={'username': rng.choice(sample)[1], 'password': 'signalwire_rocks'})),
+        measure('GET /dashboard', requests, lambda i: client.get('/dashboard')),
+        measure('GET /api/customer', requests, lambda i: client.get(
+            '/api/customer', query_string={'account_number': rng.choice(sample)[0]})),
+        measure('GET /admin/users', requests, lambda i: client.get(
+            '/admin/users', query_string={'after': rng.choice(sample)[0]})),
+        measure('GET /admin/users stream', 3, lambda i: drain(client.get('/admin/users?stream=1', buffered=False))),
+        measure('POST /payment-processor', requests, lambda i: client.post(
+            '/payment-processor', query_string={'account_number': rng.choice(sample)[0]},
+            json={'chargeAmount': '1.00', 'transaction_id': str(uuid.uuid4()), 'method': 'credit-card'})),
+    ]
+
+    return {
+        'customers': size,
+        'load_seconds': round(load_seconds, 2),
+        'shards': len(shards),
+        'database_mb': round(sum(os.path.getsize(pool.database) for pool in shards) / 1024 / 1024, 1),
+        'peak_rss_kb': peak_rss_kb(),
+        'routes': routes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000,1000000', help='comma-separated customer counts')
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_child(args.child, args.requests)))
+        return
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        # A fresh process per size keeps caches and peak RSS independent
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', str(size), '--requests', str(args.requests)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+
+        print(f"\n{size:,} customers (loaded in {result['load_seconds']}s, "
+              f"{result['database_mb']} MB, peak RSS {result['peak_rss_kb']} kB)")
+        print(f"  {'route':<26}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak alloc kB':>16}")
+        for route in result['routes']:
+            print(f"  {route['route']:<26}{route['p50_ms']:>10}{route['p95_ms']:>10}"
+                  f"{route['p99_ms']:>10}{route['peak_alloc_kb']:>16}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
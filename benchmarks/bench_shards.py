@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Payment throughput at different shard counts
+
+For each shard count a fresh store is bulk-loaded with seed.py, then several
+forked worker processes (standing in for gunicorn workers), each with a
+number of request threads, call apply_payment() on random accounts for a
+fixed time. Reports committed payments/s and checks that every reported
+payment is in a ledger.
+
+Usage: python3 benchmarks/bench_shards.py [--shards 1,2,4,8] [--workers 4] [--threads 16] [--duration 10]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def drive(accounts, threads, duration):
+    """Pay random accounts from `threads` threads for `duration` seconds; returns the count applied"""
+    from payments import APPLIED, apply_payment
+
+    applied = [0] * threads
+    deadline = time.monotonic() + duration
+
+    def loop(slot):
+        rng = random.Random(os.getpid() * 1000 + slot)
+        while time.monotonic() < deadline:
+            result = apply_payment(rng.choice(accounts), 0.01, str(uuid.uuid4()), 'credit-card')
+            if result.status == APPLIED:
+                applied[slot] += 1
+
+    workers = [threading.Thread(target=loop, args=(slot,)) for slot in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(applied)
+
+
+def run_child(count, customers, workers, threads, duration):
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='max-electric-shards-'), 'customer.db')
+    os.environ['SHARD_COUNT'] = str(count)
+
+    import logging
+    from werkzeug.security import generate_password_hash
+
+    import app as portal
+    import seed
+    from db import shards
+
+    portal.app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    portal.init_db(sample_data=False)
+    seed.bulk_load(shards, customers, generate_password_hash('signalwire_rocks'))
+    accounts = [str(seed.FIRST_ACCOUNT_NUMBER + offset) for offset in range(customers)]
+    shards.close()
+
+    context = multiprocessing.get_context('fork')
+    start = time.perf_counter()
+    with context.Pool(workers) as pool:
+        applied = sum(pool.starmap(drive, [(accounts, threads, duration)] * workers))
+    elapsed = time.perf_counter() - start
+
+    recorded = 0
+    for shard in shards:
+        with shard.connection() as conn:
+            recorded += conn.execute('SELECT COUNT(*) FROM payments').fetchone()[0]
+
+    return {
+        'shards': count,
+        'payments': applied,
+        'recorded': recorded,
+        'payments_per_second': round(applied / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', default='1,2,4,8', help='comma-separated shard counts')
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=4, help='worker processes')
+    parser.add_argument('--threads', type=int, default=16, help='request threads per worker')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per shard count')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_child(args.child, args.customers, args.workers, args.threads, args.duration)))
+        return
+
+    print(f"{args.workers} workers x {args.threads} threads, {args.duration:g}s per run, "
+          f"{args.customers:,} customers, {os.cpu_count()} CPU(s)")
+    print(f"{'shards':>8}{'payments/s':>14}{'scaling':>10}{'lost':>8}")
+    baseline = None
+    for count in (int(s) for s in args.shards.split(',')):
+        # A fresh process per shard count keeps writer threads and pools independent
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', str(count), '--customers', str(args.customers),
+             '--workers', str(args.workers), '--threads', str(args.threads), '--duration', str(args.duration)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        baseline = baseline or result['payments_per_second']
+        print(f"{count:>8}{result['payments_per_second']:>14}{result['payments_per_second'] / baseline:>9.2f}x"
+              f"{result['payments'] - result['recorded']:>8}")
+
+
+if __name__ == '__main__':
+    main()
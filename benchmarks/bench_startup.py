@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the portal (and the agent, where its SDK is installed)
+
+Measures, over several fresh interpreter runs:
+  - importing app.py
+  - init_db() on a new database and on an existing one
+  - gunicorn start until /readyz answers (what a container restart waits for)
+  - importing atom_agent-<type>.py's dependencies and constructing MyAgent
+and lists the slowest imports from `python -X importtime`.
+
+Record a baseline once, then compare later runs against it:
+  python3 benchmarks/bench_startup.py --record benchmarks/startup_baseline.json
+  python3 benchmarks/bench_startup.py --compare benchmarks/startup_baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PORTAL_IMPORT = "import app"
+PORTAL_INIT = "import app; app.init_db()"
+# Constructs the agent without serving: everything up to agent.run()
+AGENT_INIT = (
+    "import sys, runpy; sys.argv = ['atom_agent']\n"
+    "import signalwire_agents\n"
+    "signalwire_agents.AgentBase.run = lambda self, *a, **k: None\n"
+    "runpy.run_path('atom_agent-{kind}.py', run_name='__main__')\n"
+)
+
+
+def environment(database):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_PATH': database,
+        'PORTAL_LOG_FILE': os.path.join(os.path.dirname(database), 'portal.log'),
+        'LOG_TO_STDERR': 'false',
+        'METRICS_DIR': os.path.join(os.path.dirname(database), 'metrics'),
+        'TEMPLATE_BYTECODE_CACHE_DIR': os.path.join(os.path.dirname(database), 'jinja'),
+    })
+    return env
+
+
+def time_python(code, env, runs):
+    """Median wall time in ms of fresh `python -c code` runs, or None if it fails"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            return None
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 1)
+
+
+def slowest_imports(code, env, count=15):
+    """Top imports by cumulative time (ms) from -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, _, rest = line.partition(':')
+        _, cumulative, name = (part.strip() for part in rest.split('|'))
+        if not name.startswith(' ') and '.' not in name.strip():
+            rows.append((name.strip(), int(cumulative) / 1000))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return [{'module': name, 'cumulative_ms': round(ms, 1)} for name, ms in rows[:count]]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_gunicorn_ready(env, runs, workers):
+    """Median ms from launching gunicorn to the first 200 from /readyz"""
+    if not shutil.which('gunicorn'):
+        return None
+    samples = []
+    for _ in range(runs):
+        port = free_port()
+        env = dict(env, WEB_CONCURRENCY=str(workers))
+        start = time.perf_counter()
+        server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', 'app:app'],
+                                  cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while time.perf_counter() - start < 60:
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/readyz', timeout=1) as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    time.sleep(0.01)
+            samples.append((time.perf_counter() - start) * 1000)
+        finally:
+            server.terminate()
+            server.wait()
+    return round(statistics.median(samples), 1)
+
+
+def measure(runs, workers, agent_kind):
+    workdir = tempfile.mkdtemp(prefix='max-electric-startup-')
+    env = environment(os.path.join(workdir, 'customer.db'))
+
+    results = {
+        'python': platform.python_version(),
+        'machine': f"{platform.machine()} x{os.cpu_count()}",
+        'portal_import_ms': time_python(PORTAL_IMPORT, env, runs),
+    }
+    # First run creates and seeds the database; later ones find it initialized
+    fresh = []
+    for _ in range(runs):
+        fresh_env = environment(os.path.join(tempfile.mkdtemp(prefix='max-electric-startup-'), 'customer.db'))
+        fresh.append(time_python(PORTAL_INIT, fresh_env, 1))
+    results['portal_init_new_db_ms'] = round(statistics.median(fresh), 1)
+    results['portal_init_existing_db_ms'] = time_python(PORTAL_INIT, env, runs)
+    results['gunicorn_ready_ms'] = time_gunicorn_ready(env, runs, workers)
+    results['agent_init_ms'] = time_python(AGENT_INIT.format(kind=agent_kind), env, runs)
+    results['portal_slowest_imports'] = slowest_imports(PORTAL_IMPORT, env)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers for the readiness timing')
+    parser.add_argument('--agent', default='advanced', choices=('advanced', 'simple'))
+    parser.add_argument('--record', help='write the results to this baseline file')
+    parser.add_argument('--compare', help='compare against this baseline file')
+    args = parser.parse_args()
+
+    results = measure(args.runs, args.workers, args.agent)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print(f"{'measurement':<30}{'ms':>10}" + (f"{'baseline':>12}{'change':>10}" if baseline else ''))
+    for key, value in results.items():
+        if not key.endswith('_ms'):
+            continue
+        line = f"{key:<30}{'n/a' if value is None else value:>10}"
+        before = baseline.get(key)
+        if baseline:
+            change = f"{(value - before) / before:+.0%}" if value is not None and before else ''
+            line += f"{'n/a' if before is None else before:>12}{change:>10}"
+        print(line)
+    print("\nslowest imports under app.py (cumulative ms):")
+    for row in results['portal_slowest_imports']:
+        print(f"  {row['module']:<28}{row['cumulative_ms']:>8}")
+
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+SWML requests/sec and latency for the agent's /agent route, with and without the SWML cache
+
+Serves the agent (atom_agent-advanced.py by default) under uvicorn in a
+subprocess, once with AGENT_SWML_CACHE=false (every request renders the
+whole document) and once with it on (swml_cache splices per-call tokens
+into a cached template), and has --clients concurrent clients POST call
+starts to /agent for --seconds. Before timing, one response from each mode
+is checked to be valid JSON with the same verbs.
+
+Usage: python3 benchmarks/bench_swml.py [--agent advanced] [--clients 8] [--seconds 10]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+AUTH = ('bench', 'bench-password')
+
+SERVE = (
+    "import sys, runpy; sys.argv = ['atom_agent']\n"
+    "import signalwire_agents, uvicorn\n"
+    "signalwire_agents.AgentBase.run = lambda self, *a, **k: None\n"
+    "agent = runpy.run_path('atom_agent-{kind}.py', run_name='__main__')['agent']\n"
+    "uvicorn.run(agent.get_app(), host='127.0.0.1', port={port}, log_level='warning')\n"
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_agent(kind, cache):
+    """Run the agent under uvicorn; returns (process, url) once /agent answers"""
+    import requests
+
+    port = free_port()
+    env = dict(os.environ, AGENT_SWML_CACHE='true' if cache else 'false', SWML_BASIC_AUTH_USER=AUTH[0],
+               SWML_BASIC_AUTH_PASSWORD=AUTH[1], AGENT_DATA_BACKEND='http',
+               NGROK_URL=os.environ.get('NGROK_URL', 'https://example.ngrok.app'),
+               POST_PROMPT_URL=os.environ.get('POST_PROMPT_URL', 'https://example.ngrok.app/post-prompt'))
+    server = subprocess.Popen([sys.executable, '-c', SERVE.format(kind=kind, port=port)], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/agent/'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.post(url, json={}, auth=AUTH, timeout=5).status_code == 200:
+                return server, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.terminate()
+    sys.exit("agent did not start")
+
+
+def load(url, clients, seconds):
+    """Requests/sec and p50/p99 in ms of POSTs to /agent from `clients` keep-alive clients"""
+    import requests
+
+    samples = []
+    errors = []
+    stop = time.monotonic() + seconds
+
+    def client():
+        session = requests.Session()
+        mine = []
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            response = session.post(url, json={'call_id': str(uuid.uuid4())}, auth=AUTH, timeout=10)
+            mine.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        samples.extend(mine)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    samples.sort()
+    pick = lambda pct: samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000
+    return len(samples) / elapsed, pick(50), pick(99), len(errors)
+
+
+def verbs(document):
+    return [next(iter(verb)) for verb in document['sections']['main']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--agent', default='advanced', choices=('advanced', 'simple'))
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--seconds', type=float, default=10, help='load duration per mode')
+    args = parser.parse_args()
+
+    import requests
+
+    print(f"atom_agent-{args.agent}.py, {args.clients} clients x {args.seconds:g}s per mode, {os.cpu_count()} CPU(s)")
+    print(f"{'AGENT_SWML_CACHE':<18}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'bytes':>8}")
+    documents = {}
+    for cache in (False, True):
+        server, url = start_agent(args.agent, cache)
+        try:
+            response = requests.post(url, json={'call_id': str(uuid.uuid4())}, auth=AUTH, timeout=10)
+            documents[cache] = response.json()
+            rate, p50, p99, errors = load(url, args.clients, args.seconds)
+            print(f"{str(cache).lower():<18}{rate:>9.0f}{p50:>9.2f}{p99:>9.2f}{errors:>8}{len(response.content):>8}")
+        finally:
+            server.terminate()
+            server.wait()
+    if verbs(documents[False]) != verbs(documents[True]):
+        sys.exit("cached and rendered SWML differ")
+
+
+if __name__ == '__main__':
+    main()
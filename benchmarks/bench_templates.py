@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Template rendering benchmark: fragment caching and the bytecode cache
+
+Renders dashboard.html, call_support.html and index.html inside a request
+context with the fragment cache disabled (every region re-rendered, as
+before) and enabled, and times compiling every template in a fresh Jinja
+environment with and without the on-disk bytecode cache (what a newly
+started or recycled worker pays).
+
+Usage: python3 benchmarks/bench_templates.py [--renders 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='max-electric-bench-'), 'customer.db')
+
+import jinja2  # noqa: E402
+from flask import render_template, session  # noqa: E402
+
+import app as portal  # noqa: E402
+import customers  # noqa: E402
+import template_cache  # noqa: E402
+
+PAGES = {
+    'dashboard.html': lambda customer: dict(customer=customer),
+    'call_support.html': lambda customer: {},
+    'index.html': lambda customer: {},
+}
+
+
+def time_renders(name, context, renders):
+    """Mean microseconds per render_template call"""
+    start = time.perf_counter()
+    for _ in range(renders):
+        render_template(name, signalwire_call_token='token', signalwire_call_destination='/private/support',
+                        **context)
+    return (time.perf_counter() - start) / renders * 1e6
+
+
+def time_compile(bytecode_cache, rounds=5):
+    """Mean milliseconds to load every template into a new environment"""
+    total = 0.0
+    for _ in range(rounds):
+        environment = jinja2.Environment(
+            loader=portal.app.jinja_loader,
+            extensions=[template_cache.FragmentCacheExtension],
+            bytecode_cache=bytecode_cache,
+        )
+        start = time.perf_counter()
+        template_cache.precompile(environment)
+        total += time.perf_counter() - start
+    return total / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--renders', type=int, default=2000)
+    args = parser.parse_args()
+
+    portal.app.logger.disabled = True
+    portal.init_db()
+    customer = customers.get_customer_by_account('12345')
+    cache = template_cache.fragment_cache
+
+    with portal.app.test_request_context('/dashboard'):
+        session['customer_id'] = customer['id']
+        session['customer_name'] = f"{customer['first_name']} {customer['last_name']}"
+        session['account_number'] = customer['account_number']
+
+        print(f"{'template':<20}{'uncached us':>13}{'cached us':>12}{'speedup':>10}")
+        for name, context in PAGES.items():
+            context = context(customer)
+            maxsize = cache.maxsize
+            cache.maxsize = 0  # every fragment is evicted as soon as it is stored
+            cache.clear()
+            uncached = time_renders(name, context, args.renders)
+            cache.maxsize = maxsize
+            render_template(name, signalwire_call_token='token', signalwire_call_destination='/private/support',
+                            **context)
+            cached = time_renders(name, context, args.renders)
+            print(f"{name:<20}{uncached:>13.1f}{cached:>12.1f}{uncached / cached:>9.2f}x")
+
+    directory = tempfile.mkdtemp(prefix='max-electric-jinja-')
+    bytecode_cache = template_cache.bytecode_cache(directory)
+    time_compile(bytecode_cache, rounds=1)  # populate the on-disk cache
+    print(f"\ncompile all templates: {time_compile(None):.1f} ms without bytecode cache, "
+          f"{time_compile(bytecode_cache):.1f} ms with it")
+
+
+if __name__ == '__main__':
+    main()
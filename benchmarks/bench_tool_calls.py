@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Agent tool calls against a slow or failing portal: bare requests vs ToolClient
+
+Runs a stub of the portal's /api/customer in a separate process that
+answers in --base-ms, except for a --slow-pct share of requests that take
+--slow-ms (a GC pause, a lock wait, a cold cache). Then, for the
+get_customer_data lookup:
+
+  1. tail latency: --calls lookups with a bare requests.get (no timeout,
+     no connection reuse; the agents' old code) and through
+     tool_calls.ToolClient (keep-alive, hedged after AGENT_HEDGE_AFTER)
+  2. outage: the stub stops answering for --hang seconds per request; how
+     long each of ten consecutive tool calls keeps the caller waiting, and
+     when the circuit breaker starts failing fast
+  3. recovery: the stub answers again; the breaker's trial call closes it
+
+Usage: python3 benchmarks/bench_tool_calls.py [--calls 300] [--slow-pct 5] [--slow-ms 2000] [--hang 5]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_stub(port, base_ms, slow_pct, slow_ms):
+    """Serve /api/customer with injected latency; POST /_hang?seconds=N changes the outage delay"""
+    state = {'hang': 0.0}
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are separate writes: without this, keep-alive clients hit delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _answer(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            query = parse_qs(urlparse(self.path).query)
+            state['hang'] = float(query.get('seconds', ['0'])[0])
+            self._answer(200, state)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if state['hang']:
+                time.sleep(state['hang'])
+            else:
+                with lock:
+                    slow = rng.random() * 100 < slow_pct
+                time.sleep((slow_ms if slow else base_ms) / 1000)
+            account_number = parse_qs(url.query).get('account_number', [''])[0]
+            self._answer(200, {'account_number': account_number, 'first_name': 'John', 'last_name': 'Smith',
+                               'balance': 100.0})
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # Clients that gave up on a stalled request have hung up
+            pass
+
+    Server(('127.0.0.1', port), Handler).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def set_hang(base_url, seconds):
+    request = urllib.request.Request(f"{base_url}/_hang?seconds={seconds}", method='POST', data=b'')
+    urllib.request.urlopen(request, timeout=5).read()
+
+
+def summary(samples):
+    samples = sorted(samples)
+    pick = lambda pct: samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000
+    return f"{pick(50):>9.1f}{pick(99):>10.1f}{samples[-1] * 1000:>10.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=300)
+    parser.add_argument('--base-ms', type=float, default=5)
+    parser.add_argument('--slow-pct', type=float, default=5, help='share of requests that are slow')
+    parser.add_argument('--slow-ms', type=float, default=2000)
+    parser.add_argument('--hang', type=float, default=5, help='seconds the stub stalls each request during the outage')
+    parser.add_argument('--stub', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub:
+        run_stub(args.stub, args.base_ms, args.slow_pct, args.slow_ms)
+        return
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    stub = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--stub', str(port),
+                             '--base-ms', str(args.base_ms), '--slow-pct', str(args.slow_pct),
+                             '--slow-ms', str(args.slow_ms)])
+    try:
+        for _ in range(100):
+            try:
+                set_hang(base_url, 0)
+                break
+            except OSError:
+                time.sleep(0.05)
+
+        import requests
+
+        from config.production import Config
+        from metrics import registry
+        from tool_calls import CircuitOpen, ToolCallFailed, ToolClient
+
+        client = ToolClient(base_url, name='stub')
+        budget = client.budget('get_customer_data')
+
+        def bare(index):
+            requests.get(f"{base_url}/api/customer", params={'account_number': str(index)})
+
+        def budgeted(index):
+            client.request('get_customer_data', 'GET', '/api/customer', idempotent=True,
+                           params={'account_number': str(index)})
+
+        def budgeted_lookup(index):
+            try:
+                budgeted(index)
+            except ToolCallFailed:
+                overruns.append(index)
+
+        print(f"stub: {args.base_ms:g} ms, {args.slow_pct:g}% of requests {args.slow_ms:g} ms; "
+              f"budget {budget:g}s, hedge after {client.hedge_after:g}s")
+        print(f"\n1. tail latency, {args.calls} lookups")
+        print(f"{'client':<14}{'p50 ms':>9}{'p99 ms':>10}{'max ms':>10}")
+        overruns = []
+        for label, call in (('bare requests', bare), ('ToolClient', budgeted_lookup)):
+            samples = []
+            for index in range(args.calls):
+                start = time.perf_counter()
+                call(index)
+                samples.append(time.perf_counter() - start)
+            print(f"{label:<14}{summary(samples)}")
+        hedges = sum(value for (name, _), value in registry.snapshot().items()
+                     if name == 'portal_agent_tool_hedges_total')
+        print(f"ToolClient: {hedges} hedged requests, {len(overruns)} lookups over budget")
+
+        print(f"\n2. outage, every request stalls {args.hang:g}s")
+        set_hang(base_url, args.hang)
+        start = time.perf_counter()
+        bare(0)
+        print(f"bare requests: caller waits {time.perf_counter() - start:.2f}s per lookup")
+        waits = []
+        for index in range(10):
+            start = time.perf_counter()
+            try:
+                budgeted(index)
+                outcome = 'ok'
+            except CircuitOpen:
+                outcome = 'circuit open'
+            except ToolCallFailed as e:
+                outcome = type(e).__name__
+            waits.append(f"{(time.perf_counter() - start) * 1000:.0f} ms ({outcome})")
+        print("ToolClient, consecutive lookups:")
+        for index, wait in enumerate(waits, 1):
+            print(f"  {index:>2}. {wait}")
+
+        print(f"\n3. recovery after the breaker's {Config.AGENT_BREAKER_RESET:g}s reset period")
+        set_hang(base_url, 0)
+        time.sleep(Config.AGENT_BREAKER_RESET)
+        start = time.perf_counter()
+        budgeted(0)
+        print(f"trial lookup: {(time.perf_counter() - start) * 1000:.1f} ms, breaker {client.breaker.state}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    main()
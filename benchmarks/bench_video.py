@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Concurrent avatar video fetch throughput for /video/<filename>
+
+Serves the portal on a local port and has many clients fetch the avatar
+videos at once: full downloads, seek-style Range requests and revalidations
+with If-None-Match, the mix a video call's player produces.
+
+Usage: python3 benchmarks/bench_video.py [--clients 16] [--seconds 10]
+"""
+import argparse
+import http.client
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='max-electric-bench-'), 'customer.db')
+
+VIDEOS = ['sigmond_cc_talking.mp4', 'sigmond_cc_idle.mp4']
+
+
+def client(port, deadline, totals, lock, seed):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    etags = {}
+    counts = {'full': 0, 'range': 0, 'revalidate': 0, 'bytes': 0, 'errors': 0}
+    while time.monotonic() < deadline:
+        filename = rng.choice(VIDEOS)
+        kind = rng.choice(['full', 'range', 'range', 'revalidate'])
+        headers = {}
+        if kind == 'range':
+            start = rng.randrange(0, 2_000_000)
+            headers['Range'] = f'bytes={start}-{start + 256 * 1024 - 1}'
+        elif kind == 'revalidate' and filename in etags:
+            headers['If-None-Match'] = etags[filename]
+        conn.request('GET', f'/video/{filename}', headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        if response.status not in (200, 206, 304):
+            counts['errors'] += 1
+            continue
+        etags[filename] = response.getheader('ETag')
+        counts[kind] += 1
+        counts['bytes'] += len(body)
+    conn.close()
+    with lock:
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+    import app as portal
+
+    portal.app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, portal.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    totals, lock = {}, threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    threads = [threading.Thread(target=client, args=(port, deadline, totals, lock, i)) for i in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    requests_done = totals['full'] + totals['range'] + totals['revalidate']
+    print(f"{args.clients} concurrent clients for {elapsed:.1f}s")
+    print(f"  requests:      {requests_done / elapsed:10.1f} req/s "
+          f"(full {totals['full']}, range {totals['range']}, revalidate {totals['revalidate']})")
+    print(f"  throughput:    {totals['bytes'] / elapsed / (1024 * 1024):10.1f} MB/s")
+    print(f"  errors:        {totals['errors']:10d}")
+
+
+if __name__ == '__main__':
+    main()
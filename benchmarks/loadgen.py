@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Load generator for the customer portal, modeled on real user journeys
+
+Each virtual user logs in, opens the dashboard, then polls /api/balance at
+the dashboard's refresh interval (with jitter, revalidating with the ETag it
+was given) for the length of a session. Most sessions end by abandoning the
+tab; some log out. The user then starts a new session.
+
+Runs against any local instance (python3 app.py or gunicorn) with no
+SignalWire dependency. Results are printed as a table and written as JSON so
+runs can be compared.
+
+Usage: python3 benchmarks/loadgen.py [--url http://localhost:8080] [--users 50] [--duration 60]
+                                     [--poll-interval 30] [--session 120] [--json results.json]
+"""
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+SAMPLE_USERNAMES = [
+    'johnsmith', 'jimsmith', 'alicej', 'bobwilliams', 'charlieb', 'davidw',
+    'evedavis', 'frankmiller', 'gracem', 'hanktaylor', 'ivyanderson', 'jackthomas',
+]
+
+
+class Results:
+    """Latency samples and error counts per step"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.sessions = 0
+
+    def record(self, step, seconds, status, ok):
+        with self._lock:
+            self.latencies[step].append(seconds)
+            self.statuses[step][str(status)] += 1
+            if not ok:
+                self.errors[step] += 1
+
+    def summary(self, elapsed):
+        def pct(samples, p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1000, 2)
+
+        steps = {}
+        total = errors = 0
+        for step, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            total += len(samples)
+            errors += self.errors[step]
+            steps[step] = {
+                'requests': len(samples),
+                'rps': round(len(samples) / elapsed, 2),
+                'errors': self.errors[step],
+                'error_rate': round(self.errors[step] / len(samples), 4),
+                'p50_ms': pct(samples, 50),
+                'p95_ms': pct(samples, 95),
+                'p99_ms': pct(samples, 99),
+                'max_ms': round(samples[-1] * 1000, 2),
+                'statuses': dict(self.statuses[step]),
+            }
+        return {
+            'elapsed_seconds': round(elapsed, 2),
+            'sessions': self.sessions,
+            'requests': total,
+            'rps': round(total / elapsed, 2),
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'steps': steps,
+        }
+
+
+def timed(results, step, call, expect=(200,)):
+    start = time.perf_counter()
+    try:
+        response = call()
+    except requests.RequestException:
+        results.record(step, time.perf_counter() - start, 'connection-error', False)
+        return None
+    results.record(step, time.perf_counter() - start, response.status_code, response.status_code in expect)
+    return response
+
+
+def virtual_user(args, usernames, results, stop, rng):
+    """Run sessions back to back until the test ends"""
+    while not stop.is_set():
+        session = requests.Session()
+        username = rng.choice(usernames)
+
+        # Login redirects to the dashboard on success; do not follow so each step is timed on its own
+        response = timed(results, 'login', lambda: session.post(
+            f"{args.url}/login", data={'username': username, 'password': args.password},
+            allow_redirects=False, timeout=args.timeout), expect=(302,))
+        if response is None or response.status_code != 302:
+            stop.wait(1)
+            continue
+        with results._lock:
+            results.sessions += 1
+
+        timed(results, 'dashboard', lambda: session.get(f"{args.url}/dashboard", timeout=args.timeout))
+
+        session_end = time.monotonic() + rng.uniform(0.5, 1.5) * args.session
+        etag = None
+        while not stop.is_set() and time.monotonic() < session_end:
+            # Same cadence as the dashboard's refresh timer, with jitter so users do not align
+            if stop.wait(args.poll_interval * rng.uniform(0.8, 1.2)):
+                break
+            headers = {'If-None-Match': etag} if etag else {}
+            response = timed(results, 'api_balance', lambda: session.get(
+                f"{args.url}/api/balance", headers=headers, timeout=args.timeout), expect=(200, 304))
+            if response is not None and response.headers.get('ETag'):
+                etag = response.headers['ETag']
+
+        if not stop.is_set() and rng.random() < args.logout_rate:
+            timed(results, 'logout', lambda: session.get(
+                f"{args.url}/logout", allow_redirects=False, timeout=args.timeout), expect=(302,))
+        session.close()
+
+
+def load_usernames(args):
+    if args.database:
+        conn = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+        rows = conn.execute('SELECT username FROM customer ORDER BY random() LIMIT ?', (args.sample,)).fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+    return SAMPLE_USERNAMES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8080', help='portal base URL')
+    parser.add_argument('--users', type=int, default=50, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='test length in seconds')
+    parser.add_argument('--ramp-up', type=float, default=10, help='seconds over which users start')
+    parser.add_argument('--poll-interval', type=float, default=30, help='seconds between balance polls')
+    parser.add_argument('--session', type=float, default=120, help='mean session length in seconds')
+    parser.add_argument('--logout-rate', type=float, default=0.3, help='fraction of sessions that log out')
+    parser.add_argument('--password', default='signalwire_rocks')
+    parser.add_argument('--database', help='draw usernames from this customer database (e.g. after seed.py)')
+    parser.add_argument('--sample', type=int, default=10000, help='usernames drawn from --database')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results here as well as to stdout')
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+
+    usernames = load_usernames(args)
+    results = Results()
+    stop = threading.Event()
+    threads = []
+
+    start = time.perf_counter()
+    for i in range(args.users):
+        rng = random.Random(args.seed * 100003 + i)
+        thread = threading.Thread(target=virtual_user, args=(args, usernames, results, stop, rng), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if stop.wait(args.ramp_up / args.users if args.users else 0):
+            break
+    stop.wait(max(0.0, args.duration - (time.perf_counter() - start)))
+    stop.set()
+    for thread in threads:
+        thread.join(args.timeout)
+    elapsed = time.perf_counter() - start
+
+    summary = results.summary(elapsed)
+    summary['config'] = {key: value for key, value in vars(args).items() if key not in ('password', 'json')}
+
+    print(f"{'step':<14}{'requests':>10}{'rps':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+          file=sys.stderr)
+    for step, stats in summary['steps'].items():
+        print(f"{step:<14}{stats['requests']:>10}{stats['rps']:>9}{stats['errors']:>8}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}", file=sys.stderr)
+    print(f"total: {summary['requests']} requests, {summary['rps']} req/s, "
+          f"error rate {summary['error_rate']:.2%}, {summary['sessions']} sessions", file=sys.stderr)
+
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Per-call memoization of SWAIG tool results for the Max Electric agent
+
+Within one conversation the AI calls get_customer_data again and again (on
+lookup, after a PIN retry, before get_payment), and each call used to be
+another backend round trip. Results are kept per call_id, keyed by tool
+name and arguments, so repeats within a call are answered from memory.
+
+Entries live at most AGENT_CALL_CACHE_TTL seconds (about one call); the
+least recently used calls are dropped beyond AGENT_CALL_CACHE_MAX_CALLS,
+and a call's entries are dropped as soon as its post-prompt summary reaches
+the agent. Results tagged with an account are invalidated in every call
+when a payment for that account starts, and nothing is cached for the
+account until the payment completes (or, when the agent cannot see the
+outcome, as with the Pay verb, for one TTL), so a caller never hears a
+balance from before their payment.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config.production import Config
+
+
+def _key(tool, args):
+    return tool, json.dumps(args, sort_keys=True, default=str)
+
+
+class CallCache:
+    """Bounded LRU/TTL cache of tool results, grouped by call_id"""
+
+    def __init__(self, max_calls=None, max_entries=None, ttl=None):
+        self.max_calls = max_calls or Config.AGENT_CALL_CACHE_MAX_CALLS
+        self.max_entries = max_entries or Config.AGENT_CALL_CACHE_MAX_ENTRIES
+        self.ttl = Config.AGENT_CALL_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._calls = OrderedDict()  # call_id -> {key: (value, account_number, expires_at)}
+        self._paying = {}  # account_number -> when its payment is assumed finished
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, call_id, tool, args):
+        """Return the cached result of tool(args) in this call, or None on a miss"""
+        if not call_id:
+            return None
+        key = _key(tool, args)
+        with self._lock:
+            entries = self._calls.get(call_id)
+            entry = entries.get(key) if entries is not None else None
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    del entries[key]
+                self.misses += 1
+                return None
+            self._calls.move_to_end(call_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, call_id, tool, args, value, account_number=None):
+        """Cache a result for the rest of the call; account_number ties it to that account's payments"""
+        if not call_id or self.ttl <= 0:
+            return
+        key = _key(tool, args)
+        with self._lock:
+            if account_number is not None and self._payment_pending(account_number):
+                # It may be read from before the payment commits
+                return
+            entries = self._calls.get(call_id)
+            if entries is None:
+                entries = self._calls[call_id] = {}
+            self._calls.move_to_end(call_id)
+            entries.pop(key, None)
+            entries[key] = (value, account_number, time.monotonic() + self.ttl)
+            while len(entries) > self.max_entries:
+                del entries[next(iter(entries))]
+                self.evictions += 1
+            while len(self._calls) > self.max_calls:
+                self._calls.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_account(self, account_number):
+        """Forget results for an account in every call, after a payment changed it"""
+        with self._lock:
+            self._invalidate(account_number)
+
+    def _invalidate(self, account_number):
+        for entries in self._calls.values():
+            for key in [key for key, entry in entries.items() if entry[1] == account_number]:
+                del entries[key]
+                self.invalidations += 1
+
+    def begin_payment(self, account_number):
+        """A payment for the account has started: forget its results and cache none until end_payment()"""
+        now = time.monotonic()
+        with self._lock:
+            self._invalidate(account_number)
+            for account in [account for account, until in self._paying.items() if until < now]:
+                del self._paying[account]
+            self._paying[account_number] = now + self.ttl
+
+    def end_payment(self, account_number):
+        """The payment has committed (or failed): forget results read while it was pending"""
+        with self._lock:
+            self._invalidate(account_number)
+            self._paying.pop(account_number, None)
+
+    def _payment_pending(self, account_number):
+        until = self._paying.get(account_number)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            del self._paying[account_number]
+            return False
+        return True
+
+    def end_call(self, call_id):
+        """Forget everything cached for a call that has ended"""
+        with self._lock:
+            self._calls.pop(call_id, None)
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'calls': len(self._calls),
+                'pending_payments': len(self._paying),
+                'max_calls': self.max_calls,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+cache = CallCache()
@@ -0,0 +1,41 @@
+"""
+Response compression for Max Electric Payment Demo
+
+Dynamic HTML, JSON and text responses of at least COMPRESS_MIN_SIZE bytes
+are gzipped when the client accepts it. Streamed responses (the NDJSON
+export, the balance event stream, the agent proxy) and responses that
+already carry a Content-Encoding are left alone; static assets are served
+precompressed by static_assets instead.
+
+A compressed body is a different representation, so its ETag is made weak,
+as nginx does; conditional requests compare ETags weakly, so a client
+revalidating with W/"..." still gets its 304.
+"""
+import gzip
+
+from config.production import Config
+
+
+def compress_response(request, response):
+    """Gzip `response` in place if it is worth compressing for `request`"""
+    if response.mimetype not in Config.COMPRESS_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or request.accept_encodings.quality('gzip') <= 0):
+        return response
+
+    data = response.get_data()
+    if len(data) < Config.COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=Config.COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
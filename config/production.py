@@ -14,7 +14,19 @@ class Config:
     
     # Database Configuration
     DATABASE_PATH = os.environ.get('DATABASE_PATH', '/app/data/customer.db')
+    # The portal's own files (caches, built assets, metric snapshots) live next to the database, not in /tmp
+    DATA_DIR = os.environ.get('DATA_DIR', os.path.dirname(os.path.abspath(DATABASE_PATH)))
     DATABASE_BACKUP_INTERVAL = 3600  # 1 hour
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 16))
+    DATABASE_BUSY_TIMEOUT = 5  # seconds to wait on a locked database
+    DATABASE_STATEMENT_CACHE = 256  # prepared statements kept per connection
+    # Database files customers are spread across by account_number (change with reshard.py)
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+    CUSTOMER_CACHE_SIZE = int(os.environ.get('CUSTOMER_CACHE_SIZE', 10000))  # customer records kept in memory
+    CUSTOMER_CACHE_TTL = float(os.environ.get('CUSTOMER_CACHE_TTL', 30))  # seconds
+    CUSTOMER_BATCH_MAX = 1000  # most accounts resolved by one /api/customers call
+    ADMIN_USERS_PAGE_SIZE = 100  # /admin/users page size when no limit is given
+    ADMIN_USERS_PAGE_MAX = 1000  # largest /admin/users page (stream=1 is unbounded)
     
     # SignalWire Configuration
     SIGNALWIRE_SPACE = os.environ.get('SIGNALWIRE_SPACE')
@@ -27,12 +39,44 @@ class Config:
     NGROK_TOKEN = os.environ.get('NGROK_TOKEN')
     NGROK_REGION = os.environ.get('NGROK_REGION', 'us')
     
+    # Server Configuration (gunicorn.conf.py)
+    SERVER_PORT = int(os.environ.get('PORT', 8080))
+    SERVER_WORKERS = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 8))  # request threads per worker (balance streams are served by balance_stream's process)
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 10000))  # recycle a worker after this many requests
+    SERVER_MAX_REQUESTS_JITTER = 1000  # stagger recycling so workers do not restart together
+    SERVER_TIMEOUT = 60  # seconds before a silent worker is killed
+    SERVER_GRACEFUL_TIMEOUT = 30  # seconds a recycled worker gets to finish in-flight requests
+    
+    # Metrics Configuration
+    METRICS_DIR = os.environ.get('METRICS_DIR', '')  # shared by workers; empty keeps metrics per process
+    METRICS_FLUSH_INTERVAL = 1.0  # seconds between a worker's snapshot writes
+    
     # Security Configuration
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = 3600  # 1 hour
     
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')  # older hashes are upgraded on login
+    PASSWORD_POOL_SIZE = int(os.environ.get('PASSWORD_POOL_SIZE', 2))  # hashing processes; 0 hashes on the request thread
+    PASSWORD_QUEUE_MAX = int(os.environ.get('PASSWORD_QUEUE_MAX', 32))  # pending hashes before logins are turned away
+    PASSWORD_TIMEOUT = 10  # seconds
+    
+    # Template Configuration
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR', os.path.join(DATA_DIR, 'jinja_cache'))
+    TEMPLATE_FRAGMENT_CACHE_SIZE = 1024  # rendered {% cache %} fragments kept per worker
+    
+    # Static Asset Configuration
+    STATIC_BUILD_DIR = os.environ.get('STATIC_BUILD_DIR', os.path.join(DATA_DIR, 'assets'))
+    STATIC_MAX_AGE = 365 * 86400  # fingerprinted assets never change under the same name
+    STATIC_MANIFEST_CHECK_INTERVAL = 1.0  # seconds between stat() calls on the build manifest
+    
+    # Response Compression Configuration
+    COMPRESS_MIMETYPES = ('text/html', 'application/json', 'text/plain')
+    COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are not worth the CPU
+    COMPRESS_LEVEL = 6
+    
     # Rate Limiting
     RATELIMIT_STORAGE_URL = "memory://"
     RATELIMIT_DEFAULT = "100 per hour"
@@ -40,16 +84,81 @@ class Config:
     # Logging Configuration
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FILE = '/app/logs/app.log'
+    PORTAL_LOG_FILE = os.environ.get('PORTAL_LOG_FILE', 'logs/max_electric.log')
+    LOG_JSON = os.environ.get('LOG_JSON', 'false').lower() == 'true'  # JSON-lines output
+    LOG_MAX_BYTES = 10240000
+    LOG_BACKUP_COUNT = 10
+    LOG_QUEUE_SIZE = 10000  # records buffered before new ones are dropped
+    LOG_TO_STDERR = os.environ.get('LOG_TO_STDERR', 'true').lower() == 'true'
+    # Fraction of records kept, per level and per message prefix (warnings and errors are always kept)
+    LOG_SAMPLE_RATES = {
+        'DEBUG': float(os.environ.get('LOG_SAMPLE_DEBUG', 1.0)),
+        'INFO': float(os.environ.get('LOG_SAMPLE_INFO', 1.0)),
+    }
+    LOG_SAMPLED_MESSAGES = {
+        'Customer data request': float(os.environ.get('LOG_SAMPLE_CUSTOMER_DATA', 1.0)),
+        'Video request': float(os.environ.get('LOG_SAMPLE_VIDEO', 1.0)),
+    }
     
     # Agent Configuration
     AGENT_HOST = "0.0.0.0"
     AGENT_PORT = 3000
     AGENT_TIMEOUT = 30
+    AGENT_UPSTREAM_URL = os.environ.get('AGENT_UPSTREAM_URL', 'http://localhost:3000')
+    AGENT_CONNECT_TIMEOUT = float(os.environ.get('AGENT_CONNECT_TIMEOUT', 2))
+    AGENT_READ_TIMEOUT = float(os.environ.get('AGENT_READ_TIMEOUT', AGENT_TIMEOUT))
+    AGENT_POOL_SIZE = 32  # keep-alive connections to the agent service
+    # How the agent's tools reach customer data: 'local' reads the shared SQLite store directly
+    # (agent on the portal's host), 'http' calls the portal's API (split deployments)
+    AGENT_DATA_BACKEND = os.environ.get('AGENT_DATA_BACKEND', 'http')
+    AGENT_DATA_URL = os.environ.get('AGENT_DATA_URL', os.environ.get('NGROK_URL'))  # portal base URL for 'http'
+    # Outbound calls from agent tools (tool_calls.py): seconds a tool may wait for its answer
+    AGENT_TOOL_BUDGETS = {
+        'get_customer_data': float(os.environ.get('AGENT_BUDGET_GET_CUSTOMER_DATA', 1.5)),
+        'process_payment': float(os.environ.get('AGENT_BUDGET_PROCESS_PAYMENT', 8)),
+    }
+    AGENT_TOOL_BUDGET = 3.0  # tools without their own budget
+    AGENT_TOOL_CONNECT_TIMEOUT = 1.0
+    AGENT_TOOL_POOL_SIZE = 8  # keep-alive connections (and request threads) per service
+    AGENT_HEDGE_AFTER = float(os.environ.get('AGENT_HEDGE_AFTER', 0.3))  # seconds before an idempotent read is re-sent
+    AGENT_BREAKER_FAILURES = 5  # consecutive failures that open a service's circuit
+    AGENT_BREAKER_RESET = 15  # seconds a circuit stays open before one trial call
+    AGENT_CALL_CACHE_TTL = float(os.environ.get('AGENT_CALL_CACHE_TTL', 120))  # seconds, about one call; 0 disables per-call caching
+    AGENT_CALL_CACHE_MAX_CALLS = 1000  # concurrent calls with cached tool results
+    AGENT_CALL_CACHE_MAX_ENTRIES = 32  # cached tool results per call
+    AGENT_SWML_CACHE = os.environ.get('AGENT_SWML_CACHE', 'true').lower() == 'true'  # serve /agent SWML from templates
+    AGENT_SWML_CACHE_VARIANTS = 8  # cached SWML templates (one per webhook base URL)
+    
+    # Video Configuration
+    VIDEO_DIR_CHECK_INTERVAL = 1.0  # seconds between stat() calls on static/video
+    VIDEO_MAX_AGE = 86400  # browser/CDN cache lifetime for videos (revalidated by content-hash ETag)
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+    
+    # Balance Stream Configuration
+    BALANCE_STREAM_POLL_INTERVAL = 1.0  # seconds between checks for other workers' payments
+    BALANCE_STREAM_KEEPALIVE = 15  # seconds between SSE keep-alive comments
+    BALANCE_STREAM_MAX = int(os.environ.get('BALANCE_STREAM_MAX', 500))  # open dashboards per stream process (each an open file)
+    # Public URL of balance_stream's process (e.g. http://localhost:8081/balance/stream); empty streams from request threads
+    BALANCE_STREAM_URL = os.environ.get('BALANCE_STREAM_URL', '')
     
     # Payment Configuration
     PAYMENT_TIMEOUT = 300  # 5 minutes
+    PAYMENT_WRITE_TIMEOUT = float(os.environ.get('PAYMENT_WRITE_TIMEOUT', 10))  # seconds a payment waits on its shard's writer
     MAX_PAYMENT_AMOUNT = 10000.00
     MIN_PAYMENT_AMOUNT = 1.00
+    PAYMENT_COMMIT_WINDOW_MS = float(os.environ.get('PAYMENT_COMMIT_WINDOW_MS', 2))  # group-commit window
+    PAYMENT_BATCH_MAX = 256  # most payments committed in one transaction
+    # 'sync' applies a Pay callback before answering it; 'async' spools it durably and answers at once
+    PAYMENT_INTAKE_MODE = os.environ.get('PAYMENT_INTAKE_MODE', 'sync')
+    PAYMENT_SPOOL_PATH = os.environ.get('PAYMENT_SPOOL_PATH', '')  # defaults to payment_spool.db beside the database
+    PAYMENT_SPOOL_RETENTION = 7 * 86400  # seconds finished payments stay pollable
+    PAYMENT_INTAKE_WORKERS = int(os.environ.get('PAYMENT_INTAKE_WORKERS', 4))  # apply threads per process
+    PAYMENT_INTAKE_LEASE = 600  # seconds before a payment claimed by a dead process is retried
+    PAYMENT_INTAKE_POLL_INTERVAL = 0.5  # seconds between spool checks when idle
+    PAYMENT_INTAKE_SWEEP_INTERVAL = 30  # seconds between checks for expired leases
+    PAYMENT_INTAKE_MAX_ATTEMPTS = 8
+    PAYMENT_INTAKE_RETRY_BASE = 0.5  # seconds; doubled after every failed attempt
+    PAYMENT_INTAKE_RETRY_MAX = 60
     
     @classmethod
     def validate_config(cls) -> Dict[str, Any]:
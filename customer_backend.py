@@ -0,0 +1,136 @@
+"""
+Customer data backends for the Max Electric agent's SWAIG tools
+
+A tool call used to reach customer data by calling the portal's public URL,
+going out through the ngrok tunnel, back into Flask and on to SQLite while
+the caller waited in silence. The backend is now chosen by
+AGENT_DATA_BACKEND:
+
+  local  the agent shares the portal's host and reads the same sharded,
+         pooled SQLite store directly (no HTTP, no tunnel)
+  http   the portal's API at AGENT_DATA_URL through a tool_calls.ToolClient
+         (keep-alive, per-tool latency budgets, hedged reads, circuit
+         breaker), for deployments where the agent runs elsewhere
+
+Both return the same dicts and payment statuses and fail with a
+tool_calls.ToolCallFailed, so tools do not care which one they were given.
+Heavy imports (requests, or the portal's storage modules) only happen for
+the backend actually built.
+"""
+import sqlite3
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from config.production import Config
+from tool_calls import BudgetExceeded, ToolCallFailed, ToolClient
+
+# Payment outcomes, as recorded by payments.apply_payment()
+APPLIED = 'applied'
+DUPLICATE = 'duplicate'
+NOT_FOUND = 'not_found'
+# Spooled by a portal in PAYMENT_INTAKE_MODE=async and not applied yet
+ACCEPTED = 'accepted'
+
+
+class BackendUnavailable(ToolCallFailed):
+    """Raised when customer data cannot be read or a payment cannot be recorded"""
+
+
+class LocalBackend:
+    """Direct access to the portal's SQLite store from a process on the same host"""
+
+    name = 'local'
+
+    def __init__(self):
+        # The agent process keeps no customer cache: the portal's workers write
+        # balances, and a stale one must never be read back to a caller
+        import customers
+        import payments
+
+        self._customers = customers
+        self._payments = payments
+
+    def get_customer(self, account_number):
+        """Customer fields for an account, or None if there is no such account"""
+        try:
+            record = self._customers.read_customer(account_number)
+        except sqlite3.Error as e:
+            raise BackendUnavailable(str(e)) from e
+        if record is None:
+            return None
+        return {key: record[key] for key in self._customers.API_FIELDS}
+
+    def process_payment(self, account_number, amount, transaction_id=None, method=None):
+        """Apply a payment to the ledger; returns APPLIED, DUPLICATE or NOT_FOUND
+
+        Always applied synchronously: the tool reports the outcome to the caller.
+        Raises BudgetExceeded if the writer has not committed it within the
+        process_payment budget; it may still commit later.
+        """
+        value = self._payments.parse_amount(amount)
+        if value is None:
+            raise ValueError(f"Invalid payment amount: {amount!r}")
+        budget = Config.AGENT_TOOL_BUDGETS['process_payment']
+        try:
+            return self._payments.apply_payment(account_number, value, transaction_id, method, timeout=budget).status
+        except FutureTimeout as e:
+            raise BudgetExceeded(f"process_payment: no commit within {budget:g}s") from e
+        except sqlite3.Error as e:
+            raise BackendUnavailable(str(e)) from e
+
+
+class HttpBackend:
+    """The portal's HTTP API, through a budgeted and circuit-broken ToolClient"""
+
+    name = 'http'
+
+    def __init__(self, base_url=None, client=None):
+        base_url = base_url or Config.AGENT_DATA_URL
+        if client is None and not base_url:
+            raise ValueError("AGENT_DATA_URL (or NGROK_URL) must be set for the http backend")
+        self.client = client or ToolClient(base_url, name='portal')
+
+    def get_customer(self, account_number):
+        """Customer fields for an account, or None if there is no such account"""
+        response = self.client.request('get_customer_data', 'GET', '/api/customer', idempotent=True,
+                                       params={'account_number': account_number})
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise BackendUnavailable(f"/api/customer answered {response.status_code}")
+        return response.json()
+
+    def process_payment(self, account_number, amount, transaction_id=None, method=None):
+        """Post a payment to the portal; returns APPLIED, ACCEPTED or NOT_FOUND
+
+        Never hedged or retried: without a transaction_id a second POST would charge twice.
+        """
+        payload = {'chargeAmount': amount}
+        if transaction_id:
+            payload['transaction_id'] = transaction_id
+        if method:
+            payload['method'] = method
+        response = self.client.request('process_payment', 'POST', '/payment-processor',
+                                       params={'account_number': account_number}, json=payload)
+        if response.status_code == 404:
+            return NOT_FOUND
+        if response.status_code == 400:
+            raise ValueError(response.text)
+        if response.status_code != 200:
+            raise BackendUnavailable(f"/payment-processor answered {response.status_code}")
+        return ACCEPTED if 'accepted' in response.text else APPLIED
+
+
+BACKENDS = {
+    LocalBackend.name: LocalBackend,
+    HttpBackend.name: HttpBackend,
+}
+
+
+def make_backend(name=None, **kwargs):
+    """Build the backend named by AGENT_DATA_BACKEND (or `name`)"""
+    name = (name or Config.AGENT_DATA_BACKEND).lower()
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown AGENT_DATA_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}") from None
+    return backend(**kwargs)
@@ -0,0 +1,254 @@
+"""
+Customer record access for Max Electric Payment Demo
+
+Lookups by account_number go through a bounded, in-process LRU cache
+with a TTL. Writers call invalidate() for the account they touched, and
+init_db() clears the whole cache. Payments committed by any other process
+(other gunicorn workers, another process's intake threads, the agent's
+local backend) are invalidated by balance_events' ledger watcher within
+BALANCE_STREAM_POLL_INTERVAL; other writes from other processes, such as
+password hash upgrades, are only bounded by CUSTOMER_CACHE_TTL.
+
+Lookups by account_number go straight to the account's shard; lookups by
+username and account-ordered scans fan out to every shard, the scans merging
+the shards' already-sorted results.
+"""
+import heapq
+import json
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from config.production import Config
+from db import shards
+
+
+class CustomerCache:
+    """Bounded LRU/TTL cache of customer rows keyed by account_number"""
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or Config.CUSTOMER_CACHE_SIZE
+        self.ttl = Config.CUSTOMER_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._records = OrderedDict()  # account_number -> (record, expires_at)
+        self._generation = 0  # bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _lookup(self, account_number):
+        """Return a live record for account_number (caller holds the lock)"""
+        entry = self._records.get(account_number)
+        if entry is None:
+            return None
+        record, expires_at = entry
+        if expires_at < time.monotonic():
+            self._discard(account_number)
+            return None
+        self._records.move_to_end(account_number)
+        return record
+
+    def _discard(self, account_number):
+        """Drop one entry (caller holds the lock)"""
+        del self._records[account_number]
+
+    def get(self, account_number):
+        """Return a copy of the cached record, or None on a miss"""
+        with self._lock:
+            record = self._lookup(account_number)
+            if record is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(record)
+
+    def generation(self):
+        """Token to take before reading from the database (see put)"""
+        return self._generation
+
+    def put(self, record, generation=None):
+        """Cache a customer row unless an invalidation raced with its read"""
+        record = dict(record)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            account_number = record['account_number']
+            if account_number in self._records:
+                self._discard(account_number)
+            self._records[account_number] = (record, time.monotonic() + self.ttl)
+            while len(self._records) > self.maxsize:
+                self._discard(next(iter(self._records)))
+                self.evictions += 1
+
+    def invalidate(self, account_number):
+        """Forget one account after a write"""
+        with self._lock:
+            self._generation += 1
+            if account_number in self._records:
+                self._discard(account_number)
+                self.invalidations += 1
+
+    def clear(self):
+        """Forget everything"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._records)
+            self._records.clear()
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._records),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+cache = CustomerCache()
+
+# Fields exposed to the agent (by /api/customer and customer_backend)
+API_FIELDS = ('account_number', 'first_name', 'last_name', 'phone', 'address', 'balance', 'pin')
+
+
+def get_customer_by_username(username):
+    """Look a customer up by username on every shard (used by login, never cached)
+
+    customer.username is UNIQUE only within a shard file. Customers are only
+    created by init_db's samples and seed.py, whose usernames are distinct
+    across the whole store (seed.py's end in the account number); anything
+    that adds customers must check every shard first, or the first match wins.
+    """
+    for pool in shards:
+        with pool.connection() as conn:
+            row = conn.execute('SELECT * FROM customer WHERE username = ?', (username,)).fetchone()
+        if row is not None:
+            return dict(row)
+    return None
+
+
+def read_customer(account_number):
+    """Uncached lookup by account number, for processes that share the store but not this cache"""
+    with shards.connection(account_number) as conn:
+        row = conn.execute('SELECT * FROM customer WHERE account_number = ?', (account_number,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def get_customer_by_account(account_number):
+    """Read-through lookup by account number"""
+    record = cache.get(account_number)
+    if record is None:
+        generation = cache.generation()
+        record = read_customer(account_number)
+        if record is None:
+            return None
+        cache.put(record, generation)
+    return record
+
+
+def get_customers_by_account(account_numbers):
+    """Batch read-through lookup; returns {account_number: record or None}"""
+    found = {}
+    missing = []
+    for account_number in dict.fromkeys(account_numbers):
+        record = cache.get(account_number)
+        if record is None:
+            missing.append(account_number)
+        else:
+            found[account_number] = record
+
+    if missing:
+        generation = cache.generation()
+        by_shard = {}
+        for account_number in missing:
+            by_shard.setdefault(shards.index(account_number), []).append(account_number)
+        # One indexed query per shard for the whole batch, however large
+        for index, shard_accounts in by_shard.items():
+            with shards.pools[index].connection() as conn:
+                rows = conn.execute('''
+                    SELECT * FROM customer
+                    WHERE account_number IN (SELECT value FROM json_each(?))
+                ''', (json.dumps(shard_accounts),)).fetchall()
+            for row in rows:
+                record = dict(row)
+                cache.put(record, generation)
+                found[record['account_number']] = record
+
+    return {account_number: found.get(account_number) for account_number in account_numbers}
+
+
+def _account_order(row):
+    return row['account_number']
+
+
+def iter_customers_in_range(start, end, limit):
+    """Yield customer rows with start <= account_number <= end, in account order"""
+    def shard_rows(pool):
+        with pool.connection() as conn:
+            cursor = conn.execute('''
+                SELECT * FROM customer
+                WHERE account_number BETWEEN ? AND ?
+                ORDER BY account_number
+                LIMIT ?
+            ''', (start, end, limit))
+            for row in cursor:
+                yield dict(row)
+
+    merged = heapq.merge(*(shard_rows(pool) for pool in shards), key=_account_order)
+    try:
+        yield from islice(merged, limit)
+    finally:
+        # Hand every shard's connection back even if the caller stops early
+        merged.close()
+
+
+def iter_customers_after(after, columns, limit=None, page_size=1000):
+    """Yield customers with account_number > after, in account order, fetching only `columns`
+
+    Each shard is read one keyset page at a time and the shards' pages are
+    merged, so memory stays flat (a page per shard) and no connection or
+    read transaction is held between pages. `columns` must be trusted column
+    names; account_number is always included.
+    """
+    columns = ('account_number',) + tuple(column for column in columns if column != 'account_number')
+    query = f'''
+        SELECT {', '.join(columns)} FROM customer
+        WHERE account_number > ?
+        ORDER BY account_number
+        LIMIT ?
+    '''
+
+    def shard_pages(pool, after):
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            with pool.connection() as conn:
+                rows = conn.execute(query, (after, size)).fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < size:
+                return
+            after = rows[-1]['account_number']
+            if remaining is not None:
+                remaining -= len(rows)
+
+    merged = heapq.merge(*(shard_pages(pool, after) for pool in shards), key=_account_order)
+    yield from merged if limit is None else islice(merged, limit)
+
+
+def invalidate(account_number):
+    """Drop an account from the cache after its row changed"""
+    cache.invalidate(account_number)
+
+
+def clear_cache():
+    """Drop every cached customer"""
+    cache.clear()
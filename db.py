@@ -0,0 +1,277 @@
+"""
+Shared SQLite connection pools for Max Electric Payment Demo
+
+Connections are opened once per pool slot, switched to WAL journaling and
+tuned with a fixed set of pragmas, then handed out to request handlers and
+returned when the request finishes.
+
+Customers are partitioned across SHARD_COUNT database files by a hash of
+their account_number, each with its own pool and its own write lock, so
+payments to different shards never wait on each other. An account's
+customer row and its ledger entries always live on the same shard. With a
+single shard (the default) the store is just DATABASE_PATH, as before;
+reshard.py moves data between shard counts.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from werkzeug.security import generate_password_hash
+
+from config.production import Config
+from metrics import registry, statement_labels
+
+# Pragmas applied to every new connection
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # 16 MB page cache per connection
+    "PRAGMA mmap_size=134217728",  # 128 MB memory-mapped reads
+)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection that records statement counts and execution time"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(sql, time.perf_counter() - start)
+
+
+def _record(sql, seconds):
+    labels = statement_labels(sql)
+    registry.inc('portal_db_queries_total', labels)
+    registry.observe('portal_db_query_duration_seconds', seconds, labels)
+
+
+class ConnectionPool:
+    """Bounded pool of reusable SQLite connections"""
+
+    def __init__(self, database, size=None, timeout=None, cached_statements=None):
+        self.database = database
+        self.size = size or Config.DATABASE_POOL_SIZE
+        self.timeout = timeout or Config.DATABASE_BUSY_TIMEOUT
+        self.cached_statements = cached_statements or Config.DATABASE_STATEMENT_CACHE
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Drop every pooled connection (used on first use and after fork)"""
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+
+    def connect(self):
+        """Open and configure a new connection outside the pool"""
+        if self.database == ':memory:':
+            # Share one in-memory database across all pooled connections
+            conn = sqlite3.connect(
+                'file:max_electric?mode=memory&cache=shared',
+                uri=True,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self.cached_statements,
+                factory=TimedConnection,
+            )
+        else:
+            directory = os.path.dirname(self.database)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(
+                self.database,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self.cached_statements,
+                factory=TimedConnection,
+            )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if a slot is free"""
+        if self._pid != os.getpid():
+            # Connections must never cross a fork
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self.connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        return self._idle.get(timeout=self.timeout)
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Context manager running a block inside BEGIN/COMMIT on a pooled connection"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+def shard_path(database, index, count):
+    """File for shard `index` of `count`: customer.db -> customer.2-of-4.db"""
+    if count == 1:
+        return database
+    if database == ':memory:':
+        raise ValueError("an in-memory database cannot be sharded")
+    stem, ext = os.path.splitext(database)
+    return f"{stem}.{index}-of-{count}{ext}"
+
+
+def shard_index(account_number, count):
+    """Shard holding an account; stable across processes and restarts"""
+    return zlib.crc32(str(account_number).encode('utf-8')) % count
+
+
+class ShardSet:
+    """Customer storage partitioned across SQLite files by account_number"""
+
+    def __init__(self, database, count=None):
+        self.database = database
+        self.count = count or Config.SHARD_COUNT
+        self.pools = [ConnectionPool(shard_path(database, index, self.count)) for index in range(self.count)]
+
+    def __iter__(self):
+        return iter(self.pools)
+
+    def __len__(self):
+        return self.count
+
+    def index(self, account_number):
+        return shard_index(account_number, self.count)
+
+    def pool_for(self, account_number):
+        """Pool of the shard that owns `account_number`"""
+        return self.pools[self.index(account_number)]
+
+    def connection(self, account_number):
+        """Context manager yielding a connection to the account's shard"""
+        return self.pool_for(account_number).connection()
+
+    def transaction(self, account_number, immediate=False):
+        """Context manager running a block in a transaction on the account's shard"""
+        return self.pool_for(account_number).transaction(immediate=immediate)
+
+    def close(self):
+        """Close every shard's idle connections"""
+        for pool in self.pools:
+            pool.close()
+
+
+def init_schema(conn):
+    """Create or migrate one shard's schema on an open transaction"""
+    # payments imports this module, so its ledger schema is imported on use
+    from payments import init_ledger
+
+    # Create customer table if it doesn't exist
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS customer (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_number TEXT UNIQUE NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            pin TEXT NOT NULL,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            phone TEXT,
+            address TEXT,
+            balance REAL DEFAULT 0.0,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Check if we need to add new columns to existing table
+    cursor = conn.execute("PRAGMA table_info(customer)")
+    columns = [column[1] for column in cursor.fetchall()]
+
+    # Bumped on every write so responses can carry a cheap ETag
+    if 'version' not in columns:
+        conn.execute("ALTER TABLE customer ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    # If data exists but new columns are missing, update existing records
+    cursor = conn.execute("SELECT id, first_name, last_name FROM customer WHERE username IS NULL")
+    customers_to_update = cursor.fetchall()
+
+    if customers_to_update:
+        default_password_hash = generate_password_hash("signalwire_rocks", method=Config.PASSWORD_HASH_METHOD)
+        default_pin = "1234"
+
+        for customer in customers_to_update:
+            username = f"{customer['first_name'].lower()}{customer['last_name'].lower()}"
+            # Handle potential duplicates by adding ID
+            username = f"{username}{customer['id']}"
+
+            conn.execute('''
+                UPDATE customer 
+                SET username = ?, password_hash = ?, pin = ?, version = version + 1
+                WHERE id = ?
+            ''', (username, default_password_hash, default_pin, customer['id']))
+
+    # Payment ledger; customer.balance is its materialized projection
+    init_ledger(conn)
+
+
+shards = ShardSet(Config.DATABASE_PATH)
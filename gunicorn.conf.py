@@ -0,0 +1,87 @@
+"""
+Gunicorn settings for the Max Electric customer portal
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master and the database is created/migrated
+there, exactly once, before any worker forks. Each worker then opens its own
+connection pool, payment writer and log writer on first use, and is recycled
+gracefully after SERVER_MAX_REQUESTS requests. Workers share metric snapshots
+through METRICS_DIR so /metrics reports the whole server.
+
+With STARTUP_PROFILE=1 the master reports its import and initialization
+phases and each worker reports how long it took to boot after the fork.
+"""
+import os
+
+from dotenv import load_dotenv
+
+# Config reads the environment at import time
+load_dotenv()
+
+from config.production import Config  # noqa: E402
+
+if not Config.METRICS_DIR:
+    # Workers publish metric snapshots here, next to the database, so /metrics can sum them
+    Config.METRICS_DIR = os.environ['METRICS_DIR'] = os.path.join(Config.DATA_DIR, 'metrics')
+
+bind = f"0.0.0.0:{Config.SERVER_PORT}"
+workers = Config.SERVER_WORKERS
+# Balance event streams are served by balance_stream's own process (BALANCE_STREAM_URL), so they hold no request thread
+worker_class = 'gthread'
+threads = Config.SERVER_THREADS
+preload_app = True
+
+max_requests = Config.SERVER_MAX_REQUESTS
+max_requests_jitter = Config.SERVER_MAX_REQUESTS_JITTER
+timeout = Config.SERVER_TIMEOUT
+graceful_timeout = Config.SERVER_GRACEFUL_TIMEOUT
+keepalive = 5
+
+
+def on_starting(server):
+    """Initialize the database in the master before workers are forked"""
+    import metrics
+    import payment_intake
+    import static_assets
+    import template_cache
+    from app import app, init_db, startup
+    from db import shards
+
+    startup.mark('server setup')
+    metrics.clear_directory()
+    init_db()
+    # No worker is running yet, so every payment left mid-apply is requeued
+    payment_intake.intake.recover()
+    startup.mark('init_db')
+    # Workers inherit the compiled templates instead of compiling their own
+    template_cache.precompile(app.jinja_env)
+    # Workers open their own connections; keep none open across the fork
+    shards.close()
+    payment_intake.intake.pool.close()
+    startup.mark('templates')
+    # Fingerprint and precompress static assets once for every worker
+    static_assets.build()
+    startup.mark('static assets')
+    startup.report()
+
+
+def post_fork(server, worker):
+    from startup_profile import StartupProfiler
+
+    worker.startup = StartupProfiler('portal worker')
+
+
+def post_worker_init(worker):
+    import balance_events
+    import payment_intake
+    from config.production import Config
+
+    # Follow the ledger so other processes' payments invalidate this worker's customer cache
+    balance_events.broker.ensure_started()
+
+    # Drain the payment spool, including payments spooled before a restart
+    if Config.PAYMENT_INTAKE_MODE == 'async' or payment_intake.intake.pending():
+        payment_intake.intake.ensure_started()
+    worker.startup.mark('worker init')
+    worker.startup.report()
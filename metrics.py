@@ -0,0 +1,359 @@
+"""
+Prometheus metrics for Max Electric Payment Demo
+
+Counters, gauges and histograms are recorded into a per-thread shard, so the
+hot path is a couple of dict updates with no lock. A snapshot merges the
+shards (folding in those of threads that have exited).
+
+Under gunicorn every worker also writes its snapshot to METRICS_DIR about
+once per METRICS_FLUSH_INTERVAL, and /metrics sums the files of every worker
+so any worker can answer for all of them. Counters and histograms from
+exited workers are kept so totals never go backwards; their gauges are not.
+A worker's file is folded into one retired.json once it has exited, so the
+directory stays the size of the live server however often workers recycle.
+"""
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import weakref
+from functools import lru_cache
+
+from config.production import Config
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+class Registry:
+    """Lock-free-on-write metric store with per-thread shards"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._help = {}  # name -> (type, help text)
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded value (a forked worker must not inherit its parent's counts)"""
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []  # (weakref to thread, shard)
+        self._retired = {}  # merged shards of exited threads
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        """Add to a counter or gauge; labels is a tuple of (key, value) pairs"""
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def dec(self, name, labels=(), value=1):
+        self.inc(name, labels, -value)
+
+    def observe(self, name, seconds, labels=()):
+        """Record one histogram sample"""
+        shard = self._shard()
+        key = (name, labels)
+        values = shard.get(key)
+        if values is None:
+            # Per-bucket counts (the last is +Inf), then sum, then count
+            values = shard[key] = [0] * (len(self.buckets) + 3)
+        index = 0
+        for bound in self.buckets:
+            if seconds <= bound:
+                break
+            index += 1
+        values[index] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+    def snapshot(self):
+        """{(name, labels): value or histogram list} merged across threads"""
+        with self._lock:
+            live = []
+            for thread_ref, shard in self._shards:
+                thread = thread_ref()
+                if thread is None or not thread.is_alive():
+                    _merge(self._retired, shard.copy())
+                else:
+                    live.append((thread_ref, shard))
+            self._shards = live
+            merged = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self._retired.items()}
+            shards = [shard for _, shard in live]
+        for shard in shards:
+            # dict.copy() is atomic under the GIL, so writers never need the lock
+            _merge(merged, shard.copy())
+        return merged
+
+    def kinds(self):
+        return dict(self._help)
+
+
+def _merge(into, values):
+    for key, value in values.items():
+        if isinstance(value, list):
+            existing = into.get(key)
+            if existing is None:
+                into[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    existing[i] += v
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+RETIRED_FILE = 'retired.json'
+FOLD_LOCK_FILE = 'fold.lock'
+
+
+def _read_snapshot(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_snapshot(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _decode(metrics, kinds, gauges=True):
+    values = {}
+    for name, labels, value in metrics:
+        if not gauges and kinds.get(name, (None,))[0] == GAUGE:
+            continue
+        values[(name, tuple(tuple(pair) for pair in labels))] = value
+    return values
+
+
+class Exporter:
+    """Shares this process's snapshot with the other workers through METRICS_DIR"""
+
+    def __init__(self, registry, directory=None, interval=None):
+        self.registry = registry
+        self.directory = Config.METRICS_DIR if directory is None else directory
+        self.interval = interval or Config.METRICS_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+
+    def ensure_started(self):
+        """Start the flush thread for this process, after startup or fork (cheap to call per request)"""
+        if not self.directory or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._pid = os.getpid()
+            self._path = os.path.join(self.directory, f"{self._pid}-{uuid.uuid4().hex[:8]}.json")
+            threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Write this process's snapshot atomically"""
+        snapshot = self.registry.snapshot()
+        data = {
+            'pid': os.getpid(),
+            'metrics': [[name, list(labels), value] for (name, labels), value in snapshot.items()],
+        }
+        try:
+            _write_snapshot(self._path, data)
+        except OSError:
+            pass
+
+    def collect(self):
+        """Snapshot summed over every worker that has written one (or just this process)"""
+        self.ensure_started()
+        if not self.directory:
+            return self.registry.snapshot()
+
+        self.flush()
+        kinds = self.registry.kinds()
+        merged = {}
+        exited = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                data = _read_snapshot(os.path.join(self.directory, filename))
+            except (OSError, ValueError):
+                continue
+            if filename == RETIRED_FILE:
+                continue
+            if not _pid_alive(data['pid']):
+                exited.append(filename)
+                continue
+            _merge(merged, _decode(data['metrics'], kinds))
+        if exited:
+            self._fold(exited, kinds)
+        try:
+            retired = _read_snapshot(os.path.join(self.directory, RETIRED_FILE))
+        except (OSError, ValueError):
+            retired = None
+        if retired is not None:
+            _merge(merged, _decode(retired['metrics'], kinds))
+        return merged
+
+    def _fold(self, filenames, kinds):
+        """Add exited workers' counters and histograms to retired.json and delete their files"""
+        with open(os.path.join(self.directory, FOLD_LOCK_FILE), 'a') as lock:
+            # Another worker may be folding the same files
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired_path = os.path.join(self.directory, RETIRED_FILE)
+            try:
+                retired = _read_snapshot(retired_path)
+            except (OSError, ValueError):
+                retired = {'metrics': [], 'folded': []}
+            totals = _decode(retired['metrics'], kinds)
+            folded = []
+            for filename in filenames:
+                path = os.path.join(self.directory, filename)
+                # Folded last time, but not yet deleted when that worker stopped
+                if filename not in retired['folded']:
+                    try:
+                        data = _read_snapshot(path)
+                    except (OSError, ValueError):
+                        continue
+                    _merge(totals, _decode(data['metrics'], kinds, gauges=False))
+                folded.append(filename)
+            try:
+                _write_snapshot(retired_path, {
+                    'metrics': [[name, list(labels), value] for (name, labels), value in totals.items()],
+                    'folded': folded,
+                })
+            except OSError:
+                return
+            for filename in folded:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clear_directory(directory=None):
+    """Remove worker snapshots left by a previous server run"""
+    directory = Config.METRICS_DIR if directory is None else directory
+    if not directory or not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, filename))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(snapshot, kinds, buckets=DEFAULT_BUCKETS):
+    """Prometheus text exposition format (version 0.0.4)"""
+    by_name = {}
+    for (name, labels), value in snapshot.items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = kinds.get(name, (GAUGE, ''))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind == HISTOGRAM:
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', repr(bound)),))} {cumulative}")
+                cumulative += value[len(buckets)]
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(value[-2])}")
+                # Derived from the buckets so it always matches +Inf, even mid-update
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+_VERB_TARGET = (
+    (re.compile(r'^\s*SELECT\b.*?\bFROM\s+([A-Za-z_][\w]*)', re.I | re.S), 'select'),
+    (re.compile(r'^\s*INSERT\s+(?:OR\s+\w+\s+)?INTO\s+([A-Za-z_][\w]*)', re.I), 'insert'),
+    (re.compile(r'^\s*UPDATE\s+([A-Za-z_][\w]*)', re.I), 'update'),
+    (re.compile(r'^\s*DELETE\s+FROM\s+([A-Za-z_][\w]*)', re.I), 'delete'),
+    (re.compile(r'^\s*PRAGMA\s+([A-Za-z_][\w]*)', re.I), 'pragma'),
+)
+
+
+@lru_cache(maxsize=1024)
+def statement_labels(sql):
+    """Low-cardinality labels for a SQL statement, e.g. (('statement', 'select customer'),)"""
+    for pattern, verb in _VERB_TARGET:
+        match = pattern.match(sql)
+        if match:
+            return (('statement', f"{verb} {match.group(1).lower()}"),)
+    words = sql.split(None, 1)
+    return (('statement', words[0].lower() if words else 'empty'),)
+
+
+registry = Registry()
+exporter = Exporter(registry)
+os.register_at_fork(after_in_child=registry.reset)
+
+registry.describe('portal_requests_total', COUNTER, 'HTTP requests by route, method and status')
+registry.describe('portal_request_duration_seconds', HISTOGRAM, 'Time to produce response headers, by route')
+registry.describe('portal_requests_in_flight', GAUGE, 'Requests currently being handled, by route')
+registry.describe('portal_db_queries_total', COUNTER, 'SQLite statements executed, by statement')
+registry.describe('portal_db_query_duration_seconds', HISTOGRAM, 'SQLite statement execution time, by statement')
+registry.describe('portal_agent_upstream_duration_seconds', HISTOGRAM, 'Agent service response time (to headers)')
+registry.describe('portal_agent_upstream_errors_total', COUNTER, 'Agent service requests that failed')
+registry.describe('portal_payments_total', COUNTER, 'Pay callbacks by outcome')
+registry.describe('portal_payment_intake_total', COUNTER, 'Spooled payments by intake or apply outcome')
+registry.describe('portal_payment_intake_delay_seconds', HISTOGRAM, 'Time from spooling a payment to applying it')
+
+
+def collect_text():
+    """Render the metrics of every worker"""
+    return render(exporter.collect(), registry.kinds(), registry.buckets)
@@ -0,0 +1,128 @@
+"""
+Password hashing for Max Electric Payment Demo
+
+Hashing and verification are deliberately CPU-expensive, so they run in a
+small process pool instead of on request threads: a burst of logins no
+longer holds the GIL while payment callbacks wait. The number of hashes
+queued or running is capped, and callers are rejected immediately with
+PasswordPoolBusy once the pool is saturated rather than queueing without
+bound.
+
+Hashes made with older parameters are upgraded to PASSWORD_HASH_METHOD the
+next time their owner logs in successfully.
+"""
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config.production import Config
+
+_canonical_methods = {}
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many hashes are already queued, or one took too long"""
+
+
+def _canonical_method(method):
+    """Full method string Werkzeug records for `method`, e.g. pbkdf2 -> pbkdf2:sha256:600000"""
+    if method not in _canonical_methods:
+        _canonical_methods[method] = generate_password_hash('', method=method, salt_length=1).split('$', 1)[0]
+    return _canonical_methods[method]
+
+
+def _verify(password_hash, password, method):
+    """Check a password; returns (valid, replacement hash or None)"""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if password_hash.split('$', 1)[0] != _canonical_method(method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+class PasswordHasher:
+    """Bounded process pool for password hashing and verification"""
+
+    def __init__(self, method=None, workers=None, max_pending=None, timeout=None):
+        self.method = method or Config.PASSWORD_HASH_METHOD
+        self.workers = Config.PASSWORD_POOL_SIZE if workers is None else workers
+        self.max_pending = max_pending or Config.PASSWORD_QUEUE_MAX
+        self.timeout = timeout or Config.PASSWORD_TIMEOUT
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pid = None
+        self._executor = None
+
+    def _pool(self):
+        """Return this process's executor, creating it after startup or fork"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # multiprocessing is only loaded once a hash is actually needed
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pending = 0
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _discard(self, executor):
+        """Drop a broken executor (a hashing child died) so the next call builds a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._pid = None
+        executor.shutdown(wait=False)
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            # Pool disabled: hash on the calling thread
+            return fn(*args)
+        for attempt in range(2):
+            executor = self._pool()
+            with self._lock:
+                if self._pending >= self.max_pending:
+                    self.rejected += 1
+                    raise PasswordPoolBusy(f"{self._pending} password hashes already pending")
+                self._pending += 1
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._finished(None)
+                self._discard(executor)
+                continue
+            # A hash still counts as pending until it really finishes, even if its caller gave up
+            future.add_done_callback(self._finished)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                self.rejected += 1
+                raise PasswordPoolBusy(f"password hash took longer than {self.timeout}s")
+            except BrokenProcessPool:
+                self._discard(executor)
+        raise PasswordPoolBusy("password hashing processes keep failing")
+
+    def verify(self, password_hash, password):
+        """Check a password; returns (valid, rehashed value to store or None)"""
+        return self._run(_verify, password_hash, password, self.method)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'rejected': self.rejected,
+            }
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,326 @@
+"""
+Asynchronous payment intake for Max Electric Payment Demo
+
+With PAYMENT_INTAKE_MODE=async, /payment-processor validates a Pay callback,
+appends it to a local SQLite spool (committed with a full fsync) and answers
+at once, so a stalled ledger write never becomes dead air on the caller's
+line. As with payments.PaymentWriter, one spooler thread per process
+inserts everything waiting in a single fsynced transaction. Background
+threads in every portal process then claim spooled payments and apply
+them through payments.apply_payment().
+
+The spool is also the queue shared by every process: a payment is only
+claimed once every earlier payment for the same account has finished, so
+payments apply in arrival order per account. A claim is a lease; payments
+whose process died mid-apply are claimed again once it expires (or at
+startup, by recover()), and replaying them is safe because the ledger is
+keyed on transaction_id. Callbacks without a transaction_id are given one.
+
+Each payment's outcome can be polled by transaction_id (see status()).
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from config.production import Config
+from db import ConnectionPool
+from metrics import registry
+from payments import APPLIED, DUPLICATE, apply_payment
+
+# Spool states are 'queued' and 'applying', then a payments outcome or FAILED
+FAILED = 'failed'
+
+SPOOL_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS payment_spool (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id TEXT UNIQUE NOT NULL,
+        account_number TEXT NOT NULL,
+        amount REAL NOT NULL,
+        method TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL,
+        claimed_by INTEGER,
+        old_balance REAL,
+        new_balance REAL,
+        error TEXT,
+        received_at REAL NOT NULL,
+        completed_at REAL
+    )
+'''
+
+SPOOL_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS payment_spool_pending ON payment_spool (status, id)',
+    'CREATE INDEX IF NOT EXISTS payment_spool_account ON payment_spool (account_number, id)',
+)
+
+# Oldest claimable payment: due, and nothing earlier for its account is unfinished
+CLAIM_NEXT = '''
+    SELECT id, transaction_id, account_number, amount, method, attempts, received_at
+    FROM payment_spool AS spooled
+    WHERE status = 'queued' AND available_at <= ?
+      AND NOT EXISTS (
+          SELECT 1 FROM payment_spool AS earlier
+          WHERE earlier.account_number = spooled.account_number
+            AND earlier.id < spooled.id
+            AND earlier.status IN ('queued', 'applying')
+      )
+    ORDER BY id
+    LIMIT 1
+'''
+
+STATUS_FIELDS = ('transaction_id', 'account_number', 'amount', 'method', 'status', 'attempts',
+                 'old_balance', 'new_balance', 'error', 'received_at', 'completed_at')
+
+
+def default_spool_path():
+    """payment_spool.db next to the customer database"""
+    if Config.DATABASE_PATH == ':memory:':
+        return ':memory:'
+    return os.path.join(os.path.dirname(Config.DATABASE_PATH), 'payment_spool.db')
+
+
+class SpoolPool(ConnectionPool):
+    """Connections to the spool; an acknowledged payment must survive power loss"""
+
+    def connect(self):
+        conn = super().connect()
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+
+class PaymentIntake:
+    """Durable spool plus the worker threads that drain it"""
+
+    def __init__(self, path=None, workers=None, lease=None, poll_interval=None):
+        self.path = path or Config.PAYMENT_SPOOL_PATH or default_spool_path()
+        self.workers = workers or Config.PAYMENT_INTAKE_WORKERS
+        self.lease = lease or Config.PAYMENT_INTAKE_LEASE
+        self.poll_interval = poll_interval or Config.PAYMENT_INTAKE_POLL_INTERVAL
+        self.pool = SpoolPool(self.path, size=self.workers + 4)
+        self._lock = threading.Lock()
+        # Spool writers in this process queue here rather than in SQLite's sleeping busy handler
+        self._write_lock = threading.Lock()
+        self._arrivals = None  # (future, row) for the spooler thread to insert
+        self._pid = None
+        self._wakeup = None
+        self._next_sweep = 0
+        self._initialized = False
+
+    @contextmanager
+    def _write(self, durable=True):
+        """IMMEDIATE transaction on the spool, one writer thread at a time
+
+        Workers' lease and outcome updates pass durable=False and skip the fsync:
+        losing one to a power cut only replays the payment, which the ledger ignores.
+        """
+        with self._write_lock, self.pool.connection() as conn:
+            if not durable:
+                conn.execute("PRAGMA synchronous=NORMAL")
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+            finally:
+                if not durable:
+                    conn.execute("PRAGMA synchronous=FULL")
+
+    def init_spool(self):
+        """Create the spool tables if needed"""
+        with self.pool.transaction() as conn:
+            conn.execute(SPOOL_SCHEMA)
+            for statement in SPOOL_INDEXES:
+                conn.execute(statement)
+        self._initialized = True
+
+    def recover(self):
+        """Requeue payments left mid-apply by a crash; call before any worker starts"""
+        self.init_spool()
+        self.prune()
+        with self._write() as conn:
+            return conn.execute('''
+                UPDATE payment_spool SET status = 'queued', claimed_by = NULL, available_at = ?
+                WHERE status = 'applying'
+            ''', (time.time(),)).rowcount
+
+    def prune(self):
+        """Forget finished payments older than PAYMENT_SPOOL_RETENTION"""
+        cutoff = time.time() - Config.PAYMENT_SPOOL_RETENTION
+        with self._write() as conn:
+            return conn.execute('''
+                DELETE FROM payment_spool WHERE status NOT IN ('queued', 'applying') AND completed_at < ?
+            ''', (cutoff,)).rowcount
+
+    def pending(self):
+        """Number of spooled payments not yet applied"""
+        if not self._initialized:
+            self.init_spool()
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM payment_spool WHERE status IN ('queued', 'applying')").fetchone()[0]
+
+    def ensure_started(self):
+        """Start this process's worker threads (once, and again after a fork)"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.init_spool()
+                    self._wakeup = queue.Queue()
+                    self._arrivals = queue.Queue()
+                    threading.Thread(target=self._spool, name='payment-spooler', daemon=True).start()
+                    for index in range(self.workers):
+                        threading.Thread(target=self._run, name=f'payment-intake-{index}', daemon=True).start()
+                    self._pid = os.getpid()
+
+    def accept(self, account_number, amount, transaction_id=None, method=None):
+        """Durably spool a payment; returns its status record (the existing one for a retry)
+
+        Raises concurrent.futures.TimeoutError if the spooler has not committed it
+        within PAYMENT_WRITE_TIMEOUT seconds; it may still be spooled later.
+        """
+        self.ensure_started()
+        transaction_id = transaction_id or str(uuid.uuid4())
+        now = time.time()
+        future = Future()
+        self._arrivals.put((future, (transaction_id, account_number, amount, method, now, now)))
+        if future.result(timeout=Config.PAYMENT_WRITE_TIMEOUT):
+            registry.inc('portal_payment_intake_total', (('outcome', 'spooled'),))
+            self._wakeup.put_nowait(None)
+        else:
+            registry.inc('portal_payment_intake_total', (('outcome', 'retried'),))
+        return self.status(transaction_id)
+
+    def _spool(self):
+        """Insert accepted payments, everything waiting in one fsynced transaction"""
+        while True:
+            batch = [self._arrivals.get()]
+            while len(batch) < Config.PAYMENT_BATCH_MAX:
+                try:
+                    batch.append(self._arrivals.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._write() as conn:
+                    inserted = [conn.execute('''
+                        INSERT INTO payment_spool (transaction_id, account_number, amount, method, available_at, received_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (transaction_id) DO NOTHING
+                    ''', row).rowcount for future, row in batch]
+            except Exception as e:
+                for future, row in batch:
+                    future.set_exception(e)
+                continue
+            for (future, row), count in zip(batch, inserted):
+                future.set_result(count)
+
+    def status(self, transaction_id):
+        """The spool record for a transaction_id, or None"""
+        if not self._initialized:
+            self.init_spool()
+        with self.pool.connection() as conn:
+            row = conn.execute(f'''
+                SELECT {', '.join(STATUS_FIELDS)} FROM payment_spool WHERE transaction_id = ?
+            ''', (transaction_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _claim(self):
+        """Lease the next payment that may be applied, or None"""
+        while True:
+            now = time.time()
+            # Finding a candidate only reads, so idle polls never take the spool's write lock
+            with self.pool.connection() as conn:
+                row = conn.execute(CLAIM_NEXT, (now,)).fetchone()
+            if row is None:
+                return None
+            with self._write(durable=False) as conn:
+                leased = conn.execute('''
+                    UPDATE payment_spool
+                    SET status = 'applying', claimed_by = ?, attempts = attempts + 1, available_at = ?
+                    WHERE id = ? AND status = 'queued'
+                ''', (os.getpid(), now + self.lease, row['id'])).rowcount
+            if leased:
+                return row
+            # Another worker leased it first; look again
+
+    def _requeue_expired(self):
+        """Retake the leases of workers that died mid-apply, at most once per sweep interval"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + Config.PAYMENT_INTAKE_SWEEP_INTERVAL
+        with self._write(durable=False) as conn:
+            conn.execute('''
+                UPDATE payment_spool SET status = 'queued', claimed_by = NULL
+                WHERE status = 'applying' AND available_at <= ?
+            ''', (time.time(),))
+
+    def _apply(self, row):
+        """Apply one claimed payment and record its outcome in the spool"""
+        try:
+            result = apply_payment(row['account_number'], row['amount'], row['transaction_id'], row['method'])
+        except Exception as e:
+            if row['attempts'] + 1 >= Config.PAYMENT_INTAKE_MAX_ATTEMPTS:
+                self._finish(row, FAILED, error=str(e))
+            else:
+                self._retry(row, str(e))
+            return
+        status = result.status
+        if status == DUPLICATE and row['attempts'] > 0:
+            # A replay of an attempt that committed before the crash
+            status = APPLIED
+        self._finish(row, status, result.old_balance, result.new_balance)
+
+    def _finish(self, row, status, old_balance=None, new_balance=None, error=None):
+        now = time.time()
+        with self._write(durable=False) as conn:
+            conn.execute('''
+                UPDATE payment_spool
+                SET status = ?, old_balance = ?, new_balance = ?, error = ?, completed_at = ?, claimed_by = NULL
+                WHERE id = ?
+            ''', (status, old_balance, new_balance, error, now, row['id']))
+        registry.inc('portal_payment_intake_total', (('outcome', status),))
+        if status != FAILED:
+            registry.observe('portal_payment_intake_delay_seconds', now - row['received_at'])
+
+    def _retry(self, row, error):
+        """Put a failed attempt back in the queue with exponential backoff"""
+        delay = min(Config.PAYMENT_INTAKE_RETRY_MAX, Config.PAYMENT_INTAKE_RETRY_BASE * 2 ** row['attempts'])
+        with self._write(durable=False) as conn:
+            conn.execute('''
+                UPDATE payment_spool SET status = 'queued', claimed_by = NULL, error = ?, available_at = ?
+                WHERE id = ?
+            ''', (error, time.time() + delay, row['id']))
+        registry.inc('portal_payment_intake_total', (('outcome', 'retry'),))
+
+    def _run(self):
+        while True:
+            try:
+                self._requeue_expired()
+                row = self._claim()
+            except sqlite3.Error:
+                row = None
+            if row is None:
+                # Nothing due: sleep until a local payment arrives or the next poll
+                try:
+                    self._wakeup.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    pass
+                continue
+            try:
+                self._apply(row)
+            except sqlite3.Error:
+                # The spool itself failed; the lease expires and the payment is retried
+                pass
+
+
+intake = PaymentIntake()
@@ -0,0 +1,243 @@
+"""
+Payment ledger for Max Electric Payment Demo
+
+Every payment is appended to the `payments` ledger and customer.balance is
+kept as a materialized projection of it (opening_balance minus the sum of
+ledger amounts). Writes go through one PaymentWriter thread per shard that
+group-commits every payment arriving within a short window into one
+IMMEDIATE transaction, so many concurrent Pay callbacks share one fsync and
+payments on different shards commit in parallel.
+
+Each entry is keyed on the Pay verb's transaction_id, so a retried callback
+returns the original result without writing again. The key is checked on
+the account's shard, which is where a retry for the same account lands.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import balance_events
+import customers
+from config.production import Config
+from db import shards
+
+# Payment outcomes
+APPLIED = 'applied'
+DUPLICATE = 'duplicate'
+NOT_FOUND = 'not_found'
+
+PaymentResult = namedtuple('PaymentResult', ['status', 'account_number', 'amount', 'old_balance', 'new_balance'])
+
+PAYMENTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id TEXT UNIQUE,
+        account_number TEXT NOT NULL,
+        amount REAL NOT NULL,
+        method TEXT,
+        old_balance REAL NOT NULL,
+        new_balance REAL NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# The ledger is append-only: corrections are new entries, never edits
+LEDGER_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS payments_no_update BEFORE UPDATE ON payments
+    BEGIN SELECT RAISE(ABORT, 'payments ledger is append-only'); END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS payments_no_delete BEFORE DELETE ON payments
+    BEGIN SELECT RAISE(ABORT, 'payments ledger is append-only'); END
+    ''',
+    'CREATE INDEX IF NOT EXISTS payments_account ON payments (account_number, id)',
+)
+
+
+def init_ledger(conn):
+    """Create or migrate the ledger tables on an open transaction"""
+    conn.execute(PAYMENTS_SCHEMA)
+
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(payments)").fetchall()]
+    if 'method' not in columns:
+        conn.execute("ALTER TABLE payments ADD COLUMN method TEXT")
+
+    for statement in LEDGER_TRIGGERS:
+        conn.execute(statement)
+
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(customer)").fetchall()]
+    if 'opening_balance' not in columns:
+        conn.execute("ALTER TABLE customer ADD COLUMN opening_balance REAL")
+
+    # Back-fill opening balances so balance == opening_balance - SUM(ledger)
+    conn.execute('''
+        UPDATE customer SET opening_balance = balance + COALESCE(
+            (SELECT SUM(amount) FROM payments WHERE payments.account_number = customer.account_number), 0)
+        WHERE opening_balance IS NULL
+    ''')
+
+
+def parse_amount(value):
+    """Parse a charge amount, returning None unless it is a positive number"""
+    try:
+        amount = round(float(value), 2)
+    except (TypeError, ValueError):
+        return None
+    if amount != amount or amount <= 0 or amount == float('inf'):
+        return None
+    return amount
+
+
+def _find_transaction(conn, transaction_id):
+    """Return the recorded result for a transaction_id, if any"""
+    row = conn.execute('''
+        SELECT account_number, amount, old_balance, new_balance
+        FROM payments WHERE transaction_id = ?
+    ''', (transaction_id,)).fetchone()
+    if row is None:
+        return None
+    return PaymentResult(DUPLICATE, row['account_number'], row['amount'], row['old_balance'], row['new_balance'])
+
+
+def _append(conn, account_number, amount, transaction_id, method):
+    """Debit the projection and append the ledger entry inside the current transaction"""
+    if transaction_id:
+        duplicate = _find_transaction(conn, transaction_id)
+        if duplicate:
+            return duplicate
+
+    # A plain SELECT rather than UPDATE ... RETURNING, which needs SQLite 3.35 (bullseye ships 3.34);
+    # the caller's IMMEDIATE transaction already holds the write lock, so the balance cannot move
+    row = conn.execute(
+        "SELECT balance FROM customer WHERE account_number = ?", (account_number,)).fetchone()
+
+    if row is None or amount <= 0:
+        return PaymentResult(NOT_FOUND, account_number, amount, None, None)
+
+    old_balance = row['balance']
+    new_balance = old_balance - amount
+    conn.execute('''
+        UPDATE customer SET balance = ?, version = version + 1 WHERE account_number = ?
+    ''', (new_balance, account_number))
+    conn.execute('''
+        INSERT INTO payments (transaction_id, account_number, amount, method, old_balance, new_balance)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (transaction_id, account_number, amount, method, old_balance, new_balance))
+
+    return PaymentResult(APPLIED, account_number, amount, old_balance, new_balance)
+
+
+class PaymentWriter:
+    """Single writer thread that group-commits queued payments to one shard"""
+
+    def __init__(self, pool, name='payment-writer', window_ms=None, max_batch=None):
+        self.pool = pool
+        self.name = name
+        self.window = (Config.PAYMENT_COMMIT_WINDOW_MS if window_ms is None else window_ms) / 1000.0
+        self.max_batch = max_batch or Config.PAYMENT_BATCH_MAX
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _start(self):
+        """Start the writer thread for this process, keeping anything already queued"""
+        if self._pid != os.getpid() or self._queue is None:
+            self._queue = queue.Queue()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, args=(self._queue,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def submit(self, account_number, amount, transaction_id=None, method=None):
+        """Queue a payment and return a Future for its PaymentResult"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != os.getpid() or not self._thread.is_alive():
+                    self._start()
+        future = Future()
+        self._queue.put((future, account_number, amount, transaction_id, method))
+        return future
+
+    def _collect(self, work):
+        """Gather everything that arrives within the commit window"""
+        batch = [work.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(work.get(timeout=remaining) if remaining > 0 else work.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _connect(self):
+        conn = self.pool.connect()
+        # Payments are money: pay for a full fsync, once per batch
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _run(self, work):
+        conn = None
+        while True:
+            batch = self._collect(work)
+            try:
+                if conn is None:
+                    conn = self._connect()
+                self._commit(conn, batch)
+            except Exception as e:
+                for future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                # Start the next batch on a fresh connection rather than trust this one
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+                    conn = None
+
+    def _commit(self, conn, batch):
+        """Apply a batch of payments in one transaction"""
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        for index, (future, account_number, amount, transaction_id, method) in enumerate(batch):
+            conn.execute(f"SAVEPOINT payment_{index}")
+            try:
+                results.append((future, _append(conn, account_number, amount, transaction_id, method)))
+                conn.execute(f"RELEASE payment_{index}")
+            except sqlite3.Error as e:
+                # Only this payment fails; the rest of the batch still commits
+                conn.execute(f"ROLLBACK TO payment_{index}")
+                conn.execute(f"RELEASE payment_{index}")
+                future.set_exception(e)
+        conn.commit()
+        for future, result in results:
+            if result.status == APPLIED:
+                customers.invalidate(result.account_number)
+            future.set_result(result)
+        balance_events.broker.notify()
+
+
+writers = [PaymentWriter(pool, name=f'payment-writer-{index}') for index, pool in enumerate(shards)]
+
+
+def apply_payment(account_number, amount, transaction_id=None, method=None, timeout=None):
+    """Debit `amount` from an account exactly once per transaction_id
+
+    Raises concurrent.futures.TimeoutError if the writer has not committed it
+    within `timeout` (PAYMENT_WRITE_TIMEOUT) seconds; it may still commit later.
+    """
+    if transaction_id:
+        # Fast path for retries: no write lock needed to spot a duplicate
+        with shards.connection(account_number) as conn:
+            duplicate = _find_transaction(conn, transaction_id)
+        if duplicate:
+            return duplicate
+
+    future = writers[shards.index(account_number)].submit(account_number, amount, transaction_id, method)
+    return future.result(timeout=Config.PAYMENT_WRITE_TIMEOUT if timeout is None else timeout)
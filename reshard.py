@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Offline resharding tool for Max Electric Payment Demo
+
+Copies every customer and ledger entry from the current SHARD_COUNT layout
+into a new layout of --to shards, routing each account (with its ledger) to
+the shard db.shard_index() assigns it. The new files are named after
+--output (customer.db -> customer.0-of-4.db, ...; a single shard is --output
+itself), which defaults to DATABASE_PATH and must not name any source file.
+The old files are left untouched for rollback, and totals are checked
+before anything is reported as done. Stop the portal first, then restart it
+with the new SHARD_COUNT (and DATABASE_PATH, if --output differs).
+
+Customer ids are carried over. They are only unique within a shard, so
+merging shards can fail on a duplicate id; --renumber-ids then lets the new
+shards assign fresh ids instead (existing sessions keep working, they only
+record that the user logged in).
+
+Usage: python3 reshard.py --to 4 [--from 1] [--database customer.db] [--output customer.db]
+                          [--renumber-ids] [--batch 10000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+CUSTOMER_COLUMNS = ('id', 'account_number', 'username', 'password_hash', 'pin', 'first_name', 'last_name',
+                    'phone', 'address', 'balance', 'opening_balance', 'version')
+# Ledger ids are per shard; entries keep their order within each account
+PAYMENT_COLUMNS = ('transaction_id', 'account_number', 'amount', 'method', 'old_balance', 'new_balance',
+                   'created_at')
+
+
+def _insert(table, columns):
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def totals(storage):
+    """(customers, sum of balances, ledger entries) across every shard"""
+    customers = balance = payments = 0
+    for pool in storage:
+        with pool.connection() as conn:
+            count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(balance), 0) FROM customer').fetchone()
+            customers += count
+            balance += total
+            payments += conn.execute('SELECT COUNT(*) FROM payments').fetchone()[0]
+    return customers, round(balance, 2), payments
+
+
+def copy_table(source, target, target_connections, table, columns, batch_size):
+    """Copy one table from every source shard to its rows' target shards"""
+    select = f"SELECT {', '.join(columns)} FROM {table} ORDER BY id"
+    insert = _insert(table, columns)
+    account = columns.index('account_number')
+    copied = 0
+    for pool in source:
+        conn = pool.connect()
+        try:
+            cursor = conn.execute(select)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                by_shard = {}
+                for row in rows:
+                    by_shard.setdefault(target.index(row[account]), []).append(tuple(row))
+                for index, shard_rows in by_shard.items():
+                    target_connections[index].executemany(insert, shard_rows)
+                copied += len(rows)
+        finally:
+            conn.close()
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--to', type=int, required=True, help='new number of shards')
+    parser.add_argument('--from', dest='source', type=int, help='current number of shards (defaults to SHARD_COUNT)')
+    parser.add_argument('--database', help='database file (defaults to DATABASE_PATH)')
+    parser.add_argument('--output', help='database file for the new layout (defaults to DATABASE_PATH)')
+    parser.add_argument('--renumber-ids', action='store_true', help='let the new shards assign customer ids')
+    parser.add_argument('--batch', type=int, default=10000, help='rows per executemany() call')
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DATABASE_PATH'] = args.database
+
+    # Imported here so --database takes effect before the shards are opened
+    from config.production import Config
+    from db import ShardSet, init_schema, shard_path
+
+    source = ShardSet(Config.DATABASE_PATH, args.source or Config.SHARD_COUNT)
+    output = args.output or Config.DATABASE_PATH
+    if args.to < 1 or (args.to == source.count and output == Config.DATABASE_PATH):
+        sys.exit(f"--to must be a positive shard count other than the current {source.count}")
+    missing = [pool.database for pool in source if not os.path.exists(pool.database)]
+    if missing:
+        sys.exit(f"source shard(s) not found: {', '.join(missing)}")
+    paths = [shard_path(output, index, args.to) for index in range(args.to)]
+    sources = {os.path.realpath(pool.database) for pool in source}
+    if any(os.path.realpath(path) in sources for path in paths):
+        sys.exit("the new layout would overwrite the source; pass --output with another file")
+    existing = [path for path in paths if os.path.exists(path)]
+    if existing:
+        sys.exit(f"refusing to overwrite existing file(s): {', '.join(existing)}")
+
+    target = ShardSet(output, args.to)
+    for pool in target:
+        with pool.transaction() as conn:
+            init_schema(conn)
+    target.close()
+    customer_columns = CUSTOMER_COLUMNS[1:] if args.renumber_ids else CUSTOMER_COLUMNS
+
+    start = time.perf_counter()
+    target_connections = []
+    for pool in target:
+        conn = pool.connect()
+        # The copy is one transaction per shard and can simply be rerun from scratch
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('BEGIN')
+        target_connections.append(conn)
+    try:
+        customers = copy_table(source, target, target_connections, 'customer', customer_columns, args.batch)
+        payments = copy_table(source, target, target_connections, 'payments', PAYMENT_COLUMNS, args.batch)
+        for conn in target_connections:
+            conn.commit()
+    except BaseException as e:
+        for conn in target_connections:
+            conn.rollback()
+            conn.close()
+        for pool in target:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(pool.database + suffix):
+                    os.remove(pool.database + suffix)
+        if isinstance(e, sqlite3.IntegrityError) and 'customer.id' in str(e) and not args.renumber_ids:
+            sys.exit("customer ids collide across the merged shards; rerun with --renumber-ids")
+        raise
+    for conn in target_connections:
+        conn.close()
+    elapsed = time.perf_counter() - start
+
+    before, after = totals(source), totals(target)
+    if before != after:
+        sys.exit(f"totals differ after copy (customers, balance, payments): {before} -> {after}")
+
+    print(f"Copied {customers} customers and {payments} payments from {source.count} to {target.count} "
+          f"shard(s) in {elapsed:.1f}s")
+    for pool in target:
+        print(f"  {pool.database}")
+    restart = f"SHARD_COUNT={target.count}" + (f" DATABASE_PATH={output}" if output != Config.DATABASE_PATH else '')
+    print(f"Set {restart} and restart the portal; the old files were left in place.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Synthetic customer dataset generator for Max Electric Payment Demo
+
+Bulk-loads N realistic customers into the portal database so routes can be
+exercised at production-like sizes. Every generated customer shares one
+precomputed password hash ("signalwire_rocks") and rows are routed to their
+account's shard and inserted with executemany() in large batches, inside a
+single transaction per shard.
+
+Usage: python3 seed.py --customers 1000000 [--database customer.db] [--batch 20000]
+"""
+import argparse
+import os
+import random
+import time
+from contextlib import ExitStack
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+    'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Betty', 'Mark', 'Sandra', 'Steven', 'Ashley',
+    'Andrew', 'Emily', 'Joshua', 'Michelle', 'Kevin', 'Amanda', 'Brian', 'Melissa', 'Carlos', 'Maria',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+]
+STREETS = [
+    'Main Street', 'Oak Avenue', 'Pine Lane', 'Maple Drive', 'Cedar Court', 'Elm Street', 'Birch Boulevard',
+    'Spruce Circle', 'Willow Way', 'Aspen Road', 'Cherry Street', 'Grove Circle', 'Lake Shore Drive', 'Hill Road',
+]
+
+# Generated accounts start well above the hand-written sample accounts
+FIRST_ACCOUNT_NUMBER = 100000000
+
+INSERT_CUSTOMER = '''
+    INSERT INTO customer (account_number, username, password_hash, pin, first_name, last_name,
+                          phone, address, balance, opening_balance)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def generate_customers(count, password_hash, start=FIRST_ACCOUNT_NUMBER, seed=0):
+    """Yield customer rows for INSERT_CUSTOMER"""
+    rng = random.Random(seed)
+    for offset in range(count):
+        account_number = start + offset
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        # About a fifth of customers are paid up
+        balance = 0.0 if rng.random() < 0.2 else round(rng.uniform(5, 1500), 2)
+        yield (
+            str(account_number),
+            f"{first_name.lower()}{last_name.lower()}{account_number}",
+            password_hash,
+            f"{rng.randrange(10000):04d}",
+            first_name,
+            last_name,
+            f"555{rng.randrange(10000000):07d}",
+            f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+            balance,
+            balance,
+        )
+
+
+def bulk_load(storage, count, password_hash, batch_size=20000, start=None):
+    """Insert `count` generated customers after the highest existing generated account"""
+    with ExitStack() as stack:
+        connections = []
+        for pool in storage:
+            conn = pool.connect()
+            stack.callback(conn.close)
+            # Bulk load: trade crash safety for speed, each shard's load is one transaction anyway
+            conn.execute('PRAGMA synchronous=OFF')
+            connections.append(conn)
+
+        if start is None:
+            highest = max((conn.execute(
+                'SELECT MAX(CAST(account_number AS INTEGER)) FROM customer WHERE CAST(account_number AS INTEGER) >= ?',
+                (FIRST_ACCOUNT_NUMBER,)
+            ).fetchone()[0] or 0) for conn in connections)
+            start = (highest + 1) if highest else FIRST_ACCOUNT_NUMBER
+
+        rows = generate_customers(count, password_hash, start=start, seed=start)
+        for conn in connections:
+            conn.execute('BEGIN')
+        try:
+            remaining = count
+            while remaining:
+                by_shard = [[] for _ in connections]
+                for _ in range(min(batch_size, remaining)):
+                    row = next(rows)
+                    by_shard[storage.index(row[0])].append(row)
+                for conn, batch in zip(connections, by_shard):
+                    conn.executemany(INSERT_CUSTOMER, batch)
+                remaining -= sum(len(batch) for batch in by_shard)
+            for conn in connections:
+                conn.commit()
+        except BaseException:
+            for conn in connections:
+                if conn.in_transaction:
+                    conn.rollback()
+            raise
+        for conn in connections:
+            conn.execute('PRAGMA optimize')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--customers', type=int, required=True, help='number of customers to add')
+    parser.add_argument('--database', help='database file (defaults to DATABASE_PATH)')
+    parser.add_argument('--batch', type=int, default=20000, help='rows per executemany() call')
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ['DATABASE_PATH'] = args.database
+
+    # Imported here so --database takes effect before the shards are opened
+    from werkzeug.security import generate_password_hash
+    from app import init_db
+    from config.production import Config
+    from db import shards
+
+    init_db()
+    password_hash = generate_password_hash("signalwire_rocks", method=Config.PASSWORD_HASH_METHOD)
+
+    start = time.perf_counter()
+    bulk_load(shards, args.customers, password_hash, batch_size=args.batch)
+    elapsed = time.perf_counter() - start
+    total = 0
+    for pool in shards:
+        with pool.connection() as conn:
+            total += conn.execute('SELECT COUNT(*) FROM customer').fetchone()[0]
+
+    print(f"Loaded {args.customers} customers in {elapsed:.1f}s ({args.customers / elapsed:,.0f} rows/s); "
+          f"{total} customers in {shards.count} shard(s) of {shards.database}")
+
+
+if __name__ == '__main__':
+    main()
@@ -99,15 +99,23 @@ source ./venv/bin/activate
 log "Installing Python dependencies..."
 pip install --quiet --no-cache-dir -r requirements.txt
 
-# Start Flask app
+# Portal workers and the agent share metrics files, so /metrics also covers agent tool calls
+export METRICS_DIR="${METRICS_DIR:-$(dirname "${DATABASE_PATH:-/app/data/customer.db}")/metrics}"
+
+# The portal signs balance stream tokens that the stream process checks, so they need the same key
+export SECRET_KEY="${SECRET_KEY:-$(openssl rand -hex 32)}"
+BALANCE_STREAM_PORT="${BALANCE_STREAM_PORT:-8081}"
+export BALANCE_STREAM_URL="${BALANCE_STREAM_URL:-http://localhost:${BALANCE_STREAM_PORT}/balance/stream}"
+
+# Start Flask app (gunicorn master initializes the database, then forks the workers)
 log "Starting Flask application..."
-python3 app.py > /tmp/flask.log 2>&1 &
+gunicorn -c gunicorn.conf.py app:app > /tmp/flask.log 2>&1 &
 FLASK_PID=$!
 
 # Wait for Flask to be ready
 log "Waiting for Flask to initialize..."
 for i in {1..30}; do
-    if curl -s localhost:8080 >/dev/null 2>&1; then
+    if curl -sf localhost:8080/readyz >/dev/null 2>&1; then
         break
     fi
     if [[ $i -eq 30 ]]; then
@@ -118,6 +126,11 @@ for i in {1..30}; do
 done
 success "Flask application is running"
 
+# Start the balance stream process (open dashboards' live balance updates)
+log "Starting balance stream service..."
+uvicorn balance_stream:app --host 0.0.0.0 --port "$BALANCE_STREAM_PORT" --log-level warning --timeout-graceful-shutdown 5 > /tmp/balance_stream.log 2>&1 &
+STREAM_PID=$!
+
 # Generate authentication credentials
 log "Generating authentication credentials..."
 AUTH_PASSWORD=$(openssl rand -hex 16)
@@ -195,6 +208,7 @@ echo
 echo "Log files:"
 echo "  - Ngrok: /tmp/ngrok.log"
 echo "  - Flask: /tmp/flask.log"
+echo "  - Balance streams: /tmp/balance_stream.log"
 echo "  - Agent: /tmp/agent.log"
 echo "  - Webhook: /tmp/webhook.log"
 echo "=================================="
@@ -213,6 +227,11 @@ while true; do
         exit 1
     fi
     
+    if ! kill -0 $STREAM_PID 2>/dev/null; then
+        error "Balance stream service died!"
+        exit 1
+    fi
+    
     if ! kill -0 $NGROK_PID 2>/dev/null; then
         error "Ngrok tunnel died!"
         exit 1
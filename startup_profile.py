@@ -0,0 +1,77 @@
+"""
+Startup profiling for the Max Electric portal and agent processes
+
+With STARTUP_PROFILE=1 each process times its startup phases (interpreter
+start, imports, initialization, ...) and, when it is ready to serve, prints
+them to stderr and appends them as one JSON line to STARTUP_PROFILE_FILE.
+For a per-module breakdown of the import phase, run the same process with
+`python3 -X importtime`; benchmarks/bench_startup.py does both.
+
+Deliberately dependency-free so it can be the first import of any process.
+"""
+import json
+import os
+import sys
+import time
+
+ENABLED = os.environ.get('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+PROFILE_FILE = os.environ.get('STARTUP_PROFILE_FILE', 'logs/startup_profile.jsonl')
+
+
+def _process_age():
+    """Seconds since this process started, from /proc (None elsewhere)"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupProfiler:
+    """Records consecutive startup phases for one process"""
+
+    def __init__(self, process, enabled=ENABLED):
+        self.process = process
+        self.enabled = enabled
+        self.phases = []
+        if enabled:
+            # Time spent before the first line of our code ran
+            age = _process_age()
+            if age is not None:
+                self.phases.append(('interpreter', age))
+        self._mark = time.perf_counter()
+
+    def mark(self, phase):
+        """End the current phase, naming it `phase`"""
+        now = time.perf_counter()
+        if self.enabled:
+            self.phases.append((phase, now - self._mark))
+        self._mark = now
+
+    def report(self):
+        """Print the phases and append them to the profile file"""
+        if not self.enabled:
+            return
+        total = sum(seconds for _, seconds in self.phases)
+        lines = [f"startup profile: {self.process} (pid {os.getpid()}) ready in {total * 1000:.1f} ms"]
+        lines += [f"  {phase:<24}{seconds * 1000:>9.1f} ms" for phase, seconds in self.phases]
+        print('\n'.join(lines), file=sys.stderr, flush=True)
+
+        entry = {
+            'process': self.process,
+            'pid': os.getpid(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'total_ms': round(total * 1000, 1),
+            'phases': {phase: round(seconds * 1000, 1) for phase, seconds in self.phases},
+        }
+        try:
+            directory = os.path.dirname(PROFILE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(PROFILE_FILE, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError:
+            pass
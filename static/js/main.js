@@ -195,13 +195,12 @@ function initializePageSpecific() {
 
 // Dashboard specific initialization
 function initializeDashboard() {
-    // Auto-refresh balance every 30 seconds
-    setInterval(() => {
-        const refreshBtn = document.querySelector('button[onclick="refreshBalance()"]');
-        if (refreshBtn && !refreshBtn.disabled) {
-            refreshBalance();
-        }
-    }, 30000);
+    if (window.EventSource && typeof startBalanceStream === 'function') {
+        // Balance updates are pushed by the server as payments land
+        startBalanceStream();
+    } else if (typeof startBalancePolling === 'function') {
+        startBalancePolling();
+    }
     
     // Initialize chart animations
     setTimeout(() => {
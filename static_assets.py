@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Fingerprinted, precompressed static assets for Max Electric Payment Demo
+
+build() copies every file under static/ (except video, which /video serves
+with range support) to STATIC_BUILD_DIR under a content-hashed name such as
+css/style.3f2a9c1e0b4d.css, writes .gz and, when brotli is installed, .br
+siblings for text assets, and records logical -> built names in
+manifest.json. /static/ URLs inside stylesheets are rewritten to the built
+names as well.
+
+Templates link assets with {{ asset_url('css/style.css') }}. /assets/ serves
+the smallest precompressed variant the client accepts, with a year-long
+immutable cache lifetime: any change to a file produces a new name, so
+browsers never need to revalidate. Without a manifest (a checkout that was
+never built) asset_url falls back to the plain /static/ URL.
+
+    python3 static_assets.py    # build; the gunicorn master also builds on start
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+import time
+
+from flask import abort, request, send_file, url_for
+
+from config.production import Config
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants are still built and served
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+MANIFEST_NAME = 'manifest.json'
+ASSET_URL_PREFIX = '/assets/'
+
+# Served by the /video route with Range support instead
+SKIP_DIRECTORIES = {'video'}
+# Formats that are already compressed gain nothing from gzip/brotli
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.map', '.ico'}
+# Client encoding name -> file suffix, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+STATIC_URL_PATTERN = re.compile(r"""url\((['"]?)/static/([^'")]+)\1\)""")
+
+
+def fingerprinted_name(filename, data):
+    """css/style.css -> css/style.<hash>.css"""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _write(path, data):
+    """Write a built file atomically; content-hashed names never need rewriting"""
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build(source=None, output=None):
+    """Fingerprint and precompress static assets; returns the manifest"""
+    source = source or STATIC_DIR
+    output = output or Config.STATIC_BUILD_DIR
+
+    filenames = []
+    for directory, subdirectories, files in os.walk(source):
+        subdirectories[:] = sorted(d for d in subdirectories
+                                   if os.path.relpath(os.path.join(directory, d), source) not in SKIP_DIRECTORIES)
+        filenames.extend(os.path.relpath(os.path.join(directory, name), source).replace(os.sep, '/')
+                         for name in sorted(files))
+    # Stylesheets last, so the files they reference already have built names
+    filenames.sort(key=lambda name: name.endswith('.css'))
+
+    manifest = {}
+    for filename in filenames:
+        with open(os.path.join(source, filename), 'rb') as f:
+            data = f.read()
+        if filename.endswith('.css'):
+            data = STATIC_URL_PATTERN.sub(
+                lambda m: f"url({m.group(1)}{ASSET_URL_PREFIX}{manifest[m.group(2)]['file']}{m.group(1)})"
+                if m.group(2) in manifest else m.group(0),
+                data.decode('utf-8'),
+            ).encode('utf-8')
+
+        built = fingerprinted_name(filename, data)
+        _write(os.path.join(output, built), data)
+        entry = {'file': built, 'size': len(data), 'encodings': {}}
+
+        if os.path.splitext(filename)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['br'] = brotli.compress(data, quality=11)
+            for encoding, suffix in ENCODINGS:
+                compressed = variants.get(encoding)
+                if compressed is not None and len(compressed) < len(data):
+                    _write(os.path.join(output, built + suffix), compressed)
+                    entry['encodings'][encoding] = len(compressed)
+        manifest[filename] = entry
+
+    manifest_path = os.path.join(output, MANIFEST_NAME)
+    os.makedirs(output, exist_ok=True)
+    tmp = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, manifest_path)
+    return manifest
+
+
+class AssetManifest:
+    """The current build's manifest, reloaded when a new build replaces it"""
+
+    def __init__(self, directory=None, check_interval=None):
+        self.directory = directory or Config.STATIC_BUILD_DIR
+        self.check_interval = (Config.STATIC_MANIFEST_CHECK_INTERVAL
+                               if check_interval is None else check_interval)
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._mtime_ns = None
+        self._urls = {}    # logical name -> built name
+        self._assets = {}  # built name -> (mimetype, {encoding: suffix})
+
+    def _refresh(self):
+        """Reload the manifest if it changed (caller holds the lock)"""
+        self._checked_at = time.monotonic()
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            if mtime_ns == self._mtime_ns:
+                return
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            self._mtime_ns = None
+            self._urls, self._assets = {}, {}
+            return
+        self._mtime_ns = mtime_ns
+        self._urls = {name: entry['file'] for name, entry in manifest.items()}
+        self._assets = {
+            entry['file']: (
+                mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                {encoding: suffix for encoding, suffix in ENCODINGS if encoding in entry['encodings']},
+            )
+            for name, entry in manifest.items()
+        }
+
+    def _current(self):
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+                    self._refresh()
+        return self._urls, self._assets
+
+    def built_name(self, filename):
+        return self._current()[0].get(filename)
+
+    def asset(self, built_name):
+        return self._current()[1].get(built_name)
+
+
+manifest = AssetManifest()
+
+
+def asset_url(filename):
+    """URL of a static asset's fingerprinted build, or its /static/ URL if unbuilt"""
+    built = manifest.built_name(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('serve_asset', filename=built)
+
+
+def send_asset(filename):
+    """Send a built asset, precompressed to suit the request's Accept-Encoding"""
+    asset = manifest.asset(filename)
+    if asset is None:
+        abort(404)
+    mimetype, variants = asset
+
+    path, encoding = os.path.join(manifest.directory, filename), None
+    for candidate, suffix in variants.items():
+        if request.accept_encodings.quality(candidate) > 0:
+            path, encoding = path + suffix, candidate
+            break
+
+    response = send_file(path, mimetype=mimetype, max_age=Config.STATIC_MAX_AGE, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if variants:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+if __name__ == '__main__':
+    built = build()
+    for name, entry in sorted(built.items()):
+        sizes = ', '.join(f"{encoding} {size}" for encoding, size in sorted(entry['encodings'].items()))
+        print(f"{name} -> {entry['file']} ({entry['size']} bytes{'; ' + sizes if sizes else ''})")
+    print(f"wrote {len(built)} assets to {Config.STATIC_BUILD_DIR}")
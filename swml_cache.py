@@ -0,0 +1,180 @@
+"""
+Cached SWML rendering for the Max Electric agent
+
+Rendering the agent's SWML rebuilds the POM prompt, the SWAIG function
+list, languages and params and serializes all of it on every inbound call,
+although only a few fields differ between calls: the per-call security
+token in each SWAIG web_hook_url, and the base URL those hooks point at
+(which follows the request's proxy headers).
+
+SwmlCacheMixin renders the document once per base URL with placeholder
+tokens and keeps it as static string chunks; a call then only mints its
+tokens and joins the chunks. Each template is checked against a normal
+render when it is built and is not used if they differ (a changed SDK).
+Requests with per-request modifications (dynamic configuration) are always
+rendered normally, and every AgentBase method that changes the agent's
+configuration (prompt_*, set_*, add_*, define_*, ...) drops the templates.
+AGENT_SWML_CACHE=false turns the cache off.
+"""
+import functools
+import inspect
+import logging
+import re
+import threading
+from urllib.parse import quote_plus
+
+from config.production import Config
+
+logger = logging.getLogger(__name__)
+
+# Stands in for token n while a template is rendered; survives URL encoding and JSON unchanged
+PLACEHOLDER = 'swmlcachetoken{}x'
+PLACEHOLDER_PATTERN = re.compile(r'swmlcachetoken(\d+)x')
+TEMPLATE_CALL_ID = 'swml-cache-template'
+CHECK_CALL_ID = 'swml-cache-check'
+
+# AgentBase methods with these prefixes change what the SWML contains
+INVALIDATING_PREFIXES = ('prompt_', 'set_', 'add_', 'define_', 'update_', 'remove_', 'register_', 'enable_')
+
+
+class SwmlTemplate:
+    """A rendered document split around its per-call tokens"""
+
+    def __init__(self, chunks, tools):
+        self.chunks = chunks  # static text; a token goes between each pair
+        self.tools = tools  # the tool each token is minted for, in document order
+
+    def fill(self, tokens):
+        parts = [self.chunks[0]]
+        for token, chunk in zip(tokens, self.chunks[1:]):
+            parts.append(token)
+            parts.append(chunk)
+        return ''.join(parts)
+
+
+class SwmlCache:
+    """Per-base-URL SWML templates for one agent"""
+
+    def __init__(self, agent, max_variants=None):
+        self.agent = agent
+        self.max_variants = max_variants or Config.AGENT_SWML_CACHE_VARIANTS
+        # SDK renders mutate the agent's document, so they (and template builds) never overlap
+        self._lock = threading.RLock()
+        self._rendering = False  # set while an SDK render holds the lock; its own add_verb() etc. don't invalidate
+        self._templates = {}  # swaig base URL -> SwmlTemplate, or None if it failed its check
+        # Template builds patch the session manager's create_tool_token while they render; a cache hit
+        # (which does not take the lock) mints through these, captured before any build
+        self._sessions = agent._session_manager
+        self._create_tool_token = self._sessions.create_tool_token
+        self.hits = 0
+        self.builds = 0
+
+    def invalidate(self):
+        """Forget every template; the next call renders afresh"""
+        with self._lock:
+            if not self._rendering:
+                self._templates.clear()
+
+    def render(self, render, call_id=None, modifications=None):
+        """The SWML for one request, from a template when possible; `render` is the SDK's renderer"""
+        if modifications:
+            return self._render(render, call_id, modifications)
+
+        # Includes basic auth and any proxy base detected for this request
+        key = self.agent._build_webhook_url('swaig', {})
+        template = self._templates.get(key, False)
+        if template is False:
+            with self._lock:
+                template = self._templates.get(key, False)
+                if template is False:
+                    template = self._build(render)
+                    if len(self._templates) >= self.max_variants:
+                        self._templates.clear()
+                    self._templates[key] = template
+        if template is None:
+            return self._render(render, call_id, None)
+
+        if call_id is None:
+            call_id = self._sessions.create_session()
+        self.hits += 1
+        return template.fill([quote_plus(self._create_tool_token(tool, call_id)) for tool in template.tools])
+
+    def _render(self, render, call_id, modifications):
+        """Render through the SDK, one at a time"""
+        with self._lock:
+            self._rendering = True
+            try:
+                return render(call_id, modifications)
+            finally:
+                self._rendering = False
+
+    def _render_with_tokens(self, render, call_id, make_token):
+        """Render normally, with the session manager's tokens replaced (caller holds the lock)"""
+        sessions = self._sessions
+        previous = sessions.__dict__.get('create_tool_token')
+        sessions.create_tool_token = make_token
+        try:
+            return self._render(render, call_id, None)
+        finally:
+            if previous is None:
+                del sessions.create_tool_token
+            else:
+                sessions.create_tool_token = previous
+
+    def _build(self, render):
+        """Render a template for the current base URL and check it (caller holds the lock)"""
+        self.builds += 1
+        minted = []
+
+        def placeholder(tool, call_id):
+            minted.append(tool)
+            return PLACEHOLDER.format(len(minted) - 1)
+
+        parts = PLACEHOLDER_PATTERN.split(self._render_with_tokens(render, TEMPLATE_CALL_ID, placeholder))
+        # Tokens minted but not in the document (e.g. an overridden post-prompt URL) are skipped
+        template = SwmlTemplate(parts[0::2], [minted[int(index)] for index in parts[1::2]])
+
+        # A normal render with predictable tokens must match the filled-in template exactly
+        check_token = lambda tool, call_id: f"check.{tool}.{call_id}"
+        expected = self._render_with_tokens(render, CHECK_CALL_ID, check_token)
+        if template.fill([quote_plus(check_token(tool, CHECK_CALL_ID)) for tool in template.tools]) != expected:
+            logger.warning("SWML template for %s does not match a normal render; rendering every request",
+                           self.agent.name)
+            return None
+        return template
+
+    def stats(self):
+        return {'templates': len(self._templates), 'hits': self.hits, 'builds': self.builds}
+
+
+def _invalidating(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        cache = self.__dict__.get('_swml_cache')
+        if cache is not None:
+            cache.invalidate()
+        return result
+    return wrapper
+
+
+class SwmlCacheMixin:
+    """Mix in before AgentBase to serve SWML from SwmlCache templates"""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in dir(cls):
+            if not name.startswith(INVALIDATING_PREFIXES):
+                continue
+            # Plain methods only: staticmethods, classmethods (the tool decorator) and properties stay as they are
+            attribute = inspect.getattr_static(cls, name)
+            if inspect.isfunction(attribute) and not getattr(attribute, '__wrapped__', None):
+                setattr(cls, name, _invalidating(attribute))
+
+    def _render_swml(self, call_id=None, modifications=None):
+        if not Config.AGENT_SWML_CACHE:
+            return super()._render_swml(call_id, modifications)
+        cache = self.__dict__.get('_swml_cache')
+        if cache is None:
+            cache = self._swml_cache = SwmlCache(self)
+        return cache.render(super()._render_swml, call_id, modifications)
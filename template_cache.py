@@ -0,0 +1,111 @@
+"""
+Template rendering caches for Max Electric Payment Demo
+
+Compiled templates are kept in a Jinja bytecode cache on disk, so new or
+recycled workers load them instead of recompiling. Static regions of a page
+are wrapped in a fragment cache tag and rendered once per key:
+
+    {% cache 'call-widget', signalwire_call_token, signalwire_call_destination %}
+        ...
+    {% endcache %}
+
+Each fragment's key also includes its template's name and modification time,
+so editing a template invalidates its fragments; configuration a fragment
+depends on is passed in as part of the key.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from config.production import Config
+
+
+class FragmentCache:
+    """Bounded LRU of rendered template fragments"""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize or Config.TEMPLATE_FRAGMENT_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._fragments = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def put(self, key, fragment):
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._fragments), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """Adds {% cache key, ... %}...{% endcache %} backed by fragment_cache"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+
+        # Recompiling an edited template bakes in a new mtime, which changes every key
+        try:
+            mtime = os.path.getmtime(parser.filename) if parser.filename else 0
+        except OSError:
+            mtime = 0
+        template = nodes.Const(f"{parser.name}:{mtime}:{lineno}")
+
+        return nodes.CallBlock(
+            self.call_method('_render', [template, nodes.List(key)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, template, key, caller):
+        cache_key = (template,) + tuple(key)
+        fragment = fragment_cache.get(cache_key)
+        if fragment is None:
+            fragment = caller()
+            fragment_cache.put(cache_key, fragment)
+        return fragment
+
+
+def bytecode_cache(directory=None):
+    """Jinja bytecode cache shared by every worker"""
+    directory = directory or Config.TEMPLATE_BYTECODE_CACHE_DIR
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # The cache holds marshalled code that is loaded and run: never trust a directory someone else controls
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise RuntimeError(f"TEMPLATE_BYTECODE_CACHE_DIR {directory} must be owned by this user and writable only by it")
+    return FileSystemBytecodeCache(directory, pattern='max_electric_%s.cache')
+
+
+def precompile(environment):
+    """Load every HTML template so it is compiled (and its bytecode cached) up front"""
+    for name in environment.list_templates(filter_func=lambda name: name.endswith('.html')):
+        environment.get_template(name)
@@ -0,0 +1,203 @@
+"""
+Outbound HTTP calls made by the Max Electric agent's SWAIG tools
+
+Every tool call happens while a caller waits on a silent line, so a call to
+the portal (or any other service a tool needs) goes through a ToolClient:
+
+  - one pooled keep-alive session per process
+  - a latency budget per tool (AGENT_TOOL_BUDGETS): the tool gets an answer
+    or an error within it, however the server behaves
+  - hedging for idempotent reads: if no answer arrives within
+    AGENT_HEDGE_AFTER (or the first attempt fails fast) a second identical
+    request is sent and the first good answer wins
+  - a circuit breaker: after AGENT_BREAKER_FAILURES consecutive failures,
+    calls fail at once with CircuitOpen for AGENT_BREAKER_RESET seconds, so
+    the agent can speak a fallback instead of waiting out every budget; one
+    trial call is then let through to probe recovery
+  - metrics on call outcomes, hedges and budget overruns, shared with the
+    portal's /metrics through METRICS_DIR
+
+requests is only imported when a client sends its first request.
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config.production import Config
+from metrics import COUNTER, GAUGE, HISTOGRAM, exporter, registry
+
+registry.describe('portal_agent_tool_duration_seconds', HISTOGRAM, 'Agent tool outbound call time, by tool')
+registry.describe('portal_agent_tool_calls_total', COUNTER, 'Agent tool outbound calls, by tool and outcome')
+registry.describe('portal_agent_tool_budget_overruns_total', COUNTER, 'Agent tool calls that ran out of latency budget')
+registry.describe('portal_agent_tool_hedges_total', COUNTER, 'Hedged second requests sent by agent tools')
+registry.describe('portal_agent_tool_breaker_open', GAUGE, 'Whether the circuit breaker to a service is open')
+
+
+class ToolCallFailed(Exception):
+    """Raised when a tool's outbound call gets no usable answer"""
+
+
+class BudgetExceeded(ToolCallFailed):
+    """Raised when no answer arrived within the tool's latency budget"""
+
+
+class CircuitOpen(ToolCallFailed):
+    """Raised without calling out while the service's circuit breaker is open"""
+
+
+class _ServerError(Exception):
+    """A 5xx answer: a failure for hedging and the breaker, still returned if nothing better arrives"""
+
+    def __init__(self, response):
+        super().__init__(f"{response.request.method} {response.url} answered {response.status_code}")
+        self.response = response
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed, open for reset_after seconds, then one trial call"""
+
+    def __init__(self, name, failures=None, reset_after=None):
+        self.name = name
+        self.failures = failures or Config.AGENT_BREAKER_FAILURES
+        self.reset_after = reset_after or Config.AGENT_BREAKER_RESET
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._trial or time.monotonic() >= self._opened_at + self.reset_after:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() < self._opened_at + self.reset_after:
+                return False
+            # Half-open: this call is the one trial
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._trial = False
+            if self._opened_at is not None:
+                self._opened_at = None
+                registry.dec('portal_agent_tool_breaker_open', (('service', self.name),))
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._opened_at is not None:
+                # A failed trial keeps it open for another period
+                if self._trial:
+                    self._opened_at = time.monotonic()
+                    self._trial = False
+            elif self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+                registry.inc('portal_agent_tool_breaker_open', (('service', self.name),))
+
+
+class ToolClient:
+    """Budgeted, hedged, circuit-broken HTTP client for one service"""
+
+    def __init__(self, base_url, name=None, budgets=None, hedge_after=None, pool_size=None):
+        self.base_url = base_url.rstrip('/')
+        self.name = name or self.base_url
+        self.budgets = dict(Config.AGENT_TOOL_BUDGETS if budgets is None else budgets)
+        self.hedge_after = Config.AGENT_HEDGE_AFTER if hedge_after is None else hedge_after
+        self.pool_size = pool_size or Config.AGENT_TOOL_POOL_SIZE
+        self.breaker = CircuitBreaker(self.name)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._executor = None
+
+    def budget(self, tool):
+        return self.budgets.get(tool, Config.AGENT_TOOL_BUDGET)
+
+    def _start(self):
+        """Create this process's session and request threads, after startup or fork"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    # Requests run here so the caller can stop waiting when the budget is spent
+                    self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='tool-call')
+                    exporter.ensure_started()
+                    self._pid = os.getpid()
+
+    def _send(self, method, url, deadline, kwargs):
+        remaining = max(deadline - time.monotonic(), 0.001)
+        response = self._session.request(method, url, timeout=(min(remaining, Config.AGENT_TOOL_CONNECT_TIMEOUT),
+                                                                remaining), **kwargs)
+        if response.status_code >= 500:
+            raise _ServerError(response)
+        return response
+
+    def request(self, tool, method, path, idempotent=False, **kwargs):
+        """Send one request for `tool` within its budget; returns the response (5xx only if no attempt did better)"""
+        labels = (('tool', tool),)
+        if not self.breaker.allow():
+            registry.inc('portal_agent_tool_calls_total', labels + (('outcome', 'rejected'),))
+            raise CircuitOpen(f"{self.name} is unavailable (circuit open)")
+
+        self._start()
+        start = time.monotonic()
+        deadline = start + self.budget(tool)
+        attempts = [self._executor.submit(self._send, method, f"{self.base_url}{path}", deadline, kwargs)]
+        pending = set(attempts)
+        error = None
+        while True:
+            remaining = deadline - time.monotonic()
+            hedge = idempotent and len(attempts) == 1
+            done, pending = wait(pending, timeout=max(min(remaining, self.hedge_after) if hedge else remaining, 0),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return self._finish(labels, start, 'ok', future.result())
+                error = future.exception()
+            if time.monotonic() >= deadline:
+                break
+            if hedge and remaining > 0:
+                # Slow or failed fast: send the same read again, first good answer wins
+                registry.inc('portal_agent_tool_hedges_total', labels)
+                attempt = self._executor.submit(self._send, method, f"{self.base_url}{path}", deadline, kwargs)
+                attempts.append(attempt)
+                pending.add(attempt)
+            elif not pending:
+                break
+
+        if error is None or time.monotonic() >= deadline:
+            registry.inc('portal_agent_tool_budget_overruns_total', labels)
+            self._finish(labels, start, 'over_budget')
+            raise BudgetExceeded(f"{tool}: no answer from {self.name} within {self.budget(tool):g}s")
+        if isinstance(error, _ServerError):
+            return self._finish(labels, start, 'server_error', error.response)
+        self._finish(labels, start, 'error')
+        raise ToolCallFailed(f"{tool}: {error}") from error
+
+    def _finish(self, labels, start, outcome, response=None):
+        registry.observe('portal_agent_tool_duration_seconds', time.monotonic() - start, labels)
+        registry.inc('portal_agent_tool_calls_total', labels + (('outcome', outcome),))
+        if outcome == 'ok':
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return response
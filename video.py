@@ -0,0 +1,125 @@
+"""
+Avatar video delivery for Max Electric Payment Demo
+
+VideoIndex keeps an in-memory listing of static/video, including each file's
+size, mtime and content-hash ETag. The directory and each indexed file are
+stat()ed at most once per check interval, and the directory is rescanned
+only when one of them changed (a file added or removed, or overwritten in
+place), so serving a video or the listing does no filesystem work beyond
+opening the file itself.
+
+Files are sent with werkzeug's send_file, which handles Range/If-Range (206)
+requests and hands the open file to the server's wsgi.file_wrapper so that
+servers with sendfile support (e.g. gunicorn) transfer it zero-copy.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import send_file
+
+from config.production import Config
+
+VideoFile = namedtuple('VideoFile', ['filename', 'path', 'size', 'mtime', 'etag'])
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(path):
+    """Short SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+class VideoIndex:
+    """In-memory index of the MP4 files in one directory"""
+
+    def __init__(self, directory, check_interval=None):
+        self.directory = directory
+        self.check_interval = Config.VIDEO_DIR_CHECK_INTERVAL if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._dir_mtime_ns = None
+        self._files = {}
+        self.version = None  # changes whenever the set of files or their contents change
+
+    def _refresh(self):
+        """Re-stat the directory and its files and rescan if anything changed (caller holds the lock)"""
+        self._checked_at = time.monotonic()
+        try:
+            mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            self._dir_mtime_ns = None
+            self._files = {}
+            self.version = None
+            return
+        if mtime_ns == self._dir_mtime_ns and not self._files_changed():
+            return
+
+        files = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.lower().endswith('.mp4') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            previous = self._files.get(entry.name)
+            if previous and previous.size == stat.st_size and previous.mtime == stat.st_mtime:
+                # Unchanged file: keep its hash rather than re-reading it
+                files[entry.name] = previous
+            else:
+                files[entry.name] = VideoFile(entry.name, entry.path, stat.st_size, stat.st_mtime, content_hash(entry.path))
+
+        self._files = files
+        self._dir_mtime_ns = mtime_ns
+        self.version = hashlib.sha256(
+            ''.join(sorted(f"{v.filename}:{v.etag};" for v in files.values())).encode()
+        ).hexdigest()[:16]
+
+    def _files_changed(self):
+        """Whether any indexed file was rewritten in place since it was hashed"""
+        for video in self._files.values():
+            try:
+                stat = os.stat(video.path)
+            except FileNotFoundError:
+                return True
+            if stat.st_size != video.size or stat.st_mtime != video.mtime:
+                return True
+        return False
+
+    def _current(self):
+        with self._lock:
+            if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+                self._refresh()
+            return self._files, self.version
+
+    def get(self, filename):
+        """Indexed entry for a filename, or None"""
+        files, _ = self._current()
+        return files.get(filename)
+
+    def listing(self):
+        """(entries sorted by filename, version), or (None, None) if the directory is missing"""
+        files, version = self._current()
+        if version is None:
+            return None, None
+        return [files[name] for name in sorted(files)], version
+
+
+def send_video(video):
+    """Send an indexed video with range support and long-lived validators"""
+    response = send_file(
+        video.path,
+        mimetype='video/mp4',
+        as_attachment=False,  # Stream the video instead of downloading
+        conditional=True,  # Range / If-Range / If-None-Match handling
+        etag=video.etag,
+        last_modified=video.mtime,
+        max_age=Config.VIDEO_MAX_AGE,
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.cache_control.public = True
+    return response